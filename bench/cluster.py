@@ -0,0 +1,346 @@
+"""
+    Load benchmark for a cluster of nodes running in separate processes.
+
+    Usage:
+        python -m bench.cluster [--nodes 2,4,8,16] [--mode emit|send] [--size BYTES]
+            [--rate PER_SECOND] [--fanout PEERS] [--duration SECONDS] [--router peer|gossip]
+            [--protocol tcp|unix|auto|shm] [--warm-up PEERS] [--output FILE]
+
+    For each cluster size, nodes are started one at a time on 127.0.0.1 and
+    join through the first node. Once the cluster has converged every node
+    sends for the given duration, and the delivered throughput, end-to-end
+    latency and loss are reported, along with join and convergence times
+    and how long each node's first send took.
+    Results are written as JSON.
+"""
+
+# Anyio
+import anyio
+
+# Standard Library Imports
+import argparse
+import functools
+import json
+import multiprocessing
+import platform
+import random
+import socket
+import struct
+import sys
+import time
+
+# Code under test
+from pydevts.pub import Node
+from pydevts.routing import PeerRouter, GossipRouter
+from pydevts.proto import TCPProto, UnixProto, AutoProto, ShmProto
+from pydevts.logger import logger
+
+# Shared with the microbenchmarks
+from bench.micro import _commit
+
+
+ROUTERS = {
+    "peer": PeerRouter,
+    "gossip": GossipRouter,
+}
+
+PROTOCOLS = {
+    "tcp": TCPProto,
+    "unix": UnixProto,
+    "auto": AutoProto,
+    "shm": ShmProto,
+}
+
+# Sender index, sequence number, send time in nanoseconds
+_stamp = struct.Struct("!IQQ")
+
+# The most latencies each node reports, to keep results small
+MAX_SAMPLES = 50000
+
+
+def _free_port() -> int:
+    """Finds a port nothing is listening on
+    """
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(values: list[float], fraction: float) -> float:
+    """Takes a percentile of sorted values
+    """
+
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+################################################
+# Worker
+################################################
+
+async def _node_main(index: int, entry_port: int, config: dict, results: dict[str, multiprocessing.Queue], start: multiprocessing.Event):
+    """Runs one node of the cluster
+
+    Args:
+        index (int): The index of this node.
+        entry_port (int): The port of the node to join through.
+        config (dict): The benchmark configuration.
+        results (dict[str, multiprocessing.Queue]): Where to report progress and results, by kind of report.
+        start (multiprocessing.Event): Set when every node should start sending.
+    """
+
+    router = functools.partial(ROUTERS[config["router"]], warm_up=config["warm_up"])
+    node = Node(host="127.0.0.1", router=router, protocol=PROTOCOLS[config["protocol"]])
+
+    received = 0
+    latencies = []
+
+    @node.on("bench.load")
+    async def _on_load(sender: str, data: bytes):
+        nonlocal received
+
+        sent_by, _, sent_at = _stamp.unpack_from(data)
+        if sent_by == index:
+            return
+
+        received += 1
+        latencies.append((time.time_ns() - sent_at) / 1e9)
+
+    async with anyio.create_task_group() as tg:
+
+        # Join the cluster
+        started = time.perf_counter()
+        await node.connect("127.0.0.1", entry_port)
+        await tg.start(node.run)
+
+        results["joined"].put((index, node.addr[1], time.perf_counter() - started))
+
+        # Wait to learn about every other node
+        with anyio.move_on_after(config["converge_timeout"]):
+            while len(node.router.peers) < config["nodes"] - 1:
+                await anyio.sleep(0.01)
+
+        results["converged"].put((index, time.time(), len(node.router.peers)))
+
+        await anyio.to_thread.run_sync(start.wait)
+
+        # Send at the configured rate
+        payload = bytearray(max(config["size"], _stamp.size))
+        interval = 1 / config["rate"] if config["rate"] else 0
+        deadline = time.perf_counter() + config["duration"]
+        next_send = time.perf_counter()
+        sent = 0
+        expected = 0
+        errors = 0
+        seq = 0
+        first_send = None
+
+        while time.perf_counter() < deadline:
+            _stamp.pack_into(payload, 0, index, seq, time.time_ns())
+            seq += 1
+            started = time.perf_counter()
+
+            try:
+                if config["mode"] == "emit":
+                    result = await node.emit("bench.load", bytes(payload))
+                    expected += len(node.router.peers)
+                    errors += len(result.failed)
+                else:
+                    peers = list(node.router.peers.keys())
+                    for peer in random.sample(peers, min(config["fanout"], len(peers))):
+                        await node.send(peer, "bench.load", bytes(payload))
+                        expected += 1
+            except OSError:
+                errors += 1
+
+            if first_send is None:
+                first_send = time.perf_counter() - started
+
+            sent += 1
+
+            next_send += interval
+            await anyio.sleep(max(next_send - time.perf_counter(), 0))
+
+        # Let messages in flight arrive
+        await anyio.sleep(config["drain"])
+
+        if len(latencies) > MAX_SAMPLES:
+            latencies = random.sample(latencies, MAX_SAMPLES)
+
+        results["done"].put((index, sent, expected, errors, received, latencies, first_send))
+
+        tg.cancel_scope.cancel()
+
+def _worker(index: int, entry_port: int, config: dict, results: dict[str, multiprocessing.Queue], start: multiprocessing.Event):
+    """Process entry point for one node
+    """
+
+    # Keep logging out of the measurements
+    logger.remove()
+
+    anyio.run(_node_main, index, entry_port, config, results, start)
+
+
+################################################
+# Coordinator
+################################################
+
+def _wait_for(results: multiprocessing.Queue, count: int, timeout: float) -> list[tuple]:
+    """Collects reports from the nodes
+
+    Args:
+        results (multiprocessing.Queue): Where nodes report to.
+        count (int): The number of reports to collect.
+        timeout (float): Seconds to wait for each report.
+
+    Returns:
+        list[tuple]: The reports.
+    """
+
+    return [results.get(timeout=timeout) for _ in range(count)]
+
+def run_cluster(config: dict) -> dict:
+    """Runs the benchmark for one cluster size
+
+    Args:
+        config (dict): The benchmark configuration.
+
+    Returns:
+        dict: The results.
+    """
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {kind: ctx.Queue() for kind in ("joined", "converged", "done")}
+    start = ctx.Event()
+    processes = []
+
+    try:
+        # The first node finds nothing at its entry port, and starts the cluster
+        entry_port = _free_port()
+
+        # Start nodes one at a time, all joining through the first
+        join_started = time.time()
+        joins = []
+        for index in range(config["nodes"]):
+            process = ctx.Process(target=_worker, args=(index, entry_port, config, results, start), daemon=True)
+            process.start()
+            processes.append(process)
+
+            _, port, join_time = _wait_for(results["joined"], 1, 60)[0]
+            joins.append(join_time)
+
+            if index == 0:
+                entry_port = port
+
+        last_join = time.time()
+
+        # Wait for every node to see the whole cluster
+        converged = _wait_for(results["converged"], config["nodes"], config["converge_timeout"] + 60)
+        converged_at = max(report[1] for report in converged)
+        complete = all(report[2] == config["nodes"] - 1 for report in converged)
+
+        # Drive the workload
+        start.set()
+        done = _wait_for(results["done"], config["nodes"], config["duration"] + config["drain"] + 60)
+
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+
+    sent = sum(report[1] for report in done)
+    expected = sum(report[2] for report in done)
+    errors = sum(report[3] for report in done)
+    received = sum(report[4] for report in done)
+    latencies = sorted(latency for report in done for latency in report[5])
+    first_sends = sorted(report[6] for report in done if report[6] is not None)
+
+    joins.sort()
+
+    return {
+        "nodes": config["nodes"],
+        "join_seconds_p50": _percentile(joins, 0.5),
+        "join_seconds_max": joins[-1],
+        "bootstrap_seconds": last_join - join_started,
+        "convergence_seconds": max(converged_at - last_join, 0),
+        "converged": complete,
+        "sent": sent,
+        "expected": expected,
+        "received": received,
+        "send_errors": errors,
+        "loss": 1 - received / expected if expected else 0.0,
+        "throughput_msgs_per_sec": received / config["duration"],
+        "throughput_bytes_per_sec": received * max(config["size"], _stamp.size) / config["duration"],
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p99": _percentile(latencies, 0.99),
+        "latency_p999": _percentile(latencies, 0.999),
+        "first_send_seconds_p50": _percentile(first_sends, 0.5),
+        "first_send_seconds_max": first_sends[-1] if first_sends else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a pydevts cluster load benchmark")
+    parser.add_argument("--nodes", default="2,4,8,16", help="Comma separated cluster sizes to run")
+    parser.add_argument("--mode", choices=["emit", "send"], default="emit", help="Broadcast to every peer, or send to some")
+    parser.add_argument("--fanout", type=int, default=1, help="Peers each message is sent to in send mode")
+    parser.add_argument("--size", type=int, default=1024, help="Message size in bytes")
+    parser.add_argument("--rate", type=float, default=100, help="Messages per second each node sends, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds each node sends for")
+    parser.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for messages in flight")
+    parser.add_argument("--converge-timeout", type=float, default=30.0, help="Seconds to wait for the cluster to converge")
+    parser.add_argument("--router", choices=sorted(ROUTERS), default="peer", help="The router nodes use")
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="tcp", help="The protocol nodes use")
+    parser.add_argument("--warm-up", type=int, default=0, help="Peers each node connects to before sending, -1 for all of them")
+    parser.add_argument("--max-loss", type=float, default=0.01, help="Loss above which a cluster size counts as broken down")
+    parser.add_argument("--output", help="Write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    config = {
+        "mode": args.mode,
+        "fanout": args.fanout,
+        "size": args.size,
+        "rate": args.rate,
+        "duration": args.duration,
+        "drain": args.drain,
+        "converge_timeout": args.converge_timeout,
+        "router": args.router,
+        "protocol": args.protocol,
+        "warm_up": None if args.warm_up < 0 else args.warm_up,
+    }
+
+    runs = []
+    breakdown = None
+    for nodes in [int(n) for n in args.nodes.split(",")]:
+        result = run_cluster({**config, "nodes": nodes})
+        runs.append(result)
+
+        print(f"nodes={nodes:<5} converge={result['convergence_seconds']:.3f}s "
+            f"throughput={result['throughput_msgs_per_sec']:.0f} msg/s loss={result['loss']:.2%} "
+            f"p50={result['latency_p50'] or 0:.4f}s p99={result['latency_p99'] or 0:.4f}s "
+            f"first={result['first_send_seconds_max'] or 0:.4f}s", file=sys.stderr)
+
+        # Note the first size the cluster failed to converge or lost messages at
+        if breakdown is None and (not result["converged"] or result["loss"] > args.max_loss):
+            breakdown = nodes
+
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "config": config,
+        "breakdown_nodes": breakdown,
+        "runs": runs,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+    Microbenchmarks for the codecs and dispatch hot paths.
+
+    Usage:
+        python -m bench.micro [--duration SECONDS] [--filter TEXT] [--output FILE] [--compare FILE]
+
+    Results are written as JSON so runs from different commits can be compared
+    with --compare.
+"""
+
+# Anyio
+import anyio
+
+# Standard Library Imports
+import argparse
+import inspect
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Code under test
+from pydevts.msg import MsgNum, MsgNumReader, MsgName, EnvelopePacker, EnvelopeUnpacker
+from pydevts.conn import MultiClientCache
+from pydevts.pub import Node
+from pydevts.proto import TCPProto
+from pydevts.patterns import PatternIndex
+from pydevts.logger import logger
+
+
+# Payload sizes every codec is measured at
+SIZES = [64, 4096, 262144]
+
+# Registered benchmarks, as (name, params, factory)
+BENCHMARKS = []
+
+
+def benchmark(name: str, **params):
+    """Decorator to register a benchmark
+
+    The decorated function sets up the benchmark and returns a function
+    running one operation. Either may be a coroutine function. A setup
+    function taking a tg argument is passed a task group to start
+    background tasks in, which is cancelled once the benchmark is done.
+
+    Args:
+        name (str): The name of the benchmark.
+        **params: Parameters recorded with the results, and passed to the function.
+    """
+
+    def _deco(func):
+        BENCHMARKS.append((name, params, func))
+        return func
+
+    return _deco
+
+
+################################################
+# Codecs
+################################################
+
+for size in SIZES:
+
+    @benchmark("msgnum.dumps", size=size)
+    def _msgnum_dumps(size):
+        payload = b"x" * size
+        return lambda: MsgNum.dumps(3, payload)
+
+    @benchmark("msgnum.loads", size=size)
+    def _msgnum_loads(size):
+        frame = MsgNum.dumps(3, b"x" * size)
+        return lambda: MsgNum.loads(frame)
+
+    @benchmark("msgnum.reader", size=size)
+    def _msgnum_reader(size):
+        # Sixteen frames per read, as pipelined traffic arrives
+        chunk = MsgNum.dumps(3, b"x" * size) * 16
+        reader = MsgNumReader()
+        return lambda: reader.feed(chunk)
+
+    @benchmark("msgname.dumps", size=size)
+    def _msgname_dumps(size):
+        payload = b"x" * size
+        return lambda: MsgName.dumps("bench.event", payload)
+
+    @benchmark("msgname.loads", size=size)
+    def _msgname_loads(size):
+        data = MsgName.dumps("bench.event", b"x" * size)
+        return lambda: MsgName.loads(data)
+
+    @benchmark("envelope.pack", size=size)
+    def _envelope_pack(size):
+        payload = b"x" * size
+        packer = EnvelopePacker("00000000-0000-0000-0000-000000000000")
+        return lambda: packer.pack("bench.event", payload)
+
+    @benchmark("envelope.unpack", size=size)
+    def _envelope_unpack(size):
+        packer = EnvelopePacker("00000000-0000-0000-0000-000000000000")
+        _, data = MsgNum.loads(b"".join(packer.pack("bench.event", b"x" * size)))
+        unpacker = EnvelopeUnpacker()
+        return lambda: unpacker.unpack(data)
+
+
+################################################
+# Dispatch
+################################################
+
+class _NullClient:
+    """A client that connects instantly and discards data
+    """
+
+    def __init__(self, addr: tuple[str, int]):
+        self.addr = addr
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "_NullClient":
+        return cls((host, port))
+
+    async def send(self, data: bytes):
+        pass
+
+    async def send_many(self, buffers: list[bytes]):
+        pass
+
+    async def close(self):
+        pass
+
+def _bench_node(peers: int = 0) -> Node:
+    """Creates a node with a no-op handler, ready to emit
+
+    Args:
+        peers (int, optional): The number of peers handling the event, reached through null connections. Defaults to 0.
+    """
+
+    node = Node(host="127.0.0.1", protocol=(_NullClient, *TCPProto[1:]))
+
+    @node.on("bench.event")
+    async def _handler(sender: str, data: bytes):
+        pass
+
+    # Give the router an identity without joining a cluster
+    node.router.node_id = "00000000-0000-0000-0000-000000000000"
+    node.router.host_addr = node.addr
+    node.router._packer = EnvelopePacker(node.router.node_id)
+    node.router.data_handler = node._on_data
+
+    # Peers that told us their ID for the event, as joined peers do
+    for number in range(peers):
+        peer_id = f"{number:08x}-0000-0000-0000-000000000000"
+        node.router.peers[peer_id] = ("127.0.0.1", 10000 + number)
+        node.router.peer_event_ids[peer_id] = {"bench.event": 0}
+
+    return node
+
+for size in SIZES:
+    for peers in [0, 1, 16, 256]:
+
+        @benchmark("node.emit", size=size, peers=peers)
+        async def _node_emit(size, peers, tg):
+            node = _bench_node(peers)
+            payload = b"x" * size
+
+            # Queue frames to peers, and write them out, as a running node does
+            await tg.start(node.router.connections.run)
+
+            # Connect to every peer before timing
+            await node.emit("bench.event", payload)
+
+            async def _op():
+                await node.emit("bench.event", payload)
+
+            return _op
+
+    @benchmark("router.receive", size=size)
+    async def _router_receive(size):
+        # A frame from a peer, through the router into Node._on_data
+        node = _bench_node()
+        frame = b"".join(EnvelopePacker("11111111-1111-1111-1111-111111111111").pack("bench.event", b"x" * size))
+
+        async def _op():
+            await node.router._on_data(frame, ("127.0.0.1", 0))
+
+        return _op
+
+
+################################################
+# Subscriptions
+################################################
+
+for subscriptions in [10, 1000, 100000]:
+
+    @benchmark("patterns.match", subscriptions=subscriptions)
+    def _patterns_match(subscriptions):
+        # Wildcard subscriptions across many services, matched uncached
+        index = PatternIndex(max_cache=0)
+        for number in range(subscriptions):
+            index.add(f"service{number}.*.created")
+        index.add("orders.**")
+
+        return lambda: index.match("orders.eu.created")
+
+
+################################################
+# Connection cache
+################################################
+
+for cache_size in [10, 100, 1000, 10000]:
+
+    @benchmark("cache.connect", peers=cache_size)
+    async def _cache_connect(peers):
+        cache = MultiClientCache(proto=[_NullClient], max_size=peers)
+        state = {"next": 0}
+
+        for port in range(peers):
+            await cache.connect("127.0.0.1", port)
+
+        async def _op():
+            # Look up cached peers in turn
+            port = state["next"]
+            state["next"] = (port + 1) % peers
+
+            await cache.connect("127.0.0.1", port)
+
+        return _op
+
+
+################################################
+# Runner
+################################################
+
+async def _time(op, is_async: bool, count: int) -> float:
+    """Times a number of operations
+
+    Args:
+        op: The operation.
+        is_async (bool): Whether the operation is a coroutine function.
+        count (int): The number of operations.
+
+    Returns:
+        float: The elapsed time in seconds.
+    """
+
+    started = time.perf_counter()
+
+    if is_async:
+        for _ in range(count):
+            await op()
+    else:
+        for _ in range(count):
+            op()
+
+    return time.perf_counter() - started
+
+async def _measure(factory, params: dict, duration: float) -> dict:
+    """Measures the throughput and allocations of a benchmark
+
+    Args:
+        factory: The function setting up the benchmark.
+        params (dict): The parameters to pass to it.
+        duration (float): Roughly how long to spend timing it.
+
+    Returns:
+        dict: The measurements.
+    """
+
+    async with anyio.create_task_group() as tg:
+        kwargs = dict(params)
+        if "tg" in inspect.signature(factory).parameters:
+            kwargs["tg"] = tg
+
+        op = factory(**kwargs)
+        if inspect.isawaitable(op):
+            op = await op
+
+        measured = await _measure_op(op, duration)
+
+        # Stop anything the benchmark left running
+        tg.cancel_scope.cancel()
+
+    return measured
+
+async def _measure_op(op, duration: float) -> dict:
+    """Measures the throughput and allocations of an operation
+
+    Args:
+        op: The operation.
+        duration (float): Roughly how long to spend timing it.
+
+    Returns:
+        dict: The measurements.
+    """
+
+    is_async = inspect.iscoroutinefunction(op)
+
+    # Warm up, and estimate how many operations fit in the duration
+    count = 1
+    while True:
+        elapsed = await _time(op, is_async, count)
+        if elapsed >= 0.05:
+            break
+        count *= 2
+
+    count = max(1, int(count * duration / elapsed))
+    elapsed = await _time(op, is_async, count)
+
+    # Measure allocations separately, as tracing slows everything down
+    alloc_count = max(1, min(count, 1000))
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        await _time(op, is_async, alloc_count)
+
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops": count,
+        "seconds": elapsed,
+        "ops_per_sec": count / elapsed,
+        "ns_per_op": elapsed / count * 1e9,
+        "peak_alloc_bytes": peak - before,
+        "retained_bytes_per_op": (after - before) / alloc_count,
+    }
+
+def _commit() -> str:
+    """The current git commit, if there is one
+    """
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _key(result: dict) -> str:
+    """Identifies a result across runs
+    """
+
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+def _compare(results: list[dict], baseline_path: str):
+    """Prints the change in throughput against a baseline run
+
+    Args:
+        results (list[dict]): The results of this run.
+        baseline_path (str): The file holding the baseline run.
+    """
+
+    with open(baseline_path) as f:
+        baseline = {_key(result): result for result in json.load(f)["results"]}
+
+    print(f"{'benchmark':<40} {'baseline ops/s':>16} {'ops/s':>16} {'change':>9}", file=sys.stderr)
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None:
+            continue
+
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1
+        print(f"{_key(result):<40} {old['ops_per_sec']:>16.0f} {result['ops_per_sec']:>16.0f} {change:>+8.1%}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pydevts microbenchmarks")
+    parser.add_argument("--duration", type=float, default=0.5, help="Seconds to time each benchmark for")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="Write results to this file instead of stdout")
+    parser.add_argument("--compare", help="Compare against results from an earlier run")
+    args = parser.parse_args()
+
+    # Keep routing logs out of the measurements
+    logger.remove()
+
+    results = []
+    for name, params, factory in BENCHMARKS:
+        if args.filter not in name:
+            continue
+
+        measured = anyio.run(_measure, factory, params, args.duration)
+
+        results.append({"name": name, "params": params, **measured})
+        print(f"{_key(results[-1]):<40} {measured['ops_per_sec']:>14.0f} ops/s", file=sys.stderr)
+
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -74,6 +74,14 @@ class AuthClient(_Client):
 
         await self._conn.send(data)
 
+    async def send_many(self, buffers: list[bytes]):
+        """Send several buffers over the connection in one write.
+
+        Args:
+            buffers (list[bytes]): Buffers to send, in order.
+        """
+
+        await self._conn.send_many(buffers)
 
     async def close(self):
         """Close the connection
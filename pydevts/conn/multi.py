@@ -3,31 +3,169 @@
 """
 
 # Connection class typehints
-from ..proto._base import _Client
+from ..proto._base import _Client, _Conn
 from ..proto import TCPClient
+from typing import Callable
+
+# Outbound queues
+from .queued import QueuedConn, POLICIES, BLOCK
+
+# Metrics
+from ..metrics import Registry
+
+# Sizing frames made of several buffers
+from ..msg.envelope import frame_length
+
+# Anyio
+from anyio import create_task_group, sleep, move_on_after, Event, TASK_STATUS_IGNORED
+from anyio.abc import TaskGroup, TaskStatus
 
 # Standard Library Imports
+from collections import OrderedDict
+from functools import partial
+import heapq
 import time
 import uuid
 
 # Errors
 from ..err import ConnectionNotFound
 
+# Logging
+from ..logger import logger
+
+
+class _Inbound(_Conn):
+    """
+        A connection a peer dialed us on. We may send over it, but the peer
+        that dialed it decides when it is closed.
+    """
+
+    _wraps: _Conn
+
+    def __init__(self, wraps: _Conn):
+        """Initialize the wrapper
+
+        Args:
+            wraps (_Conn): The inbound connection.
+        """
+
+        self._wraps = wraps
+
+    @property
+    def addr(self) -> tuple[str, int]:
+        """The address on the other end of the pipe
+        """
+
+        return self._wraps.addr
+
+    async def recv(self, max_bytes: int = 35536) -> bytes:
+        """Receive data overthe connection.
+
+        Args:
+            max_bytes (int, optional): Maximum number of bytes to receive. Defaults to 35536.
+
+        Returns:
+            bytes: Data received over the connection.
+        """
+
+        return await self._wraps.recv(max_bytes)
+
+    async def send(self, data: bytes):
+        """Send data over the connection.
+
+        Args:
+            data (bytes): Data to send.
+        """
+
+        await self._wraps.send(data)
+
+    async def send_many(self, buffers: list[bytes]):
+        """Send several buffers over the connection in one write.
+
+        Args:
+            buffers (list[bytes]): Buffers to send, in order.
+        """
+
+        await self._wraps.send_many(buffers)
+
+    async def close(self):
+        """Stops using the connection, leaving it open for its owner
+        """
+
+        pass
+
+
+class _Dial:
+    """
+        A connection being dialed, which others connecting to the same
+        address wait for rather than dialing their own
+    """
+
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.error = None
+
+
 class MultiClientCache:
 
     _max_size: int
     _ttl: int
     _proto: _Client
-    _cache: dict[str, list[_Client, int, tuple[str, int]]]
-
-    def __init__(self, proto: _Client = TCPClient, max_size=100, ttl=60):
+    _cache: OrderedDict[str, list[_Client, float, tuple[str, int], _Conn, bool]]
+    _index: dict[tuple[str, int], str]
+    _handles: dict[_Conn, str]
+    _on_dial: Callable[[_Client], None]
+    _expiry: list[tuple[float, str]]
+    _max_batch: int
+    _max_delay: float
+    _max_pending: int
+    _policy: str
+    _high_water: int
+    _on_high_water: Callable[[str, int, int], None]
+    _dialing: dict[tuple[str, int], _Dial]
+    _failures: dict[tuple[str, int], tuple[int, float]] # Failed dials in a row, and when to dial again
+    _dial_backoff: float
+    _max_dial_backoff: float
+    _retire_frame: bytes
+    _retire_timeout: float
+    _retiring: dict[_Conn, Event] # Set once the peer has retired the connection too
+    _tg: TaskGroup
+    metrics: Registry
+
+    def __init__(self, proto: _Client = TCPClient, max_size=100, ttl=60, max_batch=65536, max_delay=0.0, metrics: Registry = None,
+        on_dial: Callable[[_Client], None] = None,
+        max_pending: int = None,
+        policy: str = BLOCK,
+        high_water: int = None,
+        on_high_water: Callable[[str, int, int], None] = None,
+        dial_backoff: float = 0.1,
+        max_dial_backoff: float = 5.0,
+        retire_frame: bytes = None,
+        retire_timeout: float = 5.0):
         """Initializes the cache
 
         Args:
             max_size (int, optional): The maximum size of the cache. Defaults to 100.
-            ttl (int, optional): The time to live for a connection. Defaults to 60.
+            ttl (int, optional): The time to live for an idle connection. Defaults to 60.
+            max_batch (int, optional): The maximum number of bytes coalesced into one write. Defaults to 65536.
+            max_delay (float, optional): How long a write waits for more data to batch with. Defaults to 0.0.
+            metrics (Registry, optional): The registry to report to. Defaults to a new registry.
+            on_dial (Callable[[_Client], None], optional): Called with each connection we dial, before anything else is sent over it. Defaults to None.
+            max_pending (int, optional): The most bytes queued for each connection. Defaults to None, for no limit.
+            policy (str, optional): What to do with messages that do not fit in a connection's queue: block, drop_newest, drop_oldest or disconnect. Defaults to block.
+            high_water (int, optional): Queued bytes above which on_high_water is called for a connection. Defaults to None.
+            on_high_water (Callable[[str, int, int], None], optional): Called with the host, port and queued bytes of a connection that went over the high-water mark. Defaults to None.
+            dial_backoff (float, optional): Seconds an address that failed to connect is not dialed again for, doubling with each failure in a row. Defaults to 0.1.
+            max_dial_backoff (float, optional): The longest an address is not dialed again for. Defaults to 5.0.
+            retire_frame (bytes, optional): Sent over a connection we stop using while the peer may still send over it, telling the peer to stop too. Defaults to None, closing such connections straight away.
+            retire_timeout (float, optional): The longest we wait for the peer to retire a connection we dialed before closing it. Defaults to 5.0.
         """
 
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send buffer policy {policy}, expected one of {', '.join(POLICIES)}")
+
         # Save the protocol
         self._proto = proto
 
@@ -37,8 +175,129 @@ class MultiClientCache:
         # Set the ttl
         self._ttl = ttl
 
-        # Create the cache
-        self._cache = dict()
+        # Save the write batching limits
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+
+        # Save the outbound queue limits
+        self._max_pending = max_pending
+        self._policy = policy
+        self._high_water = high_water
+        self._on_high_water = on_high_water
+
+        # Create the cache, ordered from least to most recently used
+        self._cache = OrderedDict()
+
+        # Index connections by address, and by the connection itself
+        self._index = dict()
+        self._handles = dict()
+
+        # Save the dial hook
+        self._on_dial = on_dial
+
+        # Dials in progress, and addresses that failed recently, by address
+        self._dialing = dict()
+        self._failures = dict()
+        self._dial_backoff = dial_backoff
+        self._max_dial_backoff = max_dial_backoff
+
+        # Connections being retired, by the connection as dialed or accepted
+        self._retire_frame = retire_frame
+        self._retire_timeout = retire_timeout
+        self._retiring = dict()
+
+        # Heap of connection expiry times
+        self._expiry = []
+
+        # Writers are started once the cache is running
+        self._tg = None
+
+        # Create the metrics
+        self.metrics = metrics if metrics is not None else Registry()
+        self._hits = self.metrics.counter("pydevts_connection_cache_hits_total", "Connections reused from the cache")
+        self._misses = self.metrics.counter("pydevts_connection_cache_misses_total", "Connections opened because none was cached")
+        self._evictions = self.metrics.counter("pydevts_connection_cache_evictions_total", "Connections removed from the cache", ("reason",))
+        self._dials = self.metrics.counter("pydevts_connection_dials_total", "Connections dialed, by outcome", ("outcome",))
+        self._adoptions = self.metrics.counter("pydevts_connection_cache_adoptions_total", "Inbound connections reused to send to the peer that dialed them")
+        self.metrics.gauge("pydevts_connections_open", "Outbound connections in the cache").set_function(lambda: len(self._cache))
+        self.metrics.gauge("pydevts_outbound_queue_bytes", "Bytes queued on outbound connections").set_function(self._queued_bytes)
+        self._queue_bytes = self.metrics.gauge("pydevts_send_buffer_bytes", "Bytes queued for each address", ("addr",))
+        self._drops = self.metrics.counter("pydevts_send_buffer_dropped_total", "Messages dropped because a send buffer was full", ("policy",))
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Runs the writer tasks for cached connections
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        async with create_task_group() as tg:
+            self._tg = tg
+
+            try:
+                # Queue writes to connections opened before we started
+                for entry in self._cache.values():
+                    entry[0] = await self._queue(entry[0], entry[2])
+                    self._watch(entry[2], entry[0])
+
+                task_status.started()
+
+                # Expire idle connections as their time comes
+                while True:
+                    if self._expiry:
+                        await sleep(max(self._expiry[0][0] - time.monotonic(), 0))
+                    else:
+                        await sleep(self._ttl)
+
+                    await self.clean()
+            finally:
+                self._tg = None
+
+    async def _queue(self, connection: _Client, addr: tuple[str, int]) -> QueuedConn:
+        """Wraps a connection with an outbound queue and starts its writer
+
+        Args:
+            connection (_Client): The connection to wrap.
+            addr (tuple[str, int]): The address the connection reaches.
+
+        Returns:
+            QueuedConn: The wrapped connection.
+        """
+
+        queued = QueuedConn(connection, self._max_batch, self._max_delay,
+            max_pending=self._max_pending,
+            policy=self._policy,
+            high_water=self._high_water,
+            on_high_water=partial(self._report_high_water, addr),
+            on_drop=self._drops.labels(self._policy).inc)
+        await self._tg.start(queued.run)
+
+        return queued
+
+    def _watch(self, addr: tuple[str, int], connection: _Conn):
+        """Reports how much is queued on a connection, by its address
+
+        Args:
+            addr (tuple[str, int]): The address the connection reaches.
+            connection (_Conn): The connection.
+        """
+
+        if isinstance(connection, QueuedConn):
+            self._queue_bytes.labels(f"{addr[0]}:{addr[1]}").set_function(lambda: connection.pending)
+
+    async def _report_high_water(self, addr: tuple[str, int], connection: QueuedConn):
+        """Reports a connection that went over its high-water mark
+
+        Args:
+            addr (tuple[str, int]): The address the connection reaches.
+            connection (QueuedConn): The connection.
+        """
+
+        logger.warning(f"Send buffer for {addr[0]}:{addr[1]} is over its high-water mark, with {connection.pending} bytes queued")
+
+        if self._on_high_water is not None:
+            await self._on_high_water(addr[0], addr[1], connection.pending)
 
     async def connect(self, host: str, port: int) -> str:
         """Connects to a host.
@@ -51,6 +310,181 @@ class MultiClientCache:
             str: The connection ID. (handle)
         """
 
+        addr = (host, port)
+
+        while True:
+            # If the host and port are already in the cache
+            connection_id = self._index.get(addr)
+            if connection_id is not None:
+                # Reset the timer and mark it as recently used
+                self._cache[connection_id][1] = time.monotonic()
+                self._cache.move_to_end(connection_id)
+
+                self._hits.inc()
+
+                # Return the connection ID
+                return connection_id
+
+            # Wait for anyone already dialing it, then check again
+            dial = self._dialing.get(addr)
+            if dial is None:
+                break
+
+            self._dials.labels("coalesced").inc()
+            await dial.done.wait()
+
+            if dial.error is not None:
+                raise ConnectionError(f"Unable to connect to {host}:{port}: {dial.error}") from dial.error
+
+        # Do not redial an address that failed recently
+        failures = self._failures.get(addr)
+        if failures is not None and failures[1] > time.monotonic():
+            self._dials.labels("backoff").inc()
+            raise ConnectionError(f"Unable to connect to {host}:{port}: failed {failures[0]} times, retrying in {failures[1] - time.monotonic():.2f}s")
+
+        self._misses.inc()
+
+        dial = self._dialing[addr] = _Dial()
+
+        try:
+            # Create the connection
+            connection = await self._proto[0].connect(host, port)
+
+            # Let our owner speak first
+            if self._on_dial is not None:
+                try:
+                    await self._on_dial(connection)
+                except BaseException:
+                    await self._close_now(connection)
+                    raise
+
+            connection_id = await self._add(host, port, connection, connection, True)
+        except OSError as e:
+            # Back off for longer each time it fails in a row
+            count = failures[0] + 1 if failures is not None else 1
+            backoff = min(self._dial_backoff * 2 ** (count - 1), self._max_dial_backoff)
+            self._failures[addr] = (count, time.monotonic() + backoff)
+
+            self._dials.labels("failed").inc()
+            dial.error = e
+            raise
+        finally:
+            # Wake those waiting on us. If we were cancelled they dial themselves
+            del self._dialing[addr]
+            dial.done.set()
+
+        self._failures.pop(addr, None)
+        self._dials.labels("connected").inc()
+
+        return connection_id
+
+    async def adopt(self, host: str, port: int, connection: _Conn, keep_dialed: bool = False) -> str:
+        """Sends to a host over a connection it dialed us on
+
+        The connection is not closed when it leaves the cache, as the peer
+        that dialed it owns it.
+
+        Args:
+            host (str): The host the peer listens on.
+            port (int): The port the peer listens on.
+            connection (_Conn): The inbound connection.
+            keep_dialed (bool, optional): Keep a connection we dialed to the host instead, if there is one. Defaults to False.
+
+        Returns:
+            str: The connection ID, or None if the connection was not adopted.
+        """
+
+        # Already adopted
+        if connection in self._handles:
+            return self._handles[connection]
+
+        connection_id = self._index.get((host, port))
+        if connection_id is not None and keep_dialed and self._cache[connection_id][4]:
+            return None
+
+        self._adoptions.inc()
+
+        # The host can reach us, so it is likely up again
+        self._failures.pop((host, port), None)
+
+        return await self._add(host, port, _Inbound(connection), connection, False)
+
+    async def forget(self, connection: _Conn):
+        """Removes a connection that has been closed from the cache
+
+        Args:
+            connection (_Conn): The connection, as dialed or adopted.
+        """
+
+        # Nothing more will arrive over it
+        retired = self._retiring.pop(connection, None)
+        if retired is not None:
+            retired.set()
+
+        connection_id = self._handles.get(connection)
+        if connection_id is not None:
+            self._evictions.labels("closed").inc()
+            await self._close(self._evict(connection_id))
+
+    async def retired(self, connection: _Conn):
+        """Handles the peer retiring a connection, after which it sends nothing more over it
+
+        If we have not retired it ourselves we stop using it and retire it
+        too, so whoever dialed it can close it.
+
+        Args:
+            connection (_Conn): The connection, as dialed or accepted.
+        """
+
+        retired = self._retiring.get(connection)
+        if retired is not None:
+            retired.set()
+            return
+
+        retired = self._retiring[connection] = Event()
+        retired.set()
+
+        connection_id = self._handles.get(connection)
+        if connection_id is not None:
+            self._evictions.labels("retired").inc()
+            dialed = self._cache[connection_id][4]
+            await self._retire(self._evict(connection_id), connection, dialed)
+            return
+
+        # We were not sending over it, so only need to say so
+        if self._retire_frame is not None:
+            try:
+                await connection.send(self._retire_frame)
+            except OSError as e:
+                logger.debug(f"Unable to retire connection to {connection.addr}: {e!r}")
+
+    def dialed(self) -> list[tuple[str, _Client]]:
+        """Lists the connections we dialed
+
+        Returns:
+            list[tuple[str, _Client]]: The ID and connection of each
+        """
+
+        return [(key, entry[3]) for key, entry in self._cache.items() if entry[4]]
+
+    async def _add(self, host: str, port: int, connection: _Conn, raw: _Conn, dialed: bool) -> str:
+        """Adds a connection to the cache
+
+        Args:
+            host (str): The host the connection reaches.
+            port (int): The port the connection reaches.
+            connection (_Conn): The connection to send over.
+            raw (_Conn): The connection as dialed or accepted, to find it by.
+            dialed (bool): Whether we dialed the connection.
+
+        Returns:
+            str: The connection ID.
+        """
+
+        # Give it a writer if we are running
+        if self._tg is not None:
+            connection = await self._queue(connection, (host, port))
+
         # Create the connection ID
         connection_id = str(uuid.uuid4())
 
@@ -61,20 +495,29 @@ class MultiClientCache:
             # more than 0% chance of happening.
             connection_id = str(uuid.uuid4())
 
-        # If the host and port are already in the cache
-        for key, (_, created_at, addr) in self._cache.items():
-            if addr[0] == host and addr[1] == port:
-                # Reset the timer
-                self._cache[key][1] = time.time()
+        # Make room for the connection
+        while len(self._cache) >= self._max_size:
+            await self.remove_oldest()
 
-                # Return the connection ID
-                return key
-        
-        # Create the connection
-        connection = await self._proto[0].connect(host, port)
+        # Replace any other connection to the same address, including one
+        # added while we waited above
+        replaced = self._index.get((host, port))
+        if replaced is not None:
+            self._evictions.labels("replaced").inc()
+            replaced_raw, replaced_dialed = self._cache[replaced][3:5]
+            replaced = self._evict(replaced)
 
         # Add the connection to the cache
-        self._cache[connection_id] = [connection, time.time(), (host, port)]
+        now = time.monotonic()
+        self._cache[connection_id] = [connection, now, (host, port), raw, dialed]
+        self._index[(host, port)] = connection_id
+        self._handles[raw] = connection_id
+        heapq.heappush(self._expiry, (now + self._ttl, connection_id))
+        self._watch((host, port), connection)
+
+        # The peer may still be sending over the one replaced
+        if replaced is not None:
+            await self._retire(replaced, replaced_raw, replaced_dialed)
 
         # Return the connection ID
         return connection_id
@@ -89,8 +532,72 @@ class MultiClientCache:
 
         # If the connection is in the cache
         if handle in self._cache.keys():
-            # Send the data
-            await self._cache[handle][0].send(data)
+            try:
+                # Send the data
+                await self._cache[handle][0].send(data)
+            except OSError:
+                # Drop the broken connection so it is redialed
+                self._evictions.labels("error").inc()
+                await self.disconnect(handle)
+                raise
+        else:
+            # Otherwise, raise an error
+            raise ConnectionNotFound(f"Unable to find cached connection with ID {handle}")
+
+    async def send_nowait(self, host: str, port: int, data: bytes) -> bool:
+        """Queues data for a host, if that can be done without waiting
+
+        Only connections already open are used, and only if their queue
+        has room, so nothing is dialed and no room is waited for.
+
+        Args:
+            host (str): The host to send to.
+            port (int): The port to send to.
+            data (bytes): The data to send, or a list of its buffers.
+
+        Returns:
+            bool: Whether the data was queued.
+        """
+
+        connection_id = self._index.get((host, port))
+        if connection_id is None:
+            return False
+
+        entry = self._cache[connection_id]
+        size = frame_length(data) if isinstance(data, list) else len(data)
+        if isinstance(entry[0], QueuedConn) and not entry[0].fits(size):
+            return False
+
+        # Mark it as recently used
+        entry[1] = time.monotonic()
+        self._cache.move_to_end(connection_id)
+        self._hits.inc()
+
+        if isinstance(data, list):
+            await self.send_many(connection_id, data)
+        else:
+            await self.send(connection_id, data)
+
+        return True
+
+    async def send_many(self, handle: str, buffers: list[bytes]):
+        """Sends several buffers to a connection, in order.
+
+        Args:
+            handle (str): The connection ID.
+            buffers (list[bytes]): The buffers to send.
+        """
+
+        # If the connection is in the cache
+        if handle in self._cache.keys():
+            try:
+                # Send the data
+                await self._cache[handle][0].send_many(buffers)
+            except OSError:
+                # Drop the broken connection so it is redialed
+                self._evictions.labels("error").inc()
+                await self.disconnect(handle)
+                raise
         else:
             # Otherwise, raise an error
             raise ConnectionNotFound(f"Unable to find cached connection with ID {handle}")
@@ -122,44 +629,176 @@ class MultiClientCache:
 
         # If the connection is in the cache
         if handle in self._cache.keys():
-            # Close the connection
-            await self._cache[handle][0].close()
-            del self._cache[handle]
+            # Remove it and close it
+            await self._close(self._evict(handle))
     
     async def close(self):
         """Closes all connections
         """
 
         # Loop through all connections
-        for key in self._cache.copy().keys():
+        for key in list(self._cache.keys()):
             # Close the connection
-            await self._cache[key][0].close()
-            del self._cache[key]
-        
+            await self._close_now(self._evict(key))
+
+        self._expiry.clear()
+
+    def _evict(self, handle: str) -> _Client:
+        """Removes a connection from the cache without closing it.
+
+        Args:
+            handle (str): The connection ID.
+
+        Returns:
+            _Client: The removed connection.
+        """
+
+        connection, _, addr, raw, _ = self._cache.pop(handle)
 
-    def clean(self):
+        # Only drop the index if it still points at this connection
+        if self._index.get(addr) == handle:
+            del self._index[addr]
+            self._queue_bytes.remove(f"{addr[0]}:{addr[1]}")
+
+        del self._handles[raw]
+
+        return connection
+
+    async def _close(self, connection: _Client):
+        """Closes a connection that has been removed from the cache.
+
+        Args:
+            connection (_Client): The connection to close.
+        """
+
+        # Flush and close in the background if we can
+        if self._tg is not None:
+            self._tg.start_soon(self._close_now, connection)
+        else:
+            await self._close_now(connection)
+
+    async def _retire(self, connection: _Client, raw: _Conn, dialed: bool):
+        """Closes a connection that has been removed from the cache, once the peer has stopped sending over it
+
+        Both ends may send over a connection, so closing it straight away
+        loses whatever the peer has in flight. Instead the retire frame is
+        sent after everything queued, and whoever dialed the connection
+        closes it once the peer has sent its own.
+
+        Args:
+            connection (_Client): The connection to close.
+            raw (_Conn): The connection as dialed or accepted.
+            dialed (bool): Whether we dialed the connection.
+        """
+
+        if self._retire_frame is None or self._tg is None:
+            await self._close(connection)
+            return
+
+        retired = self._retiring.setdefault(raw, Event())
+        self._tg.start_soon(self._retire_now, connection, raw, dialed, retired)
+
+    async def _retire_now(self, connection: QueuedConn, raw: _Conn, dialed: bool, retired: Event):
+        """Retires a connection, closing it once the peer has if we dialed it
+
+        Args:
+            connection (QueuedConn): The connection to retire.
+            raw (_Conn): The connection as dialed or accepted.
+            dialed (bool): Whether we dialed the connection.
+            retired (Event): Set once the peer has retired the connection.
+        """
+
+        try:
+            await connection.send(self._retire_frame)
+            await connection.drain()
+        except OSError as e:
+            # The peer can not be sending over it either
+            logger.debug(f"Unable to retire connection to {connection.addr}: {e!r}")
+            retired.set()
+
+        # Let the peer finish sending over connections we own
+        if dialed:
+            with move_on_after(self._retire_timeout):
+                await retired.wait()
+
+            self._retiring.pop(raw, None)
+
+        await self._close_now(connection)
+
+    async def _close_now(self, connection: _Client):
+        """Closes a connection, ignoring errors from already broken ones.
+
+        Args:
+            connection (_Client): The connection to close.
+        """
+
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.debug(f"Error closing connection to {connection.addr}: {e!r}")
+
+    async def clean(self):
         """Cleans the cache of all expired connections.
         """
 
-        # Loop through all connections
-        for key, (_, created_at, _) in self._cache.items():
-            
-            # If the time is larger than 60, remove the connection
-            if time.time() - created_at > 60:
-                del self._cache[key]
+        now = time.monotonic()
+
+        # Pop connections whose expiry time has passed
+        while self._expiry and self._expiry[0][0] <= now:
+            _, key = heapq.heappop(self._expiry)
+
+            # Skip connections that are already gone
+            if key not in self._cache:
+                continue
+
+            # If it was used since, check again later
+            expires = self._cache[key][1] + self._ttl
+            if expires > now:
+                heapq.heappush(self._expiry, (expires, key))
+                continue
+
+            # Otherwise, close it
+            self._evictions.labels("idle").inc()
+            await self._let_go(key)
+
+        # Forget failures long enough ago that the address would be dialed anyway
+        for addr, (_, retry_at) in list(self._failures.items()):
+            if retry_at + self._max_dial_backoff <= now:
+                del self._failures[addr]
     
-    def remove_oldest(self):
-        """Removes the oldest connection from the cache.
+    async def remove_oldest(self):
+        """Removes the least recently used connection from the cache.
         """
 
-        # Find the oldest connection
-        oldest_key = None
-        oldest_created_at = None
-        for key, (_, created_at, _) in self._cache.items():
-            if oldest_created_at is None or created_at < oldest_created_at:
-                oldest_key = key
-                oldest_created_at = created_at
-
         # Delete the oldest connection
-        if oldest_key is not None:
-            del self._cache[oldest_key]
\ No newline at end of file
+        if self._cache:
+            oldest_key = next(iter(self._cache))
+            self._evictions.labels("capacity").inc()
+            await self._let_go(oldest_key)
+
+    async def _let_go(self, handle: str):
+        """Removes a connection we are done with from the cache
+
+        Connections we dialed are retired, as the peer may be sending over
+        them. Inbound connections are only no longer sent over.
+
+        Args:
+            handle (str): The connection ID.
+        """
+
+        raw, dialed = self._cache[handle][3:5]
+        connection = self._evict(handle)
+
+        if dialed:
+            await self._retire(connection, raw, dialed)
+        else:
+            await self._close(connection)
+
+    def _queued_bytes(self) -> int:
+        """Counts the bytes waiting on every outbound queue
+
+        Returns:
+            int: The number of bytes
+        """
+
+        return sum(entry[0].pending for entry in self._cache.values() if isinstance(entry[0], QueuedConn))
@@ -0,0 +1,351 @@
+"""
+    Outbound queue wrapper for connections implementing _Conn.
+"""
+
+# Our parent class
+from ..proto._base import _Conn
+
+# Anyio
+from anyio import Event, move_on_after, TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus
+
+# Type hints
+from typing import Callable
+
+# Standard Library Imports
+from collections import deque
+
+# Logging
+from ..logger import logger
+
+
+# What to do with a message that does not fit in the queue
+BLOCK = "block" # Wait for the writer to make room
+DROP_NEWEST = "drop_newest" # Drop the message
+DROP_OLDEST = "drop_oldest" # Drop queued messages until it fits
+DISCONNECT = "disconnect" # Fail the connection
+
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, DISCONNECT)
+
+
+class QueuedConn(_Conn):
+    """
+        Connection wrapper that queues outbound data and writes it from a
+        dedicated task, coalescing everything pending into a single write.
+
+        The queue holds at most max_pending bytes, with the policy deciding
+        what happens to messages that do not fit. A message larger than the
+        whole queue is still accepted when the queue is empty.
+    """
+
+    _wraps: _Conn
+    _queue: deque[tuple[list[bytes], int]]
+    _queued_bytes: int
+    _wakeup: Event
+    _space: Event
+    _done: Event
+    _running: bool
+    _closing: bool
+    _error: Exception
+    _above_high_water: bool
+
+    max_batch: int
+    max_delay: float
+    max_pending: int
+    policy: str
+    high_water: int
+    on_high_water: Callable[["QueuedConn"], None]
+    on_drop: Callable[[int], None]
+
+    def __init__(self, wraps: _Conn, max_batch: int = 65536, max_delay: float = 0.0,
+        max_pending: int = None,
+        policy: str = BLOCK,
+        high_water: int = None,
+        on_high_water: Callable[["QueuedConn"], None] = None,
+        on_drop: Callable[[int], None] = None):
+        """Initialize the wrapper
+
+        Args:
+            wraps (_Conn): The connection to write to.
+            max_batch (int, optional): The maximum number of bytes to coalesce into one write. Defaults to 65536.
+            max_delay (float, optional): How long to wait for a batch to fill before writing it. Defaults to 0.0.
+            max_pending (int, optional): The most bytes queued at once. Defaults to None, for no limit.
+            policy (str, optional): What to do with messages that do not fit: block, drop_newest, drop_oldest or disconnect. Defaults to block.
+            high_water (int, optional): Queued bytes above which on_high_water is called. Defaults to None, never calling it.
+            on_high_water (Callable[[QueuedConn], None], optional): Called when the queue goes over its high-water mark, and again only once it has drained to half of it. Defaults to None.
+            on_drop (Callable[[int], None], optional): Called with the number of messages dropped, by the policy or because the writer failed. Defaults to None.
+        """
+
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send buffer policy {policy}, expected one of {', '.join(POLICIES)}")
+
+        # Save the wrapped connection
+        self._wraps = wraps
+
+        # Save the batching limits
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        # Save the queue limits
+        self.max_pending = max_pending
+        self.policy = policy
+        self.high_water = high_water
+        self.on_high_water = on_high_water
+        self.on_drop = on_drop
+
+        # Create the queue of messages, each a list of buffers and their size
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._above_high_water = False
+
+        # Writer state
+        self._wakeup = Event()
+        self._space = Event()
+        self._done = Event()
+        self._running = False
+        self._closing = False
+        self._error = None
+
+    @property
+    def addr(self) -> tuple[str, int]:
+        """The address on the other end of the pipe
+        """
+
+        return self._wraps.addr
+
+    @property
+    def pending(self) -> int:
+        """The number of bytes waiting to be written
+        """
+
+        return self._queued_bytes
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Run the writer until the connection is closed or fails.
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        # Mark that queued data will be written
+        self._running = True
+        task_status.started()
+
+        # Messages taken off the queue but not yet written
+        writing = 0
+
+        try:
+            while True:
+                # Wait for data to write
+                if not self._queue:
+                    if self._closing:
+                        break
+
+                    self._wakeup = Event()
+                    await self._wakeup.wait()
+                    continue
+
+                # Give small writes a chance to batch up
+                if self.max_delay > 0:
+                    with move_on_after(self.max_delay):
+                        while self._queued_bytes < self.max_batch and not self._closing:
+                            self._wakeup = Event()
+                            await self._wakeup.wait()
+
+                # Take everything pending, up to the batch size
+                batch, size = self._queue.popleft()
+                batch = list(batch)
+                writing = 1
+                while self._queue and size + self._queue[0][1] <= self.max_batch:
+                    buffers, length = self._queue.popleft()
+                    batch.extend(buffers)
+                    size += length
+                    writing += 1
+                self._taken(size)
+
+                # Write the batch
+                await self._wraps.send_many(batch)
+                writing = 0
+
+        except Exception as e:
+            # Remember the failure so senders see it
+            self._error = e
+
+            # Messages already accepted can no longer be written, so report them
+            lost = writing + len(self._queue)
+            logger.warning(f"Writer for {self.addr} stopped, dropping {lost} queued messages: {e!r}")
+            self._queue.clear()
+            self._taken(self._queued_bytes)
+            self._drop(lost)
+
+        finally:
+            self._running = False
+            self._done.set()
+
+            # Wake senders waiting for room, to see why there is none
+            self._space.set()
+
+    def _taken(self, size: int):
+        """Accounts for bytes leaving the queue, waking blocked senders
+
+        Args:
+            size (int): The number of bytes.
+        """
+
+        self._queued_bytes -= size
+        self._space.set()
+
+        if self._above_high_water and self.high_water is not None and self._queued_bytes <= self.high_water // 2:
+            self._above_high_water = False
+
+    def _drop(self, count: int):
+        """Reports messages that will not be written
+
+        Args:
+            count (int): The number of messages.
+        """
+
+        if self.on_drop is not None:
+            self.on_drop(count)
+
+    def fits(self, size: int) -> bool:
+        """Checks whether a message can be queued without waiting for room
+
+        Args:
+            size (int): The size of the message in bytes.
+
+        Returns:
+            bool: Whether sending it would return straight away.
+        """
+
+        return (self.policy != BLOCK or self.max_pending is None or not self._queue
+            or self._queued_bytes + size <= self.max_pending)
+
+    def _check(self):
+        """Raises if data can no longer be queued
+        """
+
+        # If the writer has failed, report it
+        if self._error is not None:
+            raise ConnectionError(f"Connection to {self.addr} has failed") from self._error
+
+        if self._closing:
+            raise ConnectionError(f"Connection to {self.addr} is closed")
+
+    async def _enqueue(self, buffers: list[bytes]):
+        """Queues a message for the writer, applying the queue's limits
+
+        Args:
+            buffers (list[bytes]): The message's buffers, in order.
+        """
+
+        size = sum(len(data) for data in buffers)
+
+        # Make room for the message, if it does not fit
+        limit = self.max_pending
+        if limit is not None:
+            if self.policy == BLOCK:
+                while self._queue and self._queued_bytes + size > limit:
+                    # Every blocked sender waits on the same event
+                    if self._space.is_set():
+                        self._space = Event()
+                    await self._space.wait()
+                    self._check()
+
+            elif self._queue and self._queued_bytes + size > limit:
+                if self.policy == DROP_NEWEST:
+                    self._drop(1)
+                    return
+
+                if self.policy == DROP_OLDEST:
+                    count = 0
+                    while self._queue and self._queued_bytes + size > limit:
+                        self._taken(self._queue.popleft()[1])
+                        count += 1
+                    self._drop(count)
+
+                else:
+                    # Give up on a peer that can not keep up
+                    self._error = ConnectionError(f"Send buffer for {self.addr} is full")
+                    self._drop(len(self._queue))
+                    self._queue.clear()
+                    self._taken(self._queued_bytes)
+                    self._wakeup.set()
+                    self._check()
+
+        # Queue the message and wake the writer
+        self._queue.append((buffers, size))
+        self._queued_bytes += size
+        self._wakeup.set()
+
+        # Report going over the high-water mark once, until we drain
+        if (self.high_water is not None and not self._above_high_water
+                and self._queued_bytes > self.high_water):
+            self._above_high_water = True
+            if self.on_high_water is not None:
+                await self.on_high_water(self)
+
+    async def recv(self, max_bytes: int = 35536) -> bytes:
+        """Receive data overthe connection.
+
+        Args:
+            max_bytes (int, optional): Maximum number of bytes to receive. Defaults to 35536.
+
+        Returns:
+            bytes: Data received over the connection.
+        """
+
+        return await self._wraps.recv(max_bytes)
+
+    async def send(self, data: bytes):
+        """Queue data to be sent over the connection.
+
+        Args:
+            data (bytes): Data to send.
+        """
+
+        self._check()
+
+        # If there is no writer, send directly
+        if not self._running:
+            await self._wraps.send(data)
+            return
+
+        await self._enqueue([data])
+
+    async def send_many(self, buffers: list[bytes]):
+        """Queue several buffers to be sent over the connection, as one message.
+
+        Args:
+            buffers (list[bytes]): Buffers to send, in order.
+        """
+
+        self._check()
+
+        # If there is no writer, send directly
+        if not self._running:
+            await self._wraps.send_many(buffers)
+            return
+
+        await self._enqueue(buffers)
+
+    async def drain(self):
+        """Stop queueing data, and wait for what is queued to be written
+        """
+
+        # Tell the writer to finish
+        self._closing = True
+        self._wakeup.set()
+
+        # Wait for queued data to be written
+        if self._running:
+            await self._done.wait()
+
+    async def close(self):
+        """Flush queued data and close the connection
+        """
+
+        await self.drain()
+
+        await self._wraps.close()
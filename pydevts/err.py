@@ -1,8 +1,14 @@
-class ConnectionNotFound(Exception):
+class ConnectionNotFound(ConnectionError):
+    ...
+
+class FrameTooLarge(ConnectionError):
     ...
 
 class NodeNotFound(Exception):
     ...
 
 class EventNotFound(Exception):
+    ...
+
+class RemoteError(Exception):
     ...
\ No newline at end of file
@@ -5,15 +5,15 @@
 # P2P Connection
 from .p2p import P2PConnection
 
-# Serialization
-from .msg import MsgName
-
 # Type hints
 from typing import Callable
 
 # Errors
 from .err import EventNotFound
 
+# Emit results
+from .routing import EmitResult
+
 class P2PEventSystem(P2PConnection):
     """
         Event system for P2P connections
@@ -43,35 +43,34 @@ class P2PEventSystem(P2PConnection):
         # Just set the handler
         self.event_handlers[name] = handler
 
-    async def _on_data(self, node: str, data: bytes):
+    async def _on_data(self, node: str, name: str, sent_data: bytes):
         """Handle data received
 
         Args:
-            data (bytes): The data received.
+            node (str): The node that sent the event.
+            name (str): The name of the event.
+            sent_data (bytes): The data received.
         """
 
-        # Deserialize the data
-        name, sent_data = MsgName.loads(data)
-
         # Send to registered handler
         if name in self.event_handlers.keys():
             await self.event_handlers[name](node, sent_data)
         else:
             raise EventNotFound(f"Event {name} not found")
     
-    async def emit(self, name: str, data: bytes):
+    async def emit(self, name: str, data: bytes) -> EmitResult:
         """Send event to all peers
 
         Args:
             name (str): The name of the event to send.
             data (bytes): The data to send.
-        """
 
-        # Serialize the data
-        send_data = MsgName.dumps(name, data)
+        Returns:
+            EmitResult: Which peers the event was queued for, and which are still being sent to in the background
+        """
 
         # Delegate to the underlying P2PConnection
-        await super().emit(send_data)
+        return await super().emit(data, name)
     
     async def send_to(self, node: str, name: str, data: bytes):
         """Send event to a specific node
@@ -82,9 +81,5 @@ class P2PEventSystem(P2PConnection):
             data (bytes): The data to send.
         """
 
-        # Serialize the data
-        send_data = MsgName.dumps(name, data)
-        
-
         # Delegate to the underlying P2PConnection
-        await super().send_to(node, send_data)
+        await super().send_to(node, data, name)
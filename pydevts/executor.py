@@ -0,0 +1,165 @@
+"""
+    Runs event handlers off the event loop, in threads or processes.
+"""
+
+# Anyio
+from anyio import to_thread, CapacityLimiter
+
+# Standard Library Imports
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable
+import os
+
+# Shared memory that tolerates views outliving it
+from .proto.shm import _SharedMemory
+
+
+# Execution modes for event handlers
+LOOP = "loop" # On the event loop, for handlers that mostly await
+THREAD = "thread" # In a thread, for blocking handlers and code that releases the GIL
+PROCESS = "process" # In another process, for CPU-bound handlers
+
+MODES = (LOOP, THREAD, PROCESS)
+
+
+def _call_shared(handler: Callable[[str, bytes], None], sender: str, name: str, size: int):
+    """Calls a handler in a worker process with a payload in shared memory
+
+    Args:
+        handler (Callable[[str, bytes], None]): The handler.
+        sender (str): The node that sent the event.
+        name (str): The name of the shared memory block holding the payload.
+        size (int): The size of the payload.
+    """
+
+    # Workers share the parent's resource tracker, so the parent's unlink covers this too
+    shm = _SharedMemory(name)
+
+    try:
+        with shm.buf[:size] as data:
+            return handler(sender, data)
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # The handler kept a view of the payload, which stays mapped until the view goes
+            pass
+
+
+class HandlerExecutor:
+    """
+        The threads and processes a node runs its handlers in.
+    """
+
+    max_threads: int
+    max_processes: int
+    shm_threshold: int
+    _threads: CapacityLimiter
+    _processes: CapacityLimiter
+    _pool: ProcessPoolExecutor
+
+    def __init__(self, max_threads: int = None, max_processes: int = None, shm_threshold: int = 65536):
+        """Initialize the executor
+
+        Args:
+            max_threads (int, optional): The maximum number of handlers run in threads at once. Defaults to the number of CPUs plus four, at most 32.
+            max_processes (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            shm_threshold (int, optional): Payloads at least this large are passed to processes in shared memory instead of being pickled. Defaults to 65536.
+        """
+
+        cpus = os.cpu_count() or 1
+
+        self.max_threads = max_threads if max_threads is not None else min(32, cpus + 4)
+        self.max_processes = max_processes if max_processes is not None else cpus
+        self.shm_threshold = shm_threshold
+
+        # Limiters are created once we are on the event loop
+        self._threads = None
+        self._processes = None
+
+        # Worker processes are started when first needed
+        self._pool = None
+
+    async def run_thread(self, handler: Callable[[str, bytes], None], sender: str, data: bytes):
+        """Runs a handler in a thread
+
+        Args:
+            handler (Callable[[str, bytes], None]): The handler.
+            sender (str): The node that sent the event.
+            data (bytes): The data received.
+
+        Returns:
+            The value returned by the handler
+        """
+
+        if self._threads is None:
+            self._threads = CapacityLimiter(self.max_threads)
+
+        return await to_thread.run_sync(handler, sender, data, limiter=self._threads)
+
+    async def run_process(self, handler: Callable[[str, bytes], None], sender: str, data: bytes):
+        """Runs a handler in a worker process
+
+        The handler must be picklable, such as a function defined at the top
+        level of a module. Workers are spawned, so the main module must guard
+        its entry point with `if __name__ == "__main__":`. Large payloads are
+        handed over in shared memory as a memoryview, which handlers should
+        copy with bytes() rather than keep views of past returning.
+
+        Args:
+            handler (Callable[[str, bytes], None]): The handler.
+            sender (str): The node that sent the event.
+            data (bytes): The data received.
+
+        Returns:
+            The value returned by the handler
+        """
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_processes, mp_context=get_context("spawn"))
+            self._processes = CapacityLimiter(self.max_processes)
+
+        size = memoryview(data).nbytes
+
+        # Small payloads are cheaper to pickle
+        if size < self.shm_threshold:
+            if not isinstance(data, bytes):
+                data = bytes(data)
+
+            return await self._wait(self._pool.submit(handler, sender, data))
+
+        # Copy large payloads straight into shared memory
+        shm = SharedMemory(create=True, size=size)
+        try:
+            shm.buf[:size] = memoryview(data).cast("B")
+
+            return await self._wait(self._pool.submit(_call_shared, handler, sender, shm.name, size))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def _wait(self, future):
+        """Waits for a worker process to finish a call
+
+        Args:
+            future (Future): The pending call.
+
+        Returns:
+            The result of the call
+        """
+
+        try:
+            # Each waiting thread stands for one busy worker process
+            return await to_thread.run_sync(future.result, limiter=self._processes)
+        finally:
+            future.cancel()
+
+    def shutdown(self):
+        """Stops the worker processes
+        """
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
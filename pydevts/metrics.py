@@ -0,0 +1,626 @@
+"""
+    Runtime metrics, readable in-process and exportable as Prometheus text.
+"""
+
+# Anyio
+from anyio import create_tcp_listener, move_on_after, BrokenResourceError, EndOfStream, TASK_STATUS_IGNORED
+from anyio.abc import SocketStream, TaskStatus
+
+# Standard Library Imports
+from bisect import bisect_left
+from typing import Callable
+
+# Logging
+from .logger import logger
+
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value for the Prometheus text format
+    """
+
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: tuple[str], values: tuple[str], extra: str = "") -> str:
+    """Formats a set of labels for the Prometheus text format
+    """
+
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    """Formats a sample value for the Prometheus text format
+    """
+
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+        Base class for metrics, holding one child per set of label values.
+    """
+
+    kind: str # The Prometheus type of the metric
+    name: str
+    help: str
+    labelnames: tuple[str]
+    _children: dict[tuple, object]
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str] = ()):
+        """Initialize the metric
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+        """
+
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = dict()
+
+        # Unlabelled metrics have a single child
+        if not self.labelnames:
+            self._children[()] = self._child()
+
+    def _child(self):
+        """Creates the child holding the value for one set of labels
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    def labels(self, *values):
+        """Gets the child for a set of label values, creating it if needed
+
+        Args:
+            *values: The label values, in the order of the label names
+
+        Returns:
+            The child, which is updated like an unlabelled metric
+        """
+
+        try:
+            return self._children[values]
+        except KeyError:
+            pass
+
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes labels {self.labelnames}, got {values}")
+
+        child = self._children[values] = self._child()
+
+        return child
+
+    def remove(self, *values):
+        """Stops reporting a set of label values
+
+        Args:
+            *values: The label values, in the order of the label names
+        """
+
+        self._children.pop(values, None)
+
+    def remove_matching(self, **labels):
+        """Stops reporting every set of label values matching some labels
+
+        Args:
+            **labels: The label values to match, by label name
+        """
+
+        positions = [(self.labelnames.index(name), value) for name, value in labels.items()]
+
+        for values in list(self._children.keys()):
+            if all(values[i] == value for i, value in positions):
+                del self._children[values]
+
+    def samples(self) -> dict:
+        """The current values of the metric
+
+        Returns:
+            dict: The values by tuple of label values
+        """
+
+        return {values: child.get() for values, child in self._children.items()}
+
+    def export(self) -> list[str]:
+        """Formats the metric for the Prometheus text format
+
+        Returns:
+            list[str]: The lines describing the metric
+        """
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}")
+
+        return lines
+
+
+class _CounterChild:
+    """
+        The value of a counter for one set of labels.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        """Increments the counter
+
+        Args:
+            amount (float, optional): The amount to increment by. Defaults to 1.
+        """
+
+        self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    """
+        A value that only goes up, such as a number of messages sent.
+    """
+
+    kind = "counter"
+
+    def _child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        """Increments an unlabelled counter
+
+        Args:
+            amount (float, optional): The amount to increment by. Defaults to 1.
+        """
+
+        self._children[()].inc(amount)
+
+    def get(self) -> float:
+        """The value of an unlabelled counter
+        """
+
+        return self._children[()].get()
+
+
+class _GaugeChild:
+    """
+        The value of a gauge for one set of labels.
+    """
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value: float):
+        """Sets the gauge
+
+        Args:
+            value (float): The new value
+        """
+
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        """Increments the gauge
+
+        Args:
+            amount (float, optional): The amount to increment by. Defaults to 1.
+        """
+
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        """Decrements the gauge
+
+        Args:
+            amount (float, optional): The amount to decrement by. Defaults to 1.
+        """
+
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Computes the gauge when it is read, instead of storing it
+
+        Args:
+            function (Callable[[], float]): Returns the current value
+        """
+
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """
+        A value that goes up and down, such as a queue depth.
+    """
+
+    kind = "gauge"
+
+    def _child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        """Sets an unlabelled gauge
+
+        Args:
+            value (float): The new value
+        """
+
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1):
+        """Increments an unlabelled gauge
+
+        Args:
+            amount (float, optional): The amount to increment by. Defaults to 1.
+        """
+
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1):
+        """Decrements an unlabelled gauge
+
+        Args:
+            amount (float, optional): The amount to decrement by. Defaults to 1.
+        """
+
+        self._children[()].dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Computes an unlabelled gauge when it is read
+
+        Args:
+            function (Callable[[], float]): Returns the current value
+        """
+
+        self._children[()].set_function(function)
+
+    def get(self) -> float:
+        """The value of an unlabelled gauge
+        """
+
+        return self._children[()].get()
+
+
+class _SummaryChild:
+    """
+        The count and sum of observations of a summary for one set of labels.
+    """
+
+    __slots__ = ("sum", "count")
+
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1):
+        """Records an observation
+
+        Args:
+            value (float): The observed value
+            count (int, optional): How many times it was observed. Defaults to 1.
+        """
+
+        self.sum += value * count
+        self.count += count
+
+    def get(self) -> dict:
+        return {"sum": self.sum, "count": self.count}
+
+
+class Summary(_Metric):
+    """
+        A count and total of observed values, such as messages and their bytes.
+    """
+
+    kind = "summary"
+
+    def _child(self) -> _SummaryChild:
+        return _SummaryChild()
+
+    def observe(self, value: float):
+        """Records an observation in an unlabelled summary
+
+        Args:
+            value (float): The observed value
+        """
+
+        self._children[()].observe(value)
+
+    def export(self) -> list[str]:
+        """Formats the metric for the Prometheus text format
+
+        Returns:
+            list[str]: The lines describing the metric
+        """
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for values, child in list(self._children.items()):
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+
+        return lines
+
+
+class _HistogramChild:
+    """
+        The observations of a histogram for one set of labels.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Records an observation
+
+        Args:
+            value (float): The observed value
+        """
+
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get(self) -> dict:
+        # Buckets are cumulative, ending with +Inf
+        buckets = dict()
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets[bound] = total
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class Histogram(_Metric):
+    """
+        A distribution of observed values, such as handler latencies.
+    """
+
+    kind = "histogram"
+    buckets: tuple[float]
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str] = (), buckets: tuple[float] = DEFAULT_BUCKETS):
+        """Initialize the histogram
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+            buckets (tuple[float], optional): The upper bounds of the buckets. Defaults to DEFAULT_BUCKETS.
+        """
+
+        self.buckets = tuple(sorted(buckets))
+
+        super().__init__(name, help, labelnames)
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        """Records an observation in an unlabelled histogram
+
+        Args:
+            value (float): The observed value
+        """
+
+        self._children[()].observe(value)
+
+    def export(self) -> list[str]:
+        """Formats the metric for the Prometheus text format
+
+        Returns:
+            list[str]: The lines describing the metric
+        """
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for values, child in list(self._children.items()):
+            sample = child.get()
+
+            for bound, count in sample["buckets"].items():
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(sample['sum'])}")
+            lines.append(f"{self.name}_count{labels} {sample['count']}")
+
+        return lines
+
+
+class Registry:
+    """
+        A collection of metrics, readable in-process and over HTTP.
+    """
+
+    _metrics: dict[str, _Metric]
+
+    def __init__(self):
+        """Initialize the registry
+        """
+
+        self._metrics = dict()
+
+    def _register(self, cls: type, name: str, *args, **kwargs) -> _Metric:
+        """Gets a metric, creating it if it does not exist
+
+        Args:
+            cls (type): The type of the metric
+            name (str): The name of the metric
+            *args, **kwargs: Passed to the metric when it is created
+
+        Returns:
+            _Metric: The metric
+        """
+
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str] = ()) -> Counter:
+        """Gets or creates a counter
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+
+        Returns:
+            Counter: The counter
+        """
+
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str] = ()) -> Gauge:
+        """Gets or creates a gauge
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+
+        Returns:
+            Gauge: The gauge
+        """
+
+        return self._register(Gauge, name, help, labelnames)
+
+    def summary(self, name: str, help: str, labelnames: tuple[str] = ()) -> Summary:
+        """Gets or creates a summary
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+
+        Returns:
+            Summary: The summary
+        """
+
+        return self._register(Summary, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str] = (), buckets: tuple[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Gets or creates a histogram
+
+        Args:
+            name (str): The name of the metric
+            help (str): A description of the metric
+            labelnames (tuple[str], optional): The names of the metric's labels. Defaults to ().
+            buckets (tuple[float], optional): The upper bounds of the buckets. Defaults to DEFAULT_BUCKETS.
+
+        Returns:
+            Histogram: The histogram
+        """
+
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def get(self, name: str) -> _Metric:
+        """Gets a registered metric
+
+        Args:
+            name (str): The name of the metric
+
+        Returns:
+            _Metric: The metric, or None if it is not registered
+        """
+
+        return self._metrics.get(name)
+
+    def snapshot(self) -> dict[str, dict]:
+        """The current values of every metric
+
+        Returns:
+            dict[str, dict]: The values of each metric by tuple of label values
+        """
+
+        return {name: metric.samples() for name, metric in self._metrics.items()}
+
+    def export(self) -> str:
+        """Formats every metric in the Prometheus text format
+
+        Returns:
+            str: The exposition text
+        """
+
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.export())
+
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9100, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Serves the metrics over HTTP for Prometheus to scrape
+
+        Args:
+            host (str, optional): The host to listen on. Defaults to "127.0.0.1".
+            port (int, optional): The port to listen on. Defaults to 9100.
+
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        listener = await create_tcp_listener(local_host=host, local_port=port)
+
+        logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+        task_status.started()
+
+        async with listener:
+            await listener.serve(self._handle)
+
+    async def _handle(self, stream: SocketStream):
+        """Answers one scrape
+
+        Args:
+            stream (SocketStream): The connection from the scraper
+        """
+
+        async with stream:
+            try:
+                # Read the request headers, which we do not need
+                request = b""
+                with move_on_after(5):
+                    while b"\r\n\r\n" not in request and len(request) < 8192:
+                        request += await stream.receive()
+
+                body = self.export().encode()
+
+                await stream.send(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                    b"Connection: close\r\n\r\n" + body
+                )
+            except (EndOfStream, BrokenResourceError, OSError):
+                # The scraper went away
+                pass
@@ -2,5 +2,7 @@
     Implements different message serialization methods.
 """
 
-from .num_type import MsgNum
-from .name_type import MsgName
\ No newline at end of file
+from .num_type import MsgNum, MsgNumReader, MAX_FRAME_SIZE, own
+from .name_type import MsgName
+from .compress import Compressor, CompressionStats, register_codec
+from .envelope import EnvelopePacker, EnvelopeUnpacker
\ No newline at end of file
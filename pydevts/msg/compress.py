@@ -0,0 +1,326 @@
+"""
+    Per-frame payload compression.
+"""
+
+# Serialization
+from .num_type import MsgNum
+from .envelope import frame_length
+
+# Standard Library Imports
+import struct
+import time
+import zlib
+
+
+# Set on the type of frames whose payload is compressed
+COMPRESSED = 0x80
+
+
+class _Codec:
+    """
+        Base class for compression codecs.
+    """
+
+    name: str # The name peers advertise the codec by
+    codec_id: int # The ID written in front of compressed payloads
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses data
+
+        Args:
+            data (bytes): The data to compress
+
+        Returns:
+            bytes: The compressed data
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    def compress_many(self, buffers: list[bytes]) -> list[bytes]:
+        """Compresses several buffers as though they were one
+
+        Args:
+            buffers (list[bytes]): The data to compress, in order
+
+        Returns:
+            list[bytes]: The compressed data, in order
+        """
+
+        return [self.compress(b"".join(buffers))]
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompresses data
+
+        Args:
+            data (bytes): The compressed data
+
+        Returns:
+            bytes: The original data
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+
+class ZlibCodec(_Codec):
+    """
+        Compression using the standard library's zlib.
+    """
+
+    name = "zlib"
+    codec_id = 1
+
+    def __init__(self, level: int = 1):
+        """Initialize the codec
+
+        Args:
+            level (int, optional): The zlib compression level. Defaults to 1.
+        """
+
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses data
+
+        Args:
+            data (bytes): The data to compress
+
+        Returns:
+            bytes: The compressed data
+        """
+
+        return zlib.compress(data, self.level)
+
+    def compress_many(self, buffers: list[bytes]) -> list[bytes]:
+        """Compresses several buffers as though they were one, without joining them
+
+        Args:
+            buffers (list[bytes]): The data to compress, in order
+
+        Returns:
+            list[bytes]: The compressed data, in order
+        """
+
+        compressor = zlib.compressobj(self.level)
+        chunks = [compressor.compress(data) for data in buffers]
+        chunks.append(compressor.flush())
+
+        return [chunk for chunk in chunks if chunk]
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompresses data
+
+        Args:
+            data (bytes): The compressed data
+
+        Returns:
+            bytes: The original data
+        """
+
+        return zlib.decompress(data)
+
+
+# Codecs available by name
+CODECS: dict[str, _Codec] = {
+    ZlibCodec.name: ZlibCodec()
+}
+
+
+def register_codec(codec: _Codec):
+    """Makes a codec available for negotiation
+
+    Args:
+        codec (_Codec): The codec to register
+    """
+
+    CODECS[codec.name] = codec
+
+
+class CompressionStats:
+    """
+        Counters for tuning the compression threshold against its cost.
+    """
+
+    compressed: int # Frames sent compressed
+    skipped: int # Frames sent uncompressed because they were small or incompressible
+    bytes_in: int # Payload bytes given to codecs
+    bytes_out: int # Payload bytes produced by codecs
+    compress_time: float # Seconds spent compressing
+    decompressed: int # Frames received compressed
+    decompress_time: float # Seconds spent decompressing
+
+    def __init__(self):
+        """Initialize the counters
+        """
+
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompressed = 0
+        self.decompress_time = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """The ratio of compressed to original size, over all compressed frames
+        """
+
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+    def __repr__(self) -> str:
+        return (f"CompressionStats(compressed={self.compressed}, skipped={self.skipped}, "
+            f"ratio={self.ratio:.3f}, compress_time={self.compress_time:.6f}, "
+            f"decompressed={self.decompressed}, decompress_time={self.decompress_time:.6f})")
+
+
+class Compressor:
+    """
+        Compresses and decompresses MsgNum frames with negotiated codecs.
+    """
+
+    codecs: list[str]
+    threshold: int
+    stats: CompressionStats
+    _by_id: dict[int, _Codec]
+
+    def __init__(self, codecs: list[str] = (), threshold: int = 1024):
+        """Initialize the compressor
+
+        Args:
+            codecs (list[str], optional): The codecs we accept, in order of preference. Defaults to (), for none.
+            threshold (int, optional): Payloads smaller than this are sent uncompressed. Defaults to 1024.
+        """
+
+        # Only keep codecs we actually have
+        self.codecs = [name for name in codecs if name in CODECS]
+        self.threshold = threshold
+        self.stats = CompressionStats()
+
+        self._by_id = {CODECS[name].codec_id: CODECS[name] for name in self.codecs}
+
+    def choose(self, peer_codecs: list[str]) -> str:
+        """Chooses the codec to use when sending to a peer
+
+        Args:
+            peer_codecs (list[str]): The codecs the peer accepts
+
+        Returns:
+            str: The name of our most preferred codec the peer accepts, or None
+        """
+
+        if not peer_codecs:
+            return None
+
+        for name in self.codecs:
+            if name in peer_codecs:
+                return name
+
+        return None
+
+    def dumps(self, message_type: int, data: bytes, codec: str = None) -> bytes:
+        """Serializes a frame, compressing it if worthwhile
+
+        Args:
+            message_type (int): The type of message being sent
+            data (bytes): The data in that message
+            codec (str, optional): The codec the receiver accepts, or None to send uncompressed. Defaults to None.
+
+        Returns:
+            bytes: The serialized frame
+        """
+
+        # Send small payloads as they are
+        if codec is None or len(data) < self.threshold:
+            self.stats.skipped += 1
+            return MsgNum.dumps(message_type, data)
+
+        codec = CODECS[codec]
+
+        started = time.perf_counter()
+        compressed = codec.compress(data)
+        self.stats.compress_time += time.perf_counter() - started
+
+        # Send incompressible payloads as they are
+        if len(compressed) + 1 >= len(data):
+            self.stats.skipped += 1
+            return MsgNum.dumps(message_type, data)
+
+        self.stats.compressed += 1
+        self.stats.bytes_in += len(data)
+        self.stats.bytes_out += len(compressed) + 1
+
+        return MsgNum.dumps(message_type | COMPRESSED, bytes((codec.codec_id,)) + compressed)
+
+    def compress(self, frame: bytes, codec: str = None) -> list[bytes]:
+        """Compresses an already serialized frame if worthwhile
+
+        The payload is compressed from the frame's buffers where they are,
+        and the result is returned as separate buffers, so nothing is copied
+        but the compressed data.
+
+        Args:
+            frame (bytes): The serialized frame, or a list of its buffers
+            codec (str, optional): The codec the receiver accepts, or None to send uncompressed. Defaults to None.
+
+        Returns:
+            list[bytes]: The buffers of the compressed frame, or the original frame
+        """
+
+        # Frames may be made of several buffers
+        size = frame_length(frame) if isinstance(frame, list) else len(frame)
+
+        # Leave small frames untouched rather than reserializing them
+        if codec is None or size - MsgNum._size < self.threshold:
+            self.stats.skipped += 1
+            return frame
+
+        # The header is at the start of the first buffer, and the payload follows
+        buffers = frame if isinstance(frame, list) else [frame]
+        if len(buffers[0]) < MsgNum._size:
+            buffers = [b"".join(buffers)]
+
+        message_type, _ = struct.unpack_from(MsgNum._fmt, buffers[0])
+        payload = [memoryview(buffers[0])[MsgNum._size:], *buffers[1:]]
+
+        codec = CODECS[codec]
+
+        started = time.perf_counter()
+        compressed = codec.compress_many(payload)
+        self.stats.compress_time += time.perf_counter() - started
+
+        # Send incompressible payloads as they are
+        length = sum(len(chunk) for chunk in compressed) + 1
+        if length >= size - MsgNum._size:
+            self.stats.skipped += 1
+            return frame
+
+        self.stats.compressed += 1
+        self.stats.bytes_in += size - MsgNum._size
+        self.stats.bytes_out += length
+
+        return [MsgNum.header(message_type | COMPRESSED, length) + bytes((codec.codec_id,)), *compressed]
+
+    def loads(self, message_type: int, data: bytes) -> tuple[int, bytes]:
+        """Decompresses a frame's payload if it is compressed
+
+        Args:
+            message_type (int): The type of the frame, including the compression flag
+            data (bytes): The payload of the frame
+
+        Returns:
+            tuple[int, bytes]: The message type without the flag, and the original payload
+        """
+
+        if not message_type & COMPRESSED:
+            return message_type, data
+
+        codec = self._by_id.get(data[0])
+        if codec is None:
+            raise ValueError(f"Received frame compressed with unknown codec {data[0]}")
+
+        started = time.perf_counter()
+        data = codec.decompress(data[1:])
+        self.stats.decompress_time += time.perf_counter() - started
+        self.stats.decompressed += 1
+
+        return message_type & ~COMPRESSED, data
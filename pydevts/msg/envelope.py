@@ -0,0 +1,218 @@
+"""
+    Envelopes for data messages, carrying the frame header, message kind,
+    sender and event name in a single header in front of the payload.
+"""
+
+# Serialization
+import struct
+
+
+# Message kinds
+EVENT = 0
+REQUEST = 1 # An event whose handler's return value is sent back
+RESPONSE = 2 # The return value of a request's handler
+ERROR = 3 # A request's handler failed, and the payload describes why
+
+# Set on the kind of envelopes that carry the receiver's numeric event ID instead of a name
+BY_ID = 0x80
+
+
+class Envelope:
+    """
+        Layout of an enveloped data frame.
+    """
+
+    _fmt = "!BQBBH" # frame type, frame length, kind, sender length, name length or event ID
+    _size = struct.calcsize(_fmt)
+
+    _body_fmt = "!BBH" # kind, sender length, name length or event ID
+    _body_size = struct.calcsize(_body_fmt)
+
+    _request_fmt = "!Q" # request ID, after the name of every kind but EVENT
+    _request_size = struct.calcsize(_request_fmt)
+
+    # The MsgNum type of enveloped frames
+    frame_type = 3
+
+
+class EnvelopePacker:
+    """
+        Packs data messages sent by one node into envelopes.
+    """
+
+    _sender: bytes
+    _names: dict[str, bytes]
+    _max_names: int
+
+    def __init__(self, sender: str, max_names: int = 4096):
+        """Initialize the packer
+
+        Args:
+            sender (str): The ID of the sending node
+            max_names (int, optional): The number of encoded event names to keep. Defaults to 4096.
+        """
+
+        self._sender = sender.encode()
+        self._names = dict()
+        self._max_names = max_names
+
+    def _name(self, name: str) -> bytes:
+        """Encodes an event name, reusing earlier encodings
+
+        Args:
+            name (str): The event name
+
+        Returns:
+            bytes: The encoded name
+        """
+
+        encoded = self._names.get(name)
+
+        if encoded is None:
+            encoded = name.encode()
+
+            if len(self._names) < self._max_names:
+                self._names[name] = encoded
+
+        return encoded
+
+    def pack(self, name: str, payload: bytes, kind: int = EVENT, request_id: int = 0) -> list[bytes]:
+        """Packs a message into an envelope without copying the payload
+
+        The payload must not be modified until the envelope has been sent.
+
+        Args:
+            name (str): The event name, or an empty string
+            payload (bytes): The payload, as bytes, bytearray or memoryview
+            kind (int, optional): The kind of message. Defaults to EVENT.
+            request_id (int, optional): The request the message belongs to, for kinds other than EVENT. Defaults to 0.
+
+        Returns:
+            list[bytes]: The header and the payload, to be written in order
+        """
+
+        name = self._name(name)
+
+        return self._pack(kind, len(name), name, payload, request_id)
+
+    def pack_id(self, event_id: int, payload: bytes, kind: int = EVENT, request_id: int = 0) -> list[bytes]:
+        """Packs a message for one receiver, naming the event by the receiver's ID for it
+
+        Args:
+            event_id (int): The receiver's ID for the event
+            payload (bytes): The payload, as bytes, bytearray or memoryview
+            kind (int, optional): The kind of message. Defaults to EVENT.
+            request_id (int, optional): The request the message belongs to, for kinds other than EVENT. Defaults to 0.
+
+        Returns:
+            list[bytes]: The header and the payload, to be written in order
+        """
+
+        return self._pack(kind | BY_ID, event_id, b"", payload, request_id)
+
+    def _pack(self, kind: int, name_field: int, name: bytes, payload: bytes, request_id: int) -> list[bytes]:
+        """Packs the header of an envelope
+
+        Args:
+            kind (int): The kind of message, including flags
+            name_field (int): The name length or event ID
+            name (bytes): The encoded name, if it is sent
+            payload (bytes): The payload, as bytes, bytearray or memoryview
+            request_id (int): The request the message belongs to
+
+        Returns:
+            list[bytes]: The header and the payload, to be written in order
+        """
+
+        # Measure the payload in bytes
+        if not isinstance(payload, bytes):
+            payload = memoryview(payload).cast("B")
+
+        # Messages belonging to requests carry the request ID after the name
+        if kind & ~BY_ID != EVENT:
+            name = name + struct.pack(Envelope._request_fmt, request_id)
+
+        header = struct.pack(
+            Envelope._fmt,
+            Envelope.frame_type,
+            Envelope._body_size + len(self._sender) + len(name) + len(payload),
+            kind,
+            len(self._sender),
+            name_field
+        ) + self._sender + name
+
+        return [header, payload]
+
+
+class EnvelopeUnpacker:
+    """
+        Unpacks the payload of enveloped frames into views.
+    """
+
+    _senders: dict[bytes, str]
+    _max_senders: int
+
+    def __init__(self, max_senders: int = 4096):
+        """Initialize the unpacker
+
+        Args:
+            max_senders (int, optional): The number of decoded sender IDs to keep. Defaults to 4096.
+        """
+
+        self._senders = dict()
+        self._max_senders = max_senders
+
+    def unpack(self, data: bytes) -> tuple[int, str, str, int, memoryview]:
+        """Unpacks the payload of an enveloped frame
+
+        Args:
+            data (bytes): The payload of the frame, after its MsgNum header
+
+        Returns:
+            tuple[int, str, str, int, memoryview]: The kind, sender, event name or our numeric ID for it, request ID and a view of the payload
+        """
+
+        view = memoryview(data)
+        kind, sender_len, name_len = struct.unpack_from(Envelope._body_fmt, view, 0)
+
+        # Decode the sender, reusing earlier decodings
+        start = Envelope._body_size
+        raw = bytes(view[start:start + sender_len])
+        sender = self._senders.get(raw)
+        if sender is None:
+            sender = raw.decode()
+
+            if len(self._senders) < self._max_senders:
+                self._senders[raw] = sender
+
+        start += sender_len
+
+        # The event may be named by our ID for it
+        if kind & BY_ID:
+            kind &= ~BY_ID
+            name = name_len
+        else:
+            name = str(view[start:start + name_len], "utf-8")
+            start += name_len
+
+        # Plain events are not part of a request
+        if kind == EVENT:
+            return kind, sender, name, 0, view[start:]
+
+        request_id, = struct.unpack_from(Envelope._request_fmt, view, start)
+
+        return kind, sender, name, request_id, view[start + Envelope._request_size:]
+
+
+def frame_length(frame: list[bytes]) -> int:
+    """Measures a frame made of several buffers
+
+    Args:
+        frame (list[bytes]): The buffers of the frame
+
+    Returns:
+        int: The total length in bytes
+    """
+
+    return sum(len(buffer) for buffer in frame)
+
@@ -5,6 +5,13 @@
 # Serialization
 import struct
 
+# Errors
+from ..err import FrameTooLarge
+
+
+# The largest frame payload read from a peer unless told otherwise
+MAX_FRAME_SIZE = 1 << 26
+
 class MsgNum:
     """
         Serialization class for messages with a numbered type.
@@ -27,6 +34,20 @@ class MsgNum:
 
         return struct.pack(MsgNum._fmt, message_type, len(data)) + data
 
+    @staticmethod
+    def header(message_type: int, length: int) -> bytes:
+        """Serializes only the header, for payloads sent as separate buffers
+
+        Args:
+            message_type (int): The type of message being sent
+            length (int): The length of the payload
+
+        Returns:
+            bytes: The serialized header
+        """
+
+        return struct.pack(MsgNum._fmt, message_type, length)
+
     @staticmethod
     def loads(data: bytes) -> tuple[int, bytes]:
         """Deserializes bytes into a tuple of message type and data
@@ -41,3 +62,135 @@ class MsgNum:
         msg_type, msg_len = struct.unpack(MsgNum._fmt, data[:MsgNum._size])
         return msg_type, data[MsgNum._size:MsgNum._size + msg_len]
 
+
+class MsgNumReader:
+    """
+        Incremental reader for streams of MsgNum frames.
+    """
+
+    _header: bytearray
+    _frame: bytearray
+    _frame_type: int
+    _filled: int
+    max_frame_size: int
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        """Initialize the reader
+
+        Args:
+            max_frame_size (int, optional): The largest frame payload accepted, or None for no limit. Defaults to 64 MiB.
+        """
+
+        # Frame lengths come from the peer, so are checked before allocating
+        self.max_frame_size = max_frame_size
+
+        # Partially received header
+        self._header = bytearray()
+
+        # Partially received frame payload
+        self._frame = None
+        self._frame_type = 0
+        self._filled = 0
+
+    @property
+    def pending(self) -> int:
+        """The number of bytes held for incomplete frames
+
+        Returns:
+            int: The number of buffered bytes
+        """
+
+        return len(self._header) + self._filled
+
+    def feed(self, data: bytes) -> list[tuple[int, memoryview]]:
+        """Feeds a chunk of the stream into the reader
+
+        Frames that are complete within the chunk are returned as views
+        into the chunk. Frames that span several chunks are assembled in
+        a buffer that is allocated once at the frame's full size.
+
+        Args:
+            data (bytes): The chunk received from the stream
+
+        Raises:
+            FrameTooLarge: If a frame is longer than max_frame_size. The stream can not be read any further.
+
+        Returns:
+            list[tuple[int, memoryview]]: Every frame completed by this chunk, as tuples of message type and payload
+        """
+
+        frames = []
+        view = memoryview(data)
+        pos = 0
+        end = len(view)
+
+        while pos < end:
+
+            # If we are not in the middle of a frame, read a header
+            if self._frame is None:
+
+                # Fast path: the whole header is in this chunk
+                if not self._header and end - pos >= MsgNum._size:
+                    msg_type, msg_len = struct.unpack_from(MsgNum._fmt, view, pos)
+                    pos += MsgNum._size
+                else:
+                    # Buffer as much of the header as we can
+                    needed = MsgNum._size - len(self._header)
+                    self._header += view[pos:pos + needed]
+                    pos += min(needed, end - pos)
+
+                    # Wait for the rest of the header
+                    if len(self._header) < MsgNum._size:
+                        break
+
+                    msg_type, msg_len = struct.unpack(MsgNum._fmt, self._header)
+                    self._header.clear()
+
+                if self.max_frame_size is not None and msg_len > self.max_frame_size:
+                    raise FrameTooLarge(f"Frame of {msg_len} bytes is over the limit of {self.max_frame_size}")
+
+                # If the payload is already here, slice it without copying
+                if end - pos >= msg_len:
+                    frames.append((msg_type, view[pos:pos + msg_len]))
+                    pos += msg_len
+                    continue
+
+                # Otherwise, allocate the frame and start filling it
+                self._frame = bytearray(msg_len)
+                self._frame_type = msg_type
+                self._filled = 0
+
+            # Copy as much of the payload as this chunk holds
+            count = min(len(self._frame) - self._filled, end - pos)
+            self._frame[self._filled:self._filled + count] = view[pos:pos + count]
+            self._filled += count
+            pos += count
+
+            # If the frame is complete, hand it off
+            if self._filled == len(self._frame):
+                frames.append((self._frame_type, memoryview(self._frame)))
+                self._frame = None
+                self._filled = 0
+
+        return frames
+
+
+def own(data: bytes) -> bytes:
+    """Copies data that borrows a buffer owned by someone else
+
+    Frames received over sockets own their buffers, so only views into
+    other buffers, such as a shared memory transport's ring, are copied.
+    Received data must be owned before it is kept past the handler it
+    was passed to.
+
+    Args:
+        data (bytes): The data.
+
+    Returns:
+        bytes: The data, safe to keep.
+    """
+
+    if isinstance(data, memoryview) and not isinstance(data.obj, (bytes, bytearray)):
+        return bytes(data)
+
+    return data
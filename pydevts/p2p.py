@@ -5,14 +5,15 @@
 from .logger import logger
 
 # Anyio
-from anyio import create_task_group
+from anyio import create_task_group, TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus
 
 # Routers
 from .routing import PeerRouter
 
 # Type hints
 from .proto._base import _Conn, _Client, _Server
-from .routing._base import _Router
+from .routing._base import _Router, EmitResult
 from typing import Callable
 from .auth._base import _Auth
 
@@ -22,6 +23,9 @@ from .proto import TCPProto
 # Default authentication is no auth
 from .auth import AuthNone
 
+# Metrics
+from .metrics import Registry
+
 class P2PConnection:
     """Multipeer P2P communications
     """
@@ -36,19 +40,24 @@ class P2PConnection:
     handler: Callable[[_Conn], None]
     data_handlers: list[Callable[[str, bytes], None]]
     auth: _Auth
+    metrics: Registry
+    metrics_addr: tuple[str, int]
 
     def __init__(self, host: str = "0.0.0.0",
         port: int = 0,
         router: _Router = PeerRouter,
         protocol: tuple[_Client, _Conn, _Server] = TCPProto,
-        auth_method: _Auth = AuthNone()):
+        auth_method: _Auth = AuthNone(),
+        metrics_addr: tuple[str, int] = None):
         """Initialize P2PConnection
 
         Args:
             host (str, optional): The host to listen on. Defaults to "0.0.0.0".
             port (int, optional): The port to listen on. Defaults to 0.
             router (_Router, optional): The router to use. Defaults to PeerRouter.
+            protocol (tuple[_Client, _Conn, _Server], optional): The protocol to use, such as TCPProto, UnixProto for nodes on one host, or AutoProto for Unix sockets to nodes on this host and TCP to the rest. Defaults to TCPProto.
             auth_method (_Auth, optional): The authentication method to use. Defaults to AuthNone().
+            metrics_addr (tuple[str, int], optional): The address to serve Prometheus metrics on, or None to not serve them. Defaults to None.
         """
 
         
@@ -59,6 +68,10 @@ class P2PConnection:
         # Initialize router
         self.router = router(protocol)
 
+        # Share the router's metrics
+        self.metrics = self.router.metrics
+        self.metrics_addr = metrics_addr
+
         # Initialize server
         self.server = protocol[2](host, port, self.router.on_connection)
 
@@ -88,24 +101,45 @@ class P2PConnection:
         # Register the data handler
         await self.router.register_data_handler(self._on_data)
 
+        # Register the request handler
+        await self.router.register_request_handler(self._on_request)
+
+        # Register the system event handler
+        await self.router.register_sys_handler(self._on_sys)
+
         # Tell the router to enter the network
         await self.router.enter(
             self.entry_addr,
             self.addr
         )
     
-    async def run(self, *args, **kwargs):
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
         """Start running the server
         """
         
-        # Delegate to the server
-        await self.server.run(*args, **kwargs)
+        async with create_task_group() as tg:
+            # Start the router
+            await tg.start(self.router.run)
+
+            # Delegate to the server
+            await tg.start(self.server.run)
+
+            # Connect to peers up front, if the router is configured to
+            await self.router.warm_up()
+
+            # Serve metrics if asked to
+            if self.metrics_addr is not None:
+                await tg.start(self.metrics.serve, *self.metrics_addr)
+
+            task_status.started()
         
         
-    async def _on_data(self, node: str, data: bytes):
+    async def _on_data(self, node: str, name: str, data: bytes):
         """Handle data received
 
         Args:
+            node (str): The node that sent the data.
+            name (str): The name of the event the data belongs to.
             data (bytes): The data received.
         """
 
@@ -113,6 +147,29 @@ class P2PConnection:
         for handler in self.data_handlers:
             await handler(node, data)
     
+    async def _on_request(self, node: str, name: str, request_id: int, data: bytes):
+        """Handle a request received
+
+        Args:
+            node (str): The node that sent the request.
+            name (str): The name of the event the request is for.
+            request_id (int): The ID of the request.
+            data (bytes): The data received.
+        """
+
+        # Plain connections have nothing to answer with
+        await self.router.respond(node, request_id, b"Requests are not handled", error=True)
+
+    async def _on_sys(self, name: str, *args):
+        """Handle a system event reported by the router
+
+        Args:
+            name (str): The name of the system event.
+            *args: The arguments of the event.
+        """
+
+        pass
+    
     def register_data_handler(self, handler: Callable[[str, bytes], None]):
         """Register a handler for data received
         Args:
@@ -122,21 +179,41 @@ class P2PConnection:
         # Set the handler
         self.data_handlers.append(handler)
         
-    async def send_to(self, node: str, data: bytes):
+    async def send_to(self, node: str, data: bytes, name: str = ""):
         """Send data to node
         Args:
             node (str): The node to send data to
             data (bytes): The data to send
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
         """
 
         # Delegate to router
-        await self.router.send_to(node, data)
+        await self.router.send_to(node, data, name)
     
-    async def emit(self, data: bytes):
-        """Sends data to all nodes in the network
+    async def request(self, node: str, data: bytes, name: str = "", timeout: float = 30.0) -> bytes:
+        """Send a request to node, and wait for its response
         Args:
+            node (str): The node to send the request to
             data (bytes): The data to send
+            name (str, optional): The name of the event the request is for. Defaults to "".
+            timeout (float, optional): Seconds to wait for the response, or None to wait forever. Defaults to 30.0.
+
+        Returns:
+            bytes: The response
+        """
+
+        # Delegate to router
+        return await self.router.request(node, data, name, timeout)
+
+    async def emit(self, data: bytes, name: str = "") -> EmitResult:
+        """Sends data to every node in the network that handles it
+        Args:
+            data (bytes): The data to send
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
+
+        Returns:
+            EmitResult: Which peers the data was queued for, and which are still being sent to in the background
         """
 
         # Delegate to router
-        await self.router.emit(data)
\ No newline at end of file
+        return await self.router.emit(data, name)
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+    Matches hierarchical event names against wildcard subscriptions.
+
+    Event names are split into segments on dots. In a pattern, a "*"
+    segment matches any one segment, and a final "**" segment matches one
+    or more, so "orders.*" matches "orders.created" and "orders.**" also
+    matches "orders.eu.created".
+"""
+
+# Type hints
+from typing import Any, Hashable
+
+
+# Pattern segments
+ONE = "*" # Any one segment
+REST = "**" # One or more segments, only at the end
+
+
+def is_pattern(name: str) -> bool:
+    """Checks whether an event name has wildcards
+
+    Args:
+        name (str): The event name.
+
+    Returns:
+        bool: Whether it is a pattern rather than a single name.
+    """
+
+    return any(segment in (ONE, REST) for segment in name.split("."))
+
+
+class _Node:
+    """
+        A segment in the trie, with what follows it
+    """
+
+    __slots__ = ("children", "one", "rest", "values")
+
+    children: dict[str, "_Node"] # By the next literal segment
+    one: "_Node" # After a "*" segment
+    rest: list[tuple[int, Any]] # Values of patterns ending in "**" here
+    values: list[tuple[int, Any]] # Values of patterns ending here
+
+    def __init__(self):
+        self.children = dict()
+        self.one = None
+        self.rest = []
+        self.values = []
+
+
+class PatternIndex:
+    """
+        A trie of patterns, finding every pattern an event name matches in
+        time proportional to the length of the name, rather than to the
+        number of patterns. Matches are cached by name.
+    """
+
+    patterns: list[str]
+    max_cache: int
+    _root: _Node
+    _cache: dict[str, tuple]
+    _count: int
+
+    def __init__(self, max_cache: int = 4096):
+        """Initialize the index
+
+        Args:
+            max_cache (int, optional): The most names whose matches are remembered, or 0 to not remember any. Defaults to 4096.
+        """
+
+        self.patterns = []
+        self.max_cache = max_cache
+
+        self._root = _Node()
+        self._cache = dict()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def add(self, pattern: str, value: Hashable = None):
+        """Adds a pattern
+
+        Args:
+            pattern (str): The pattern.
+            value (Hashable, optional): What to return when a name matches it. Defaults to the pattern.
+        """
+
+        segments = pattern.split(".")
+        if REST in segments[:-1]:
+            raise ValueError(f"Pattern {pattern} may only end in {REST}")
+
+        # Walk to the pattern's last segment, creating nodes as we go
+        node = self._root
+        for segment in segments[:-1] if segments[-1] == REST else segments:
+            if segment == ONE:
+                if node.one is None:
+                    node.one = _Node()
+                node = node.one
+            else:
+                node = node.children.setdefault(segment, _Node())
+
+        # Values are returned in the order they were added
+        entry = (self._count, pattern if value is None else value)
+        self._count += 1
+
+        if segments[-1] == REST:
+            node.rest.append(entry)
+        else:
+            node.values.append(entry)
+
+        self.patterns.append(pattern)
+        self._cache.clear()
+
+    def match(self, name: str) -> tuple:
+        """Finds the patterns a name matches
+
+        Args:
+            name (str): The event name.
+
+        Returns:
+            tuple: The values of the matching patterns, in the order they were added.
+        """
+
+        found = self._cache.get(name)
+        if found is not None:
+            return found
+
+        entries = []
+        nodes = [self._root]
+
+        for segment in name.split("."):
+            following = []
+
+            for node in nodes:
+                # This segment and any after it are matched by "**"
+                entries.extend(node.rest)
+
+                child = node.children.get(segment)
+                if child is not None:
+                    following.append(child)
+                if node.one is not None:
+                    following.append(node.one)
+
+            nodes = following
+            if not nodes:
+                break
+
+        for node in nodes:
+            entries.extend(node.values)
+
+        entries.sort(key=lambda entry: entry[0])
+        found = tuple(value for _, value in entries)
+
+        # Forget everything rather than grow without bound
+        if len(self._cache) >= self.max_cache:
+            self._cache.clear()
+        if self.max_cache:
+            self._cache[name] = found
+
+        return found
@@ -1,4 +1,10 @@
 from .tcp import *
+from .unix import *
+from .auto import *
+from .shm import ShmConn, ShmClient, ShmServer
 
 
-TCPProto = [TCPClient, TCPConn, TCPServer]
\ No newline at end of file
+TCPProto = [TCPClient, TCPConn, TCPServer]
+UnixProto = [UnixClient, UnixConn, UnixServer]
+AutoProto = [AutoClient, TCPConn, AutoServer]
+ShmProto = [ShmClient, ShmConn, ShmServer]
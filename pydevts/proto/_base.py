@@ -43,6 +43,15 @@ class _Conn:
 
         raise NotImplementedError("This is an abstract class")
 
+    async def send_many(self, buffers: list[bytes]):
+        """Send several buffers over the connection in one write.
+
+        Args:
+            buffers (list[bytes]): Buffers to send, in order.
+        """
+
+        await self.send(b"".join(buffers))
+
 
     async def close(self):
         """Close the connection
@@ -0,0 +1,168 @@
+"""
+    Protocol that reaches nodes on the same host over Unix domain sockets,
+    and every other node over TCP.
+"""
+
+
+# Base Classes
+from ._base import _Conn, _Client, _Server
+from .tcp import TCPClient, TCPServer
+from .unix import UnixClient, UnixServer, socket_path
+
+
+# Anyio
+from anyio import create_task_group, to_thread, TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus
+
+# Type hints
+from typing import Callable
+
+# Logging
+from ..logger import logger
+
+# Standard Library Imports
+import os
+import socket
+
+
+# Hosts that always mean this one
+_LOOPBACK = {"localhost", "0.0.0.0", "::", "::1"}
+
+# The addresses of this host, found when first needed
+_local_addrs = None
+
+
+def _host_addrs() -> set[str]:
+    """Finds the names and addresses of this host
+
+    Returns:
+        set[str]: The names and addresses
+    """
+
+    addrs = {socket.gethostname()}
+
+    try:
+        name, aliases, ips = socket.gethostbyname_ex(socket.gethostname())
+        addrs.update([name, *aliases, *ips])
+    except OSError:
+        pass
+
+    return addrs
+
+async def is_local(host: str) -> bool:
+    """Checks whether a host is this one
+
+    Args:
+        host (str): The host name or address.
+
+    Returns:
+        bool: Whether it is this host.
+    """
+
+    global _local_addrs
+
+    if host in _LOOPBACK or host.startswith("127."):
+        return True
+
+    # Resolving our own name may block
+    if _local_addrs is None:
+        _local_addrs = await to_thread.run_sync(_host_addrs)
+
+    return host in _local_addrs
+
+
+class AutoClient(_Client):
+    """
+        Client that connects over a Unix socket to nodes on this host,
+        and over TCP to every other node.
+    """
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> _Client:
+        """Connects to a node.
+
+            Arguments:
+                host (str): The host to connect to.
+                port (int): The port to connect to.
+
+            Returns:
+                _Client: A UnixClient if the node is on this host and accepts local connections, otherwise a TCPClient.
+        """
+
+        # Use the node's Unix socket if it has one. Connecting refuses
+        # sockets in a directory other users could have put them in
+        if await is_local(host) and os.path.exists(socket_path(port)):
+            try:
+                return await UnixClient.connect(host, port)
+            except OSError as e:
+                logger.debug(f"Unable to connect to {host}:{port} over a Unix socket, using TCP: {e!r}")
+
+        return await TCPClient.connect(host, port)
+
+class AutoServer(_Server):
+    """
+        Server that accepts connections over TCP, and from nodes on this
+        host over a Unix socket.
+    """
+
+    _tcp: TCPServer
+    _unix: UnixServer
+    _initialized: bool
+
+    def __init__(self, host: str, port: int, handler: Callable[[_Conn], None]):
+        """Initialize the server
+
+        Args:
+            host (str): The host to listen on
+            port (int): The port to listen on
+            handler (Callable[[_Conn], None]): The connection handler
+        """
+
+        self._tcp = TCPServer(host, port, handler)
+        self._unix = None
+        self._initialized = False
+
+        # Save the public port
+        self.port = port
+
+        # Save handler
+        self.handler = handler
+
+    async def initialize(self):
+        """Initialize the server.
+        """
+
+        await self._tcp.initialize()
+        self.port = self._tcp.port
+
+        # Listen locally at the path for our TCP port, if the platform allows it
+        try:
+            unix = UnixServer(self._tcp._host, self.port, self.handler)
+            await unix.initialize()
+            self._unix = unix
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"Unable to accept local connections over a Unix socket, using TCP only: {e!r}")
+
+        self._initialized = True
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Run the server.
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        # Initialize the server if it has not already
+        # been initialized
+        if not self._initialized:
+            await self.initialize()
+
+        async with create_task_group() as tg:
+            await tg.start(self._tcp.run)
+
+            if self._unix is not None:
+                await tg.start(self._unix.run)
+
+            # Task status ready (return our port)
+            task_status.started(self.port)
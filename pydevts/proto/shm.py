@@ -0,0 +1,666 @@
+"""
+    Shared memory transport for nodes on the same host.
+
+    Each connection is a pair of single-producer, single-consumer ring
+    buffers in shared memory, one per direction, alongside a Unix socket.
+    The socket carries the handshake, and then wakes an end waiting for
+    data or for room, so payloads are copied once, into the ring, and
+    handed to the receiver as views into it.
+
+    On x86, which keeps stores to memory in order, each end reads how far
+    the other has got straight from the rings. Elsewhere positions are
+    only trusted once they come over the socket, whose system calls order
+    them after the data they cover.
+"""
+
+
+# Base Classes
+from ._base import _Conn, _Client, _Server
+from .unix import UnixServer, check_socket_dir, socket_path
+
+# Logging
+from ..logger import logger
+
+# Anyio
+from anyio import connect_unix, Lock, EndOfStream, BrokenResourceError, ClosedResourceError
+from anyio.abc import SocketStream
+
+# Standard Library Imports
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import platform
+import struct
+import threading
+
+
+# The bytes in each direction's ring
+RING_SIZE = 1 << 23
+
+# Whether other processes see our stores to shared memory in the order we
+# make them, and we see theirs in that order
+_ORDERED = platform.machine().lower() in ("x86_64", "amd64", "i386", "i686", "x86")
+
+# Messages over the socket, each a kind and a position
+_POSITION = struct.Struct("!cQ")
+_HEAD = b"H" # The sender has written this far into the ring it writes to
+_TAIL = b"T" # The sender has read this far from the ring it reads from
+_FULL = b"F" # The sender waits for room in the ring it writes to
+
+# Taking a lock is a locked instruction, which x86 reorders no load or store across
+_BARRIER = threading.Lock()
+
+
+def _barrier():
+    """Makes our earlier stores visible before any of our later loads
+
+    Setting a flag asking to be woken and then checking whether we need
+    to be needs this, as does storing a position and then checking the
+    other end's flag, or each end may miss the other.
+    """
+
+    _BARRIER.acquire()
+    _BARRIER.release()
+
+
+class _SharedMemory(SharedMemory):
+    """
+        Shared memory that leaves its mapping to views still using it
+    """
+
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # Unmapped when the last view goes
+            pass
+
+
+class _Ring:
+    """
+        A single-producer, single-consumer byte ring in shared memory
+    """
+
+    # Positions only ever grow, and are kept on separate cache lines
+    _head_at = 0 # Bytes written, stored by the producer
+    _tail_at = 64 # Bytes read, stored by the consumer
+    _reader_waiting_at = 128 # Set by the consumer while it waits for data
+    _writer_waiting_at = 192 # Set by the producer while it waits for room
+    _header_size = 256
+
+    shm: _SharedMemory
+    capacity: int
+    _buf: memoryview
+    _data: memoryview
+
+    def __init__(self, shm: _SharedMemory, capacity: int):
+        """Initialize the ring
+
+        Args:
+            shm (_SharedMemory): The shared memory holding the ring.
+            capacity (int): The bytes the ring holds.
+        """
+
+        self.shm = shm
+        self.capacity = capacity
+        self._buf = shm.buf
+        self._data = shm.buf[self._header_size:self._header_size + capacity]
+
+    @classmethod
+    def create(cls, capacity: int) -> "_Ring":
+        """Creates an empty ring
+
+        Args:
+            capacity (int): The bytes the ring holds.
+
+        Returns:
+            _Ring: The ring.
+        """
+
+        shm = _SharedMemory(create=True, size=cls._header_size + capacity)
+        shm.buf[:cls._header_size] = bytes(cls._header_size)
+
+        return cls(shm, capacity)
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "_Ring":
+        """Attaches to a ring another process created
+
+        Args:
+            name (str): The name of the ring's shared memory.
+            capacity (int): The bytes the ring holds, as the other process says.
+
+        Raises:
+            ValueError: If the shared memory is too small to hold that many bytes
+
+        Returns:
+            _Ring: The ring.
+        """
+
+        shm = _SharedMemory(name)
+
+        # The creator unlinks it, so our resource tracker must not
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+        # Never trust the other end to say how far we may write
+        if not 0 < capacity <= shm.size - cls._header_size:
+            shm.close()
+            raise ValueError(f"Ring {name} of {shm.size} bytes can not hold {capacity}")
+
+        return cls(shm, capacity)
+
+    @property
+    def head(self) -> int:
+        """The number of bytes written and published
+        """
+
+        return struct.unpack_from("Q", self._buf, self._head_at)[0]
+
+    @head.setter
+    def head(self, value: int):
+        struct.pack_into("Q", self._buf, self._head_at, value)
+
+    @property
+    def tail(self) -> int:
+        """The number of bytes read, whose space may be reused
+        """
+
+        return struct.unpack_from("Q", self._buf, self._tail_at)[0]
+
+    @tail.setter
+    def tail(self, value: int):
+        struct.pack_into("Q", self._buf, self._tail_at, value)
+
+    @property
+    def reader_waiting(self) -> bool:
+        """Whether the consumer waits to be woken for data
+        """
+
+        return self._buf[self._reader_waiting_at] != 0
+
+    @reader_waiting.setter
+    def reader_waiting(self, value: bool):
+        self._buf[self._reader_waiting_at] = 1 if value else 0
+
+    @property
+    def writer_waiting(self) -> bool:
+        """Whether the producer waits to be woken for room
+        """
+
+        return self._buf[self._writer_waiting_at] != 0
+
+    @writer_waiting.setter
+    def writer_waiting(self, value: bool):
+        self._buf[self._writer_waiting_at] = 1 if value else 0
+
+    def write(self, head: int, tail: int, data: memoryview) -> int:
+        """Copies as much data as fits into the ring, without publishing it
+
+        Args:
+            head (int): The position to write at.
+            tail (int): The position the consumer has read up to.
+            data (memoryview): The data, as bytes.
+
+        Returns:
+            int: The number of bytes written.
+        """
+
+        free = self.capacity - (head - tail)
+        count = min(free, len(data))
+
+        # Write up to the end of the ring, then wrap around
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        self._data[:count - first] = data[first:count]
+
+        return count
+
+    def read(self, tail: int, head: int, max_bytes: int = None) -> memoryview:
+        """Views the contiguous data after a position, without consuming it
+
+        Args:
+            tail (int): The position to read from.
+            head (int): The published head.
+            max_bytes (int, optional): The most bytes to view. Defaults to None, viewing all of them.
+
+        Returns:
+            memoryview: A view into the ring.
+        """
+
+        start = tail % self.capacity
+        count = min(head - tail, self.capacity - start)
+        if max_bytes is not None:
+            count = min(count, max_bytes)
+
+        return self._data[start:start + count]
+
+    def unlink(self):
+        """Removes the ring's name, once both ends have mapped it
+        """
+
+        # Attaching may have dropped it from the resource tracker we share
+        # with the other end, which unlinking expects to still follow it
+        resource_tracker.register(self.shm._name, "shared_memory")
+        self.shm.unlink()
+
+    def close(self):
+        """Unmaps the ring
+        """
+
+        if self._buf is None:
+            return
+
+        self._data.release()
+        self._buf = None
+
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views we handed out are still alive, so leave the mapping to
+            # them, to be unmapped when the last one goes
+            self.shm._mmap = None
+
+    def __del__(self):
+        # Release our views before the shared memory tries to unmap itself
+        self.close()
+
+
+class ShmConn(_Conn):
+    """
+        Shared memory connection wrapper.
+    """
+
+    _sock: SocketStream
+    _inbound: _Ring
+    _outbound: _Ring
+    _head: int # Where we write next in the outbound ring
+    _published: int # How far we have published the outbound ring
+    _tail: int # How far we have read the inbound ring, not counting the view held
+    _held: int # Bytes viewed by the last recv, consumed by the next
+    _peer_head: int # How far the other end has told us it wrote the inbound ring
+    _peer_tail: int # How far the other end has told us it read the outbound ring
+    _told_tail: int # How far we have told the other end we read the inbound ring
+    _room_wanted: bool # Whether the other end has told us it waits for room
+    _updates: int # Counts the reads of the socket, so waiters can tell one happened
+    _partial: bytes # The start of a message split across reads
+    _eof: bool # Whether the other end has gone
+    _reading: Lock
+    _sending: Lock
+    _closed: bool
+
+    def __init__(self, sock: SocketStream, inbound: _Ring, outbound: _Ring):
+        """Initialize the wrapper class
+
+        Args:
+            sock (SocketStream): The Unix socket to wake the other end over.
+            inbound (_Ring): The ring we read from.
+            outbound (_Ring): The ring we write to.
+        """
+
+        self._sock = sock
+        self._inbound = inbound
+        self._outbound = outbound
+        self._head = 0
+        self._published = 0
+        self._tail = 0
+        self._held = 0
+        self._peer_head = 0
+        self._peer_tail = 0
+        self._told_tail = 0
+        self._room_wanted = False
+        self._updates = 0
+        self._partial = b""
+        self._eof = False
+        self._reading = Lock()
+        self._sending = Lock()
+        self._closed = False
+
+        # The other end is on this host, and has no port of its own
+        self.addr = ("127.0.0.1", 0)
+
+    def _inbound_head(self) -> int:
+        """How far the other end has written the inbound ring, as far as we can trust
+        """
+
+        return self._inbound.head if _ORDERED else self._peer_head
+
+    def _outbound_tail(self) -> int:
+        """How far the other end has read the outbound ring, as far as we can trust
+        """
+
+        return self._outbound.tail if _ORDERED else self._peer_tail
+
+    async def recv(self, max_bytes: int = None) -> bytes:
+        """Receive data over the connection.
+
+        The data is a view into shared memory, which is only valid until
+        the next call to recv.
+
+        Args:
+            max_bytes (int, optional): Maximum number of bytes to receive. Defaults to None, receiving everything contiguous.
+
+        Returns:
+            bytes: Data received over the connection.
+        """
+
+        if self._closed:
+            raise EndOfStream
+
+        ring = self._inbound
+
+        # The previous view is done with, so let the writer reuse its space
+        self._tail += self._held
+        self._held = 0
+
+        while True:
+            await self._free()
+
+            # Deliver anything written, even after the other end went away
+            head = self._inbound_head()
+            if head != self._tail:
+                data = ring.read(self._tail, head, max_bytes)
+                self._held = len(data)
+                return data
+
+            if self._eof:
+                raise EndOfStream
+
+            # Ask to be woken, then check again in case data just arrived
+            if _ORDERED:
+                ring.reader_waiting = True
+                _barrier()
+
+                if ring.head != self._tail:
+                    ring.reader_waiting = False
+                    continue
+
+            await self._wait_for_peer()
+
+            # We may have been closed while waiting, unmapping the ring
+            if self._closed:
+                raise EndOfStream
+
+    async def _free(self):
+        """Frees what we have read of the inbound ring, waking the writer if it waits for room
+        """
+
+        ring = self._inbound
+        ring.tail = self._tail
+
+        if _ORDERED:
+            _barrier()
+
+            if not ring.writer_waiting:
+                return
+
+            ring.writer_waiting = False
+
+        # Only tell the writer once there is news, as it only reads the socket while it waits
+        elif not self._room_wanted or self._tail == self._told_tail:
+            return
+
+        self._room_wanted = False
+        self._told_tail = self._tail
+
+        try:
+            await self._tell(_TAIL, self._tail)
+        except ConnectionError:
+            # Nobody is left to tell
+            pass
+
+    async def send(self, data: bytes):
+        """Send data over the connection.
+
+        Args:
+            data (bytes): Data to send.
+        """
+
+        await self.send_many([data])
+
+    async def send_many(self, buffers: list[bytes]):
+        """Send several buffers over the connection, publishing them together.
+
+        Args:
+            buffers (list[bytes]): Buffers to send, in order.
+        """
+
+        if self._closed:
+            raise ConnectionError(f"Connection to {self.addr} is closed")
+
+        ring = self._outbound
+
+        for data in buffers:
+            view = memoryview(data).cast("B")
+
+            while view:
+                tail = self._outbound_tail()
+                count = ring.write(self._head, tail, view)
+                self._head += count
+                view = view[count:]
+
+                if not view:
+                    break
+
+                # The ring is full, so publish what we have and wait for the reader
+                await self._publish()
+                await self._wait_for_room(tail)
+
+        await self._publish()
+
+    async def _publish(self):
+        """Makes written data visible to the reader, and wakes it if it waits
+        """
+
+        if self._head == self._published:
+            return
+
+        ring = self._outbound
+        ring.head = self._published = self._head
+
+        if _ORDERED:
+            _barrier()
+
+            if not ring.reader_waiting:
+                return
+
+            ring.reader_waiting = False
+
+        await self._tell(_HEAD, self._head)
+
+    async def _wait_for_room(self, tail: int):
+        """Waits for the reader to read past a position in the outbound ring
+
+        Args:
+            tail (int): The position.
+        """
+
+        ring = self._outbound
+
+        if not _ORDERED:
+            await self._tell(_FULL, self._head)
+
+        while self._outbound_tail() == tail:
+            if self._eof or self._closed:
+                raise ConnectionError(f"Connection to {self.addr} is closed")
+
+            # Ask to be woken, then check again in case room was just made
+            if _ORDERED:
+                ring.writer_waiting = True
+                _barrier()
+
+                if ring.tail != tail:
+                    ring.writer_waiting = False
+                    return
+
+            await self._wait_for_peer()
+
+    async def _tell(self, kind: bytes, position: int):
+        """Sends the other end a position, waking it
+
+        Args:
+            kind (bytes): What the position is.
+            position (int): The position.
+        """
+
+        try:
+            async with self._sending:
+                await self._sock.send(_POSITION.pack(kind, position))
+        except (BrokenResourceError, ClosedResourceError) as e:
+            raise ConnectionError(f"Connection to {self.addr} is closed") from e
+
+    async def _wait_for_peer(self):
+        """Waits for the other end to tell us something, or to go away
+
+        Only one task reads the socket at a time. The others wait for it
+        to finish, and then look again at what it learned.
+        """
+
+        updates = self._updates
+
+        async with self._reading:
+            if self._updates != updates or self._eof:
+                return
+
+            try:
+                data = await self._sock.receive()
+            except (EndOfStream, BrokenResourceError, ClosedResourceError):
+                self._eof = True
+                data = b""
+
+            # Apply every complete message, keeping the start of any split one
+            data = self._partial + data
+            end = len(data) - len(data) % _POSITION.size
+            self._partial = data[end:]
+
+            for kind, position in _POSITION.iter_unpack(data[:end]):
+                if kind == _HEAD:
+                    self._peer_head = position
+                elif kind == _TAIL:
+                    self._peer_tail = position
+                elif kind == _FULL:
+                    self._room_wanted = True
+
+            self._updates += 1
+
+    async def close(self):
+        """Close the connection
+        """
+
+        self._closed = True
+
+        await self._sock.aclose()
+
+        self._inbound.close()
+        self._outbound.close()
+
+
+class ShmClient(ShmConn, _Client):
+    """
+        Shared memory client wrapper.
+    """
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> 'ShmClient':
+        """Connects to a node on this host.
+
+            Arguments:
+                host (str): The host to connect to, which must be this one.
+                port (int): The port the node listens on.
+
+            Returns:
+                ShmClient: An instance of ShmClient for the connection.
+        """
+
+        check_socket_dir()
+        sock = await connect_unix(socket_path(port))
+
+        outbound = _Ring.create(RING_SIZE)
+        inbound = _Ring.create(RING_SIZE)
+
+        try:
+            # Tell the server where the rings are, ours to it first
+            names = [outbound.shm.name.encode(), inbound.shm.name.encode()]
+            await sock.send(struct.pack("!QHH", RING_SIZE, *map(len, names)) + b"".join(names))
+
+            # Wait for it to attach
+            try:
+                accepted = await sock.receive(1) == b"\1"
+            except EndOfStream:
+                accepted = False
+
+            if not accepted:
+                raise ConnectionError(f"Node at {host}:{port} refused the shared memory transport")
+        except BaseException:
+            await sock.aclose()
+            inbound.close()
+            outbound.close()
+            raise
+        finally:
+            # Both ends have mapped the rings, or never will
+            outbound.unlink()
+            inbound.unlink()
+
+        return cls(sock, inbound, outbound)
+
+class ShmServer(UnixServer):
+    """
+        Shared memory server wrapper.
+    """
+
+    _conn = ShmConn
+
+    async def _wrap_handler(self, conn: SocketStream):
+        """The connection handler
+
+        Args:
+            conn (SocketStream): Anyio SocketStream communicating with the client.
+        """
+
+        new_conn = None
+
+        # Try-except for disconnect
+        try:
+            # Read where the client put the rings
+            header = struct.calcsize("!QHH")
+            data = b""
+            while len(data) < header:
+                data += await conn.receive(header - len(data))
+
+            capacity, inbound_len, outbound_len = struct.unpack("!QHH", data)
+
+            data = b""
+            while len(data) < inbound_len + outbound_len:
+                data += await conn.receive(inbound_len + outbound_len - len(data))
+
+            # The client removes the rings if it gives up on us first
+            inbound = outbound = None
+            try:
+                inbound = _Ring.attach(data[:inbound_len].decode(), capacity)
+                outbound = _Ring.attach(data[inbound_len:].decode(), capacity)
+            except FileNotFoundError:
+                if inbound is not None:
+                    inbound.close()
+                return
+            except ValueError as e:
+                if inbound is not None:
+                    inbound.close()
+
+                logger.warning(f"Refusing shared memory connection: {e}")
+                await conn.send(b"\0")
+                return
+
+            await conn.send(b"\1")
+
+            new_conn = self._conn(conn, inbound, outbound)
+
+            # Run the handler
+            await self.handler(new_conn)
+        except (EndOfStream, BrokenResourceError):
+            # Connection closed
+            pass
+        finally:
+            # Close the connection, and unmap the rings
+            if new_conn is not None:
+                await new_conn.close()
+            else:
+                await conn.aclose()
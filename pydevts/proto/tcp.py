@@ -8,7 +8,7 @@ from ._base import _Conn, _Client, _Server
 
 
 # Anyio TCP
-from anyio import connect_tcp, create_tcp_listener, TASK_STATUS_IGNORED, EndOfStream
+from anyio import connect_tcp, create_tcp_listener, TASK_STATUS_IGNORED, EndOfStream, BrokenResourceError
 from anyio.abc import TaskStatus, SocketStream
 from anyio.streams.stapled import MultiListener
 
@@ -103,6 +103,7 @@ class TCPServer(_Server):
     port: int # The actual listening port
     _handler: Callable[[_Conn], None]
     _listener: MultiListener[SocketStream]
+    _conn = TCPConn # Wraps accepted connections
 
     def __init__(self, host: str, port: int, handler: Callable[[_Conn], None]):
         """[summary]
@@ -133,14 +134,14 @@ class TCPServer(_Server):
         """
 
         # Create the wrapper class
-        new_conn = TCPConn(conn)
+        new_conn = self._conn(conn)
 
         # Try-except for disconnect
         try:
             # Run the handler
             await self.handler(new_conn)
-        except (EndOfStream):
-            # Connection closed
+        except (EndOfStream, BrokenResourceError):
+            # Connection closed, or broken while we sent back over it
             return
         
         # Close the connection
@@ -0,0 +1,194 @@
+"""
+    Wrapper classes over the anyio Unix domain socket implementation.
+
+    Unix sockets only reach nodes on the same host, which are still
+    addressed by host and port. A node listening on a port accepts local
+    connections at a socket path derived from that port, in a directory
+    only the current user can use.
+"""
+
+
+# Base Classes
+from ._base import _Conn, _Client, _Server
+from .tcp import TCPConn, TCPServer
+
+
+# Anyio Unix sockets
+from anyio import connect_unix, create_unix_listener, TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus, SocketStream
+
+# Type hints
+from typing import Callable
+
+# Standard Library Imports
+import errno
+import os
+import random
+import socket
+import stat
+import tempfile
+
+
+# Where this user's nodes on this host put their sockets. Other users'
+# nodes can not be reached locally, as their sockets are kept elsewhere
+if os.environ.get("XDG_RUNTIME_DIR"):
+    SOCKET_DIR = os.path.join(os.environ["XDG_RUNTIME_DIR"], "pydevts")
+else:
+    SOCKET_DIR = os.path.join(tempfile.gettempdir(), f"pydevts-{os.getuid() if hasattr(os, 'getuid') else 0}")
+
+
+def check_socket_dir(create: bool = False):
+    """Checks that only the current user can use the socket directory
+
+    A directory another user made, or can write to, could hold sockets
+    impersonating our nodes, so it is refused.
+
+    Args:
+        create (bool, optional): Whether to create the directory if it does not exist. Defaults to False.
+
+    Raises:
+        PermissionError: If the directory is not a directory owned by us that only we can use
+    """
+
+    if create:
+        os.makedirs(SOCKET_DIR, mode=0o700, exist_ok=True)
+
+    # Do not follow links, which could point anywhere
+    info = os.lstat(SOCKET_DIR)
+
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Socket directory {SOCKET_DIR} is not a directory")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"Socket directory {SOCKET_DIR} is owned by another user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"Socket directory {SOCKET_DIR} can be used by other users, its mode is {stat.S_IMODE(info.st_mode):o}")
+
+
+def socket_path(port: int) -> str:
+    """The path a node listening on a port accepts local connections at
+
+    Args:
+        port (int): The port.
+
+    Returns:
+        str: The socket path.
+    """
+
+    return os.path.join(SOCKET_DIR, f"{port}.sock")
+
+def _in_use(path: str) -> bool:
+    """Checks whether a server is listening at a socket path
+
+    Args:
+        path (str): The socket path.
+
+    Returns:
+        bool: Whether a connection to it succeeds.
+    """
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+
+    return True
+
+
+class UnixConn(TCPConn):
+    """
+        Unix domain socket connection wrapper.
+    """
+
+    def __init__(self, wraps: SocketStream):
+        """Initialize the wrapper class
+
+        Args:
+            wraps (SocketStream): The SocketStream to wrap
+        """
+
+        # Save the wrapped object
+        self._wraps = wraps
+
+        # The other end is on this host, and has no port of its own
+        self.addr = ("127.0.0.1", 0)
+
+
+class UnixClient(UnixConn, _Client):
+    """
+        Unix domain socket client wrapper.
+    """
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> 'UnixClient':
+        """Connects to a node on this host.
+
+            Arguments:
+                host (str): The host to connect to, which must be this one.
+                port (int): The port the node listens on.
+
+            Returns:
+                UnixClient: An instance of UnixClient for the connection.
+        """
+
+        # Connect to the server using anyio, if no one else could have put it there
+        check_socket_dir()
+        sock = await connect_unix(socket_path(port))
+
+        # Create client
+        return cls(sock)
+
+class UnixServer(TCPServer):
+    """
+        Unix domain socket server wrapper.
+    """
+
+    _conn = UnixConn
+    path: str # The socket path we listen at
+
+    async def initialize(self):
+        """Initialize the server.
+        """
+
+        check_socket_dir(create=True)
+
+        # Without a port, take a free one at random
+        port = self._port
+        while not port:
+            port = random.randint(1024, 65535)
+            if os.path.exists(socket_path(port)):
+                port = 0
+
+        # Never take over a socket another node is listening at
+        path = socket_path(port)
+        if _in_use(path):
+            raise OSError(errno.EADDRINUSE, f"A node is already listening at {path}")
+
+        # Create listener, replacing any socket left behind by an exited node
+        self._listener = await create_unix_listener(path)
+        self.path = path
+
+        # Update public port value
+        self.port = port
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Run the server.
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        # Initialize the server if it has not already
+        # been initialized
+        if getattr(self, "_listener", None) is None:
+            await self.initialize()
+
+        try:
+            await super().run(task_status=task_status)
+        finally:
+            # Remove our socket
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -3,36 +3,102 @@
 """
 
 # Type hints
-from typing import Callable
-from anyio.abc import TaskStatus
-
-# Serialization
-from .msg import MsgName
+from typing import Callable, Hashable
+from anyio.abc import TaskGroup, TaskStatus
 
 # P2P Connection
 from .p2p import P2PConnection
 
 # Errors
-from .err import EventNotFound
+from .err import EventNotFound, NodeNotFound
+
+# Emit results
+from .routing import EmitResult
+
+# Keeping received data
+from .msg import own
+
+# Offloading handlers
+from .executor import HandlerExecutor, LOOP, THREAD, PROCESS, MODES
+
+# Wildcard subscriptions
+from .patterns import PatternIndex, is_pattern
 
 # Anyio stuff
-from anyio import create_task_group, TASK_STATUS_IGNORED
+from anyio import create_task_group, sleep_forever, Semaphore, TASK_STATUS_IGNORED
 
 # Logging
 from .logger import logger
 
+# Standard Library Imports
+from collections import deque
+from functools import partial
+import time
+
 class Node(P2PConnection):
     """A peer to peer node with event handling
     """
 
 
     _events: dict[str, list[Callable[[str, bytes], None]]]
-    _syst_events: dict[str, list[Callable[[], None]]]
+    _patterns: PatternIndex
+    _resolved: dict[str, tuple[list[Callable[[str, bytes], None]], Callable[[str, bytes], Hashable]]]
+    _event_table: list[tuple[str, list[Callable[[str, bytes], None]], Callable[[str, bytes], Hashable]]]
+    _event_keys: dict[str, Callable[[str, bytes], Hashable]]
+    _syst_events: dict[str, list[Callable[..., None]]]
+    _handler_slots: Semaphore
+    _pending_slots: Semaphore
+    _ordered: dict[tuple[str, Hashable], deque]
+    _handler_tg: TaskGroup
+    executor: HandlerExecutor
+    default_handler: Callable[[str, str, bytes], None]
+    views: bool
+
+    def __init__(self, *args,
+        max_concurrency: int = 64,
+        max_pending: int = None,
+        max_threads: int = None,
+        max_processes: int = None,
+        shm_threshold: int = 65536,
+        default_handler: Callable[[str, str, bytes], None] = None,
+        views: bool = False,
+        **kwargs):
+        """Initialize the node
 
-    def __init__(self, *args, **kwargs):
+        Args:
+            *args, **kwargs: Passed to P2PConnection.
+            max_concurrency (int, optional): The maximum number of received events handled at once. Defaults to 64.
+            max_pending (int, optional): The maximum number of received events waiting for or running handlers. Once reached, connections are not read until one finishes, pushing back on senders. Responses to our own requests wait behind them, so handlers making requests should time them out. Defaults to four times max_concurrency.
+            max_threads (int, optional): The maximum number of handlers run in threads at once. Defaults to the number of CPUs plus four, at most 32.
+            max_processes (int, optional): The number of processes handlers are run in. Defaults to the number of CPUs.
+            shm_threshold (int, optional): Payloads at least this large are passed to handler processes in shared memory. Defaults to 65536.
+            default_handler (Callable[[str, str, bytes], None], optional): Called with the sender, name and data of events we have no handler for. Defaults to None, logging and dropping them.
+            views (bool, optional): Pass handlers and ordering keys a memoryview of the data received, saving a copy of every payload. Handlers that keep the data must copy it with bytes(). Defaults to False, passing bytes.
+        """
         
-        # Initialize events
+        # Initialize events, indexed by name and pattern, and by our numeric ID for them
         self._events = dict()
+        self._patterns = PatternIndex()
+        self._resolved = dict()
+        self._event_table = []
+        self._event_keys = dict()
+        self.default_handler = default_handler
+        self.views = views
+
+        # Received events are handled concurrently once we are running,
+        # with only so many queued before we stop reading more
+        if max_pending is None:
+            max_pending = 4 * max_concurrency
+        if max_pending < max_concurrency:
+            raise ValueError(f"max_pending ({max_pending}) must be at least max_concurrency ({max_concurrency})")
+
+        self._handler_slots = Semaphore(max_concurrency)
+        self._pending_slots = Semaphore(max_pending)
+        self._ordered = dict()
+        self._handler_tg = None
+
+        # Create the pools that handlers are offloaded to
+        self.executor = HandlerExecutor(max_threads, max_processes, shm_threshold)
 
         # Initialize system events
         self._syst_events = {
@@ -42,17 +108,27 @@ class Node(P2PConnection):
         # Call super
         super().__init__(*args, **kwargs)
 
+        # Peers only send us the events we handle, unless we handle them all
+        self.router.set_catch_all(default_handler is not None)
+
+        # Time handlers
+        self._m_handler_seconds = self.metrics.histogram("pydevts_handler_seconds", "Time spent handling each event", ("event",))
+        self._m_handler_errors = self.metrics.counter("pydevts_handler_errors_total", "Event handlers that raised", ("event",))
+        self.metrics.gauge("pydevts_handlers_pending", "Received events waiting for or running handlers").set_function(
+            lambda: max_pending - self._pending_slots.value)
+
     async def _startup(self):
         """Startup event
         """
 
         logger.info(f"Runing server at {self.router.node_id}@{self.addr[0]}:{self.addr[1]}")
     
-    async def _call_sys(self, name: str):
+    async def _call_sys(self, name: str, *args):
         """Call a system event
 
         Args:
             name (str): The name of the event to call.
+            *args: The arguments passed to the event handlers.
         """
 
         # If the event does not exist, raise an error
@@ -61,16 +137,41 @@ class Node(P2PConnection):
 
         # Run the events
         for func in self._syst_events[name]:
-            await func()
+            await func(*args)
+
+    async def _on_sys(self, name: str, *args):
+        """Handle a system event reported by the router
+
+        Args:
+            name (str): The name of the system event.
+            *args: The arguments of the event.
+        """
+
+        # Only call events that have handlers
+        if name in self._syst_events.keys():
+            await self._call_sys(name, *args)
 
     async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
         """Start running the server
         """
         # Create a task group
         async with create_task_group() as tg:
+            # Start handling events
+            await tg.start(self._run_handlers)
+
+            # Start the router
+            await tg.start(self.router.run)
+
             # Start the server
             await tg.start(self.server.run)
 
+            # Connect to peers up front, if the router is configured to
+            await self.router.warm_up()
+
+            # Serve metrics if asked to
+            if self.metrics_addr is not None:
+                await tg.start(self.metrics.serve, *self.metrics_addr)
+
             # Run the startup events
             await self._call_sys("startup")
 
@@ -100,11 +201,42 @@ class Node(P2PConnection):
         
         return _deco  
 
-    def on(self, name: str):
+    async def _run_handlers(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Hosts the tasks that handle received events
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        async with create_task_group() as tg:
+            self._handler_tg = tg
+
+            try:
+                task_status.started()
+
+                # Handlers run until we are cancelled
+                await sleep_forever()
+            finally:
+                self._handler_tg = None
+
+                # Stop any worker processes
+                self.executor.shutdown()
+
+    def on(self, name: str, key: Callable[[str, bytes], Hashable] = None, mode: str = LOOP):
         """Decorator to register an event handler
 
+        When the event is sent with request, the first value a handler
+        returns is sent back as the response.
+
+        The name may be a pattern over the dot separated segments of event
+        names, where "*" matches any one segment and a final "**" matches
+        one or more, such as "orders.*" or "orders.**".
+
         Args:
-            name (str): The name of the event to register.
+            name (str): The name or pattern of the events to register.
+            key (Callable[[str, bytes], Hashable], optional): Computes an ordering key from the sender and data. Events with the same key are handled in the order they were received. Defaults to None, handling every event concurrently.
+            mode (str, optional): Where the handler runs: "loop" for a coroutine function on the event loop, or "thread" or "process" for a regular function offloaded to the node's pools. Defaults to "loop".
         """
 
         def _deco(func) -> Callable[[str, bytes], None]:
@@ -112,58 +244,354 @@ class Node(P2PConnection):
             """
 
             # Register the handler
-            self._on(name, func)
+            self._on(name, func, key, mode)
 
             # Return the function
             return func
         
         return _deco
 
-    def _on(self, name: str, handler: Callable[[str, bytes], None]):
+    def _on(self, name: str, handler: Callable[[str, bytes], None], key: Callable[[str, bytes], Hashable] = None, mode: str = LOOP):
         """Register an event handler for an event
 
         Args:
             name (str): Name of the event to register.
             handler (Callable[[str, bytes], None]): The event handler.
+            key (Callable[[str, bytes], Hashable], optional): Computes an ordering key from the sender and data. Defaults to None.
+            mode (str, optional): Where the handler runs: "loop", "thread" or "process". Defaults to "loop".
         """
+
+        if mode not in MODES:
+            raise ValueError(f"Unknown handler mode {mode}, expected one of {MODES}")
+
+        # Offloaded handlers are awaited through the executor
+        if mode == THREAD:
+            handler = partial(self.executor.run_thread, handler)
+        elif mode == PROCESS:
+            handler = partial(self.executor.run_process, handler)
     
-        # If the event does not exist, create it
+        # If the event does not exist, create it, and give it an ID or index the pattern
         if name not in self._events.keys():
             self._events[name] = []
 
+            if is_pattern(name):
+                self._patterns.add(name)
+                self.router.register_pattern(name)
+            else:
+                event_id = self.router.register_event(name)
+                while len(self._event_table) <= event_id:
+                    self._event_table.append(None)
+                self._event_table[event_id] = (name, [], None)
+
         # Set the handler
         self._events[name].append(handler)
 
-    async def _on_data(self, node: str, data: bytes):
+        # Set the ordering key
+        if key is not None:
+            self._event_keys[name] = key
+
+        # Names may now match different handlers
+        self._resolved.clear()
+        for event_id, entry in enumerate(self._event_table):
+            if entry is not None:
+                self._event_table[event_id] = (entry[0], *self._resolve(entry[0]))
+
+    def _resolve(self, name: str) -> tuple[list[Callable[[str, bytes], None]], Callable[[str, bytes], Hashable]]:
+        """Finds the handlers for an event name, and its ordering key
+
+        Handlers registered for the name come first, then those of the
+        patterns it matches, in the order the patterns were registered.
+
+        Args:
+            name (str): The name of the event.
+
+        Returns:
+            tuple[list[Callable[[str, bytes], None]], Callable[[str, bytes], Hashable]]: The handlers, empty if there are none, and the ordering key, or None.
+        """
+
+        resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+
+        # A pattern sent as a name is not a subscription to it
+        handlers = [] if is_pattern(name) else list(self._events.get(name, ()))
+        key = self._event_keys.get(name) if handlers else None
+
+        for pattern in self._patterns.match(name):
+            handlers.extend(self._events[pattern])
+            if key is None:
+                key = self._event_keys.get(pattern)
+
+        # Forget everything rather than grow without bound
+        if len(self._resolved) >= self._patterns.max_cache:
+            self._resolved.clear()
+        self._resolved[name] = resolved = (handlers, key)
+
+        return resolved
+
+    def _event_label(self, name: str) -> str:
+        """Finds the label to report an event under in the metrics
+
+        Peers choose the names they send, so only names we registered are
+        reported as they are, names matching a pattern are reported by the
+        pattern, and the rest as "other".
+
+        Args:
+            name (str): The name of the event.
+
+        Returns:
+            str: The label.
+        """
+
+        if name in self._events:
+            return name
+
+        patterns = self._patterns.match(name)
+        return patterns[0] if patterns else "other"
+
+    def on_default(self):
+        """Decorator to register the handler for events we have no handler for
+        """
+
+        def _deco(func) -> Callable[[str, str, bytes], None]:
+            """Decorator to register the default handler
+            """
+
+            # Register the handler, and ask peers for every event
+            self.default_handler = func
+            self.router.set_catch_all(True)
+
+            # Return the function
+            return func
+
+        return _deco
+
+    async def _on_data(self, node: str, name: str, sent_data: bytes):
         """Handle data received
 
         Args:
-            data (bytes): The data received.
+            node (str): The node that sent the event.
+            name (str): The name of the event, or our numeric ID for it.
+            sent_data (bytes): The data received.
+        """
+
+        await self._dispatch(node, name, sent_data)
+
+    async def _on_request(self, node: str, name: str, request_id: int, sent_data: bytes):
+        """Handle a request received
+
+        Args:
+            node (str): The node that sent the request.
+            name (str): The name of the event, or our numeric ID for it.
+            request_id (int): The ID of the request.
+            sent_data (bytes): The data received.
+        """
+
+        await self._dispatch(node, name, sent_data, request_id)
+
+    async def _dispatch(self, node: str, name: str, sent_data: bytes, request_id: int = None):
+        """Hands a received event to its handlers
+
+        Args:
+            node (str): The node that sent the event.
+            name (str): The name of the event, or our numeric ID for it.
+            sent_data (bytes): The data received.
+            request_id (int, optional): The ID of the request, if the sender waits for a response. Defaults to None.
         """
 
-        # Deserialize the data
-        name, sent_data = MsgName.loads(data)
+        # Look the handlers up by ID if we can, falling back to the name
+        if name.__class__ is int:
+            entry = self._event_table[name] if name < len(self._event_table) else None
 
-        # Send to registered handlers
-        if name in self._events.keys():
-            for handler in self._events[name]:
-                await handler(node, sent_data)
+            # A peer with a stale or broken view of our IDs
+            if entry is None:
+                logger.warning(f"Dropping event with unknown ID {name} from {node}")
+                if request_id is not None:
+                    await self._respond(node, request_id, None, EventNotFound(f"Event ID {name} not found"))
+                return
+
+            name, handlers, key = entry
         else:
-            raise EventNotFound(f"Event {name} not found")
+            handlers, key = self._resolve(name)
+
+            # Hand unknown events to the default handler
+            if not handlers:
+                # Requests need an answer, so fail them straight away
+                if request_id is not None and self.default_handler is None:
+                    await self._respond(node, request_id, None, EventNotFound(f"Event {name} not found"))
+                    return
+
+                handlers = [partial(self._default, name)]
+
+        # Handlers get bytes unless they asked for views
+        if not self.views:
+            sent_data = bytes(sent_data)
+
+        # Before we are running, handle the event in place
+        if self._handler_tg is None:
+            await self._handle(node, name, handlers, sent_data, request_id)
+            return
+
+        # The data must outlive the buffer it was received in
+        sent_data = own(sent_data)
+
+        # Find the ordering key, if the event has one
+        ordering = None
+        if key is not None:
+            try:
+                ordering = (name, key(node, sent_data))
+            except Exception as e:
+                self._m_handler_errors.labels(self._event_label(name)).inc()
+                logger.exception(f"Error computing ordering key for event {name} from {node}: {e!r}")
+                return
+
+        # Stop reading the connection while too many events are pending.
+        # The slot is given back once the event has been handled
+        await self._pending_slots.acquire()
+
+        # Handlers wait for a free slot in their own task, so the connection
+        # keeps being read, and responses to our own requests get through
+        if ordering is None:
+            self._handler_tg.start_soon(self._handle_in_slot, node, name, handlers, sent_data, request_id)
+            return
+
+        # Queue behind earlier events with the same key
+        queue = self._ordered.get(ordering)
+        if queue is not None:
+            queue.append((node, sent_data, request_id))
+            return
+
+        self._ordered[ordering] = deque([(node, sent_data, request_id)])
+        self._handler_tg.start_soon(self._handle_ordered, ordering, handlers)
+
+    async def _default(self, name: str, node: str, sent_data: bytes):
+        """Handles an event we have no handler for
+
+        Args:
+            name (str): The name of the event.
+            node (str): The node that sent the event.
+            sent_data (bytes): The data received.
+        """
+
+        if self.default_handler is None:
+            # Emitting events we do not handle ourselves is fine
+            if node != self.router.node_id:
+                logger.warning(f"Dropping event {name} from {node}, which has no handler")
+            return
+
+        return await self.default_handler(node, name, sent_data)
+
+    async def _handle(self, node: str, name: str, handlers: list[Callable[[str, bytes], None]], sent_data: bytes, request_id: int = None):
+        """Runs the handlers for a received event, logging their errors
+
+        For requests, the first value a handler returns is sent back as the
+        response, and an error is sent back if a handler raises.
+
+        Args:
+            node (str): The node that sent the event.
+            name (str): The name of the event.
+            handlers (list[Callable[[str, bytes], None]]): The handlers to run.
+            sent_data (bytes): The data received.
+            request_id (int, optional): The ID of the request, if the sender waits for a response. Defaults to None.
+        """
+
+        started = time.perf_counter()
+        label = self._event_label(name)
+        result = None
+        error = None
+
+        # A handler that raises does not stop the others
+        for handler in handlers:
+            try:
+                value = await handler(node, sent_data)
+            except Exception as e:
+                error = error or e
+                self._m_handler_errors.labels(label).inc()
+                logger.exception(f"Error handling event {name} from {node}: {e!r}")
+                continue
+
+            if result is None:
+                result = value
+
+        self._m_handler_seconds.labels(label).observe(time.perf_counter() - started)
+
+        if result is not None and not isinstance(result, (bytes, bytearray, memoryview)):
+            error = error or TypeError(f"Handlers must return bytes, not {type(result).__name__}")
+            self._m_handler_errors.labels(label).inc()
+            logger.error(f"Error handling event {name} from {node}: {error!r}")
+
+        if request_id is not None:
+            await self._respond(node, request_id, result, error)
+
+    async def _respond(self, node: str, request_id: int, result: bytes, error: Exception):
+        """Answers a request
+
+        Args:
+            node (str): The node that sent the request.
+            request_id (int): The ID of the request.
+            result (bytes): The response, or None for an empty one.
+            error (Exception): Why handling the request failed, or None if it did not.
+        """
+
+        try:
+            if error is not None:
+                await self.router.respond(node, request_id, repr(error).encode(), error=True)
+            else:
+                await self.router.respond(node, request_id, b"" if result is None else result)
+        except (OSError, NodeNotFound) as e:
+            logger.warning(f"Unable to answer request {request_id} from {node}: {e!r}")
+
+    async def _handle_in_slot(self, node: str, name: str, handlers: list[Callable[[str, bytes], None]], sent_data: bytes, request_id: int = None):
+        """Handles a received event once a handler slot is free
+
+        Args:
+            node (str): The node that sent the event.
+            name (str): The name of the event.
+            handlers (list[Callable[[str, bytes], None]]): The handlers to run.
+            sent_data (bytes): The data received.
+            request_id (int, optional): The ID of the request, if the sender waits for a response. Defaults to None.
+        """
+
+        try:
+            async with self._handler_slots:
+                await self._handle(node, name, handlers, sent_data, request_id)
+        finally:
+            self._pending_slots.release()
+
+    async def _handle_ordered(self, ordering: tuple[str, Hashable], handlers: list[Callable[[str, bytes], None]]):
+        """Handles the queued events for an ordering key, one at a time
+
+        Args:
+            ordering (tuple[str, Hashable]): The event name and ordering key.
+            handlers (list[Callable[[str, bytes], None]]): The handlers to run.
+        """
+
+        queue = self._ordered[ordering]
+
+        try:
+            while queue:
+                node, sent_data, request_id = queue.popleft()
+                await self._handle_in_slot(node, ordering[0], handlers, sent_data, request_id)
+        finally:
+            # Give back the pending slots of events we never got to
+            for _ in queue:
+                self._pending_slots.release()
+
+            del self._ordered[ordering]
     
-    async def emit(self, name: str, data: bytes):
-        """Send event to all peers
+    async def emit(self, name: str, data: bytes) -> EmitResult:
+        """Send event to every peer that handles it
 
         Args:
             name (str): The name of the event to send.
             data (bytes): The data to send.
-        """
 
-        # Serialize the data
-        send_data = MsgName.dumps(name, data)
+        Returns:
+            EmitResult: Which peers the event was queued for, and which are still being sent to in the background
+        """
 
         # Delegate to the underlying P2PConnection
-        await super().emit(send_data)
+        return await super().emit(data, name)
     
     async def send(self, node: str, name: str, data: bytes):
         """Send event to a specific node
@@ -174,9 +602,26 @@ class Node(P2PConnection):
             data (bytes): The data to send.
         """
 
-        # Serialize the data
-        send_data = MsgName.dumps(name, data)
-        
+        # Delegate to the underlying P2PConnection
+        await super().send_to(node, data, name)
+
+    async def request(self, node: str, name: str, data: bytes, timeout: float = 30.0) -> bytes:
+        """Send a request to a specific node, and wait for the value its handler returns
+
+        Args:
+            node (str): The node to send the request to.
+            name (str): The name of the event to send.
+            data (bytes): The data to send.
+            timeout (float, optional): Seconds to wait for the response, or None to wait forever. Defaults to 30.0.
+
+        Raises:
+            TimeoutError: If the response did not arrive in time.
+            RemoteError: If the node had no handler for the event, or its handler raised.
+            NodeNotFound: If the node is not a peer, or left before responding.
+
+        Returns:
+            bytes: The response
+        """
 
         # Delegate to the underlying P2PConnection
-        await super().send_to(node, send_data)
+        return await super().request(node, data, name, timeout)
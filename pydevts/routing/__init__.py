@@ -2,4 +2,6 @@
     Implements various routing algorithms.
 """
 
-from .peer import PeerRouter
\ No newline at end of file
+from ._base import EmitResult
+from .peer import PeerRouter
+from .gossip import GossipRouter
\ No newline at end of file
@@ -4,7 +4,34 @@
 
 # Type hints
 from typing import Callable
+from anyio import TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus
 from ..proto._base import _Client, _Conn, _Server
+from ..metrics import Registry
+
+class EmitResult:
+    """
+        The outcome of emitting data to a set of peers
+    """
+
+    delivered: list[str] # Peers the data was queued for
+    pending: list[str] # Peers still being connected to, or waiting for room, in the background
+    failed: list[str] # Peers that could not be reached
+    slow: list[str] # Peers that did not accept the data in time
+    dropped: list[str] # Peers with too much still being sent to them, under a dropping send buffer policy
+
+    def __init__(self):
+        """Initialize the result
+        """
+
+        self.delivered = []
+        self.pending = []
+        self.failed = []
+        self.slow = []
+        self.dropped = []
+
+    def __repr__(self) -> str:
+        return f"EmitResult(delivered={len(self.delivered)}, pending={len(self.pending)}, failed={self.failed}, slow={self.slow}, dropped={self.dropped})"
 
 class _Router:
     """
@@ -12,6 +39,7 @@ class _Router:
     """
 
     node_id: str # The ID of the node
+    metrics: Registry # The metrics the router reports
 
     def __init__(self, protocol: tuple[_Client, _Conn, _Server]):
         """Initialize the router
@@ -19,6 +47,22 @@ class _Router:
 
         raise NotImplementedError("This is an abstract class")
 
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Runs the router's background tasks
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    async def warm_up(self):
+        """Connects to peers ahead of sending to them, once we are running
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
     async def enter(self, entry_addr: tuple[str, int], host_addr: tuple[str, int]):
         """Enters a cluster
 
@@ -29,30 +73,110 @@ class _Router:
 
         raise NotImplementedError("This is an abstract class")
     
-    async def send_to(self, node_id: str, data: bytes):
+    async def send_to(self, node_id: str, data: bytes, name: str = ""):
         """Sends data to a node
 
         Args:
             node_id (str): The ID of the node to send to
             data (bytes): The data to send
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
         """
 
         raise NotImplementedError("This is an abstract class")
     
-    async def emit(self, data: bytes):
+    async def request(self, node_id: str, data: bytes, name: str = "", timeout: float = 30.0) -> bytes:
+        """Sends a request to a node, and waits for its response
+
+        Args:
+            node_id (str): The ID of the node to send to
+            data (bytes): The data to send
+            name (str, optional): The name of the event the request is for. Defaults to "".
+            timeout (float, optional): Seconds to wait for the response, or None to wait forever. Defaults to 30.0.
+
+        Returns:
+            bytes: The response
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    async def respond(self, node_id: str, request_id: int, data: bytes, error: bool = False):
+        """Sends the response to a request
+
+        Args:
+            node_id (str): The ID of the node that sent the request
+            request_id (int): The ID of the request
+            data (bytes): The response, or a description of the error
+            error (bool, optional): Whether the request failed. Defaults to False.
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    async def emit(self, data: bytes, name: str = "") -> EmitResult:
         """Emits data to all connected nodes
         
         Args:
             data (bytes): The data to emit
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
+
+        Returns:
+            EmitResult: Which peers the data was queued for, and which are still being sent to in the background
         """
 
         raise NotImplementedError("This is an abstract class")
     
-    async def register_data_handler(self, data_handler: Callable[[str, bytes],None]):
+    async def register_data_handler(self, data_handler: Callable[[str, str, bytes],None]):
         """Registers the data handler
         
         Args:
-            data_handler (Callable[[bytes],None]): The handler which is called when data is received.
+            data_handler (Callable[[str, str, bytes],None]): The handler which is called with the sender, event name and data received. Events registered with register_event may be named by their ID instead.
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    async def register_request_handler(self, request_handler: Callable[[str, str, int, bytes],None]):
+        """Registers the request handler
+
+        Args:
+            request_handler (Callable[[str, str, int, bytes],None]): The handler which is called with the sender, event name, request ID and data of requests received. It must eventually answer each request with respond.
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    def register_event(self, name: str) -> int:
+        """Gives an event we handle a numeric ID, and tells peers about it
+
+        Args:
+            name (str): The name of the event
+
+        Returns:
+            int: The ID, which indexes a flat table of the events we handle
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    def register_pattern(self, pattern: str):
+        """Records a pattern of event names we handle, and tells peers about it
+
+        Args:
+            pattern (str): The pattern
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    def set_catch_all(self, catch_all: bool):
+        """Sets whether we handle events we registered no ID for, and tells peers
+
+        Args:
+            catch_all (bool): Whether peers should send us every event
+        """
+
+        raise NotImplementedError("This is an abstract class")
+
+    async def register_sys_handler(self, sys_handler: Callable[..., None]):
+        """Registers the system event handler
+        
+        Args:
+            sys_handler (Callable[..., None]): The handler which is called with the name and arguments of system events.
         """
 
         raise NotImplementedError("This is an abstract class")
@@ -0,0 +1,222 @@
+"""
+    Gossip-based routing system
+"""
+
+# Logging
+from ..logger import logger
+
+# Router parent
+from .peer import PeerRouter
+from ._base import EmitResult
+
+# Type Hints
+from ..proto._base import _Client, _Conn, _Server
+from typing import Callable
+
+# Serialization
+from ..msg.envelope import frame_length
+from ..msg import MsgNum, own
+import struct
+
+# Standard Library Imports
+from collections import OrderedDict
+from functools import partial
+import math
+import random
+import uuid
+
+
+class GossipRouter(PeerRouter):
+    """Gossip-based routing system
+
+    Rather than sending every broadcast to every peer, each node forwards
+    a broadcast it has not seen before to a random subset of its peers.
+    Control traffic such as join announcements still reaches every peer.
+
+    Broadcasts are only gossiped between nodes that handle the event, and
+    a node that does not handle it neither delivers it to itself nor
+    keeps it spreading.
+
+    In small clusters gossip only adds duplicates and hops, so broadcasts
+    are sent straight to every peer that handles them, as by PeerRouter.
+    """
+
+    _fmt = "!BQ16sBB" # frame type, frame length, broadcast ID, hops left, sender ID length
+    _body_fmt = "!16sBB" # broadcast ID, hops left, sender ID length, followed by the sender ID
+    _body_size = struct.calcsize(_body_fmt)
+
+    fanout: int
+    max_hops: int
+    min_gossip_nodes: int
+    _seen: OrderedDict[bytes, None]
+    _seen_size: int
+
+    def __init__(self, protocol: tuple[_Client, _Conn, _Server],
+        fanout: int = None,
+        max_hops: int = None,
+        seen_size: int = 8192,
+        min_gossip_nodes: int = 16,
+        **kwargs):
+        """Initialize the router
+
+        Args:
+            protocol (tuple[_Client, _Conn, _Server]): The protocol to use.
+            fanout (int, optional): The number of peers each broadcast is forwarded to. Defaults to log2 of the cluster size, plus two.
+            max_hops (int, optional): The number of times a broadcast is forwarded. Defaults to log2 of the cluster size, plus two.
+            seen_size (int, optional): The number of recent broadcast IDs remembered for deduplication. Defaults to 8192.
+            min_gossip_nodes (int, optional): Clusters with fewer nodes than this are broadcast to directly. Defaults to 16.
+            **kwargs: Passed to PeerRouter.
+        """
+
+        super().__init__(protocol, **kwargs)
+
+        # Save gossip parameters
+        self.fanout = fanout
+        self.max_hops = max_hops
+        self.min_gossip_nodes = min_gossip_nodes
+
+        # Recently seen broadcasts
+        self._seen = OrderedDict()
+        self._seen_size = seen_size
+
+    def _log_size(self) -> int:
+        """The base two logarithm of the cluster size, rounded up
+
+        Returns:
+            int: The logarithm, at least one
+        """
+
+        return max(1, math.ceil(math.log2(len(self.peers) + 1)))
+
+    def _mark_seen(self, msg_id: bytes) -> bool:
+        """Records a broadcast as seen
+
+        Args:
+            msg_id (bytes): The ID of the broadcast
+
+        Returns:
+            bool: Whether the broadcast had already been seen
+        """
+
+        if msg_id in self._seen:
+            return True
+
+        # Remember it, forgetting the oldest if we are full
+        self._seen[msg_id] = None
+        if len(self._seen) > self._seen_size:
+            self._seen.popitem(last=False)
+
+        return False
+
+    async def emit(self, data: bytes, name: str = "") -> EmitResult:
+        """Gossips data to all nodes
+
+        Args:
+            data (bytes): The data to emit
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
+
+        Returns:
+            EmitResult: Which of the chosen peers the data was queued for
+        """
+
+        # Send straight to every peer in small clusters
+        if len(self.peers) + 1 < self.min_gossip_nodes:
+            return await super().emit(data, name)
+
+        # Serialize message
+        frame = self._packer.pack(name, data)
+
+        # Give the broadcast an ID
+        msg_id = uuid.uuid4().bytes
+        self._mark_seen(msg_id)
+
+        # Hop limit
+        hops = self.max_hops if self.max_hops is not None else self._log_size() + 2
+
+        # Forward to a subset of peers
+        result = await self._gossip(msg_id, hops, frame, name,
+            on_delivered=partial(self._count_sent, name, len(frame[1])))
+
+        # Handle it ourselves, if we would have been sent it
+        if self._handles_locally(name):
+            await self.data_handler(self.node_id, name, data)
+
+        return result
+
+    async def _gossip(self, msg_id: bytes, hops: int, frame: list[bytes], name: str,
+        on_delivered: Callable[[list[str]], None] = None, have_it: tuple[str, ...] = ()) -> EmitResult:
+        """Forwards a broadcast to a random subset of the peers handling it
+
+        Args:
+            msg_id (bytes): The ID of the broadcast
+            hops (int): The number of further hops the broadcast may take
+            frame (list[bytes]): The buffers of the frame being broadcast
+            name (str): The name of the event being broadcast
+            on_delivered (Callable[[list[str]], None], optional): Called with the peers the broadcast was queued for. Defaults to None.
+            have_it (tuple[str, ...], optional): Peers known to have the broadcast already. Defaults to none.
+
+        Returns:
+            EmitResult: Which of the chosen peers the data was queued for
+        """
+
+        # Choose among peers that handle the event and do not have it yet
+        fanout = self.fanout if self.fanout is not None else self._log_size() + 2
+        peers = [peer for peer in self.peers if peer not in have_it and self.handles(peer, name)]
+        chosen = random.sample(peers, min(fanout, len(peers)))
+
+        # Wrap the frame without copying it, saying who sent it on
+        sender = self.node_id.encode()
+        header = struct.pack(
+            self._fmt,
+            4,
+            self._body_size + len(sender) + frame_length(frame),
+            msg_id,
+            hops - 1,
+            len(sender)
+        ) + sender
+
+        # Send to the chosen peers through the regular fan-out
+        return await self._send_to_peers(chosen, [header, *frame], on_delivered=on_delivered)
+
+    async def _on_message(self, data_type: int, data: bytes, addr: tuple[str, int], conn: _Conn = None):
+        """Handles the decompressed payload of a frame
+
+        Args:
+            data_type (int): The message type of the frame
+            data (bytes): The payload of the frame
+            addr (tuple[str, int]): The address of the sender
+            conn (Optional[_Conn]): The connection to use to send data
+        """
+
+        # Pass other frames on to the peer router
+        if data_type != 4:
+            await super()._on_message(data_type, data, addr, conn)
+            return
+
+        # Unpack the broadcast
+        view = memoryview(data)
+        msg_id, hops, sender_len = struct.unpack_from(self._body_fmt, view, 0)
+        start = self._body_size + sender_len
+        sender = str(view[self._body_size:start], "utf-8")
+        frame = view[start:]
+
+        # Drop broadcasts we have already handled
+        if self._mark_seen(msg_id):
+            return
+
+        # Find the event, and the node that emitted it
+        _, payload = MsgNum.loads(frame)
+        _, emitter, name, _, _ = self._unpacker.unpack(payload)
+
+        # Keep it spreading, but not back to the nodes it came from
+        if hops > 0:
+            if self._tg is not None:
+                # Forwarding outlives the receive buffer
+                self._tg.start_soon(partial(self._gossip, msg_id, hops, [own(frame)], name,
+                    have_it=(sender, emitter)))
+            else:
+                await self._gossip(msg_id, hops, [frame], name, have_it=(sender, emitter))
+
+        # Handle it ourselves, if we handle the event at all
+        if self._handles_locally(name):
+            await super()._on_message(3, payload, addr, conn)
@@ -9,9 +9,20 @@ from ..logger import logger
 
 # Unique IDs
 import uuid
+import itertools
+
+# Choosing peers to warm up
+import random
+import struct
+
+# Timing requests
+import time
+
+# Counting sends that finish in the background
+from functools import partial
 
 # Router parent
-from ._base import _Router
+from ._base import _Router, EmitResult
 
 # Type Hints
 from ..proto._base import _Client, _Conn, _Server
@@ -19,15 +30,60 @@ from typing import Callable
 
 # Clients and servers
 from ..conn import MultiClientCache
+from ..conn.queued import BLOCK
+
+# Failure detection
+from .swim import SwimDetector
+
+# Membership anti-entropy
+from .sync import MembershipSync, SYNC, DELTA
+
+# Metrics
+from ..metrics import Registry
+
+# Wildcard subscriptions
+from ..patterns import PatternIndex
 
 
 # Serialization
-from ..msg import MsgNum
+from ..msg import MsgNum, MsgNumReader, MAX_FRAME_SIZE, Compressor, EnvelopePacker, EnvelopeUnpacker, own
+from ..msg.envelope import frame_length, EVENT, REQUEST, RESPONSE, ERROR
 import msgpack
 
 # Errors
-from ..err import NodeNotFound
-from anyio import EndOfStream
+from ..err import NodeNotFound, RemoteError, FrameTooLarge
+from anyio import EndOfStream, ClosedResourceError, BrokenResourceError
+
+# Anyio
+from anyio import create_task_group, move_on_after, fail_after, sleep, CapacityLimiter, Semaphore, Event, WouldBlock, TASK_STATUS_IGNORED
+from anyio.abc import TaskGroup, TaskStatus
+
+
+# What decoding a frame a peer got wrong can raise, from bad msgpack,
+# truncated headers, unknown codecs and payloads of the wrong shape
+MALFORMED_FRAME_ERRORS = (ValueError, TypeError, IndexError, struct.error, msgpack.exceptions.UnpackException)
+
+
+class _PendingRequest:
+    """
+        A request waiting for its response
+    """
+
+    __slots__ = ("node_id", "done", "kind", "data")
+
+    def __init__(self, node_id: str):
+        """Initialize the request
+
+        Args:
+            node_id (str): The node the request was sent to
+        """
+
+        self.node_id = node_id
+        self.done = Event()
+
+        # Left unset if the node goes before responding
+        self.kind = None
+        self.data = None
 
 
 class PeerRouter(_Router):
@@ -38,22 +94,309 @@ class PeerRouter(_Router):
     host_addr: tuple[str, int]
     connections: MultiClientCache
     peers: dict[str, tuple[str, int]]
-    data_handler: Callable[[bytes],None]
+    peer_codecs: dict[str, list[str]]
+    event_ids: dict[str, int]
+    peer_event_ids: dict[str, dict[str, int]]
+    catch_all: bool
+    peers_catch_all: set[str]
+    patterns: PatternIndex
+    peer_patterns: dict[str, PatternIndex]
+    version: int
+    _record_unannounced: bool
+    announce_delay: float
+    _joined: list[tuple]
+    warm_up_peers: int
+    warm_up_concurrency: int
+    _event_names: list[str]
+    compression: Compressor
+    _packer: EnvelopePacker
+    _unpacker: EnvelopeUnpacker
+    data_handler: Callable[[str, str, bytes],None]
+    request_handler: Callable[[str, str, int, bytes],None]
+    sys_handler: Callable[..., None]
+    _requests: dict[int, _PendingRequest]
+    failure_detector: SwimDetector
+    membership: MembershipSync
     entry: str
+    entry_id: str
     node_id: str
-
-
-    def __init__(self, protocol: tuple[_Client, _Conn, _Server]):
+    peer_timeout: float
+    max_frame_size: int
+    max_background_sends: int
+    send_buffer_policy: str
+    _backlog: dict[str, Semaphore]
+    _fanout: CapacityLimiter
+    _tg: TaskGroup
+    metrics: Registry
+
+
+    def __init__(self, protocol: tuple[_Client, _Conn, _Server],
+        max_batch: int = 65536,
+        max_delay: float = 0.0,
+        max_fanout: int = 64,
+        peer_timeout: float = 5.0,
+        max_connections: int = 1024,
+        connection_ttl: int = 60,
+        probe_interval: float = 1.0,
+        probe_timeout: float = 0.5,
+        indirect_probes: int = 3,
+        suspect_timeout: float = 5.0,
+        tombstone_timeout: float = 60.0,
+        sync_interval: float = 10.0,
+        announce_delay: float = 0.05,
+        warm_up: int = 0,
+        warm_up_concurrency: int = 32,
+        compression: list[str] = (),
+        compression_threshold: int = 1024,
+        send_buffer: int = 1 << 24,
+        send_buffer_policy: str = "block",
+        send_buffer_high_water: int = None,
+        max_background_sends: int = 64,
+        dial_backoff: float = 0.1,
+        max_dial_backoff: float = 5.0,
+        max_frame_size: int = MAX_FRAME_SIZE,
+        metrics: Registry = None):
         """Initialize the router
+
+        Args:
+            protocol (tuple[_Client, _Conn, _Server]): The protocol to use.
+            max_batch (int, optional): The maximum number of bytes coalesced into one write to a peer. Defaults to 65536.
+            max_delay (float, optional): How long a write to a peer waits for more data to batch with. Defaults to 0.0.
+            max_fanout (int, optional): The maximum number of peers sent to at once while emitting. Defaults to 64.
+            peer_timeout (float, optional): How long emitting waits on a single peer. Defaults to 5.0.
+            max_connections (int, optional): The maximum number of outbound connections kept open. Defaults to 1024.
+            connection_ttl (int, optional): How long an idle outbound connection is kept open. Defaults to 60.
+            probe_interval (float, optional): Seconds between failure detection probes, or None to disable failure detection. Defaults to 1.0.
+            probe_timeout (float, optional): Seconds to wait for a peer to acknowledge a probe. Defaults to 0.5.
+            indirect_probes (int, optional): The number of peers asked to probe an unresponsive peer. Defaults to 3.
+            suspect_timeout (float, optional): Seconds a suspected peer has to refute before it is removed. Defaults to 5.0.
+            tombstone_timeout (float, optional): Seconds a removed peer is remembered for, so stale records of it do not bring it back. Defaults to 60.0.
+            sync_interval (float, optional): Seconds between membership exchanges with a random peer, or None to only sync once after joining. Defaults to 10.0.
+            announce_delay (float, optional): Seconds the records of nodes joining through us are held, to be announced to peers together. Defaults to 0.05.
+            warm_up (int, optional): The number of peers, chosen at random, to connect to once we have joined, or None for all of them. Defaults to 0, connecting to peers when first sending to them.
+            warm_up_concurrency (int, optional): The maximum number of peers connected to at once while warming up. Defaults to 32.
+            compression (list[str], optional): The compression codecs we accept, in order of preference, such as ("zlib",). Defaults to (), sending everything uncompressed.
+            compression_threshold (int, optional): Payloads smaller than this are sent uncompressed. Defaults to 1024.
+            send_buffer (int, optional): The most bytes queued for each peer, or None for no limit. Defaults to 16 MiB.
+            send_buffer_policy (str, optional): What to do with messages to a peer whose buffer is full: block, drop_newest, drop_oldest or disconnect. Defaults to block.
+            send_buffer_high_water (int, optional): Queued bytes above which the send_buffer_high system event is reported for a peer. Defaults to three quarters of send_buffer.
+            max_background_sends (int, optional): The most emits still being sent to one peer in the background. Further emits to it wait under the block policy, and are dropped for it under the others. Defaults to 64.
+            dial_backoff (float, optional): Seconds a peer that could not be connected to is not dialed again for, doubling with each failure in a row. Defaults to 0.1.
+            max_dial_backoff (float, optional): The longest a peer is not dialed again for. Defaults to 5.0.
+            max_frame_size (int, optional): The largest frame accepted from a peer. Connections sending larger frames are closed. Defaults to 64 MiB.
+            metrics (Registry, optional): The registry to report to. Defaults to a new registry.
         """
 
         
         # Set default values
+        self.node_id = None
+        self.entry_id = None
         self.peers = dict()
+        self.peer_codecs = dict()
         self.data_handler = None
+        self.request_handler = None
+
+        # Requests waiting for a response, by request ID
+        self._requests = dict()
+        self._request_ids = itertools.count(1)
+
+        # Our numeric IDs for the events we handle, and each peer's IDs for theirs
+        self.event_ids = dict()
+        self._event_names = []
+        self.peer_event_ids = dict()
+        self.sys_handler = None
+
+        # Whether we, and which peers, handle events they registered no ID for
+        self.catch_all = True
+        self.peers_catch_all = set()
+
+        # The patterns of event names we, and each peer, handle
+        self.patterns = PatternIndex()
+        self.peer_patterns = dict()
+
+        # The version of our record, bumped whenever what we handle changes
+        self.version = 0
+        self._record_unannounced = False
+        self.membership = MembershipSync(self, sync_interval, tombstone_timeout)
+
+        # Records of nodes that joined through us, waiting to be announced
+        self.announce_delay = announce_delay
+        self._joined = []
+
+        # How many peers to connect to up front
+        self.warm_up_peers = warm_up
+        self.warm_up_concurrency = warm_up_concurrency
+
+        # Create the metrics
+        self.metrics = metrics if metrics is not None else Registry()
+        self._create_metrics()
+
+        # Create the compressor
+        self.compression = Compressor(compression, compression_threshold)
+
+        # Data envelopes are packed once we have an ID
+        self._packer = None
+        self._unpacker = EnvelopeUnpacker()
+
+        # Frames longer than this are refused before being read
+        self.max_frame_size = max_frame_size
+
+        # Save fan-out limits
+        self._fanout = CapacityLimiter(max_fanout)
+        self.peer_timeout = peer_timeout
+
+        # Emits left to the background, by peer, so they can not pile up
+        self.max_background_sends = max_background_sends
+        self.send_buffer_policy = send_buffer_policy
+        self._backlog = dict()
+
+        # Background tasks are started once we are running
+        self._tg = None
+
+        # Create the failure detector
+        self.failure_detector = None
+        if probe_interval is not None:
+            self.failure_detector = SwimDetector(self,
+                probe_interval=probe_interval,
+                probe_timeout=probe_timeout,
+                indirect_probes=indirect_probes,
+                suspect_timeout=suspect_timeout,
+                dead_timeout=tombstone_timeout)
+
+        # Warn about peers at three quarters of their send buffer, unless told otherwise
+        if send_buffer_high_water is None and send_buffer is not None:
+            send_buffer_high_water = send_buffer * 3 // 4
 
         # Create MultiConnectionCache
-        self.connections = MultiClientCache(proto=protocol)
+        self.connections = MultiClientCache(proto=protocol,
+            max_size=max_connections,
+            ttl=connection_ttl,
+            max_batch=max_batch,
+            max_delay=max_delay,
+            metrics=self.metrics,
+            on_dial=self._on_dial,
+            max_pending=send_buffer,
+            policy=send_buffer_policy,
+            high_water=send_buffer_high_water,
+            on_high_water=self._on_high_water,
+            dial_backoff=dial_backoff,
+            max_dial_backoff=max_dial_backoff,
+            retire_frame=MsgNum.dumps(12, msgpack.packb(None)),
+            retire_timeout=peer_timeout)
+
+    def _create_metrics(self):
+        """Creates the metrics the router reports
+        """
+
+        m = self.metrics
+
+        # Data messages and their payload bytes, by event and separately by peer,
+        # so the number of series grows with peers plus events rather than their product
+        self._m_sent = m.summary("pydevts_message_bytes_sent", "Data messages sent, and their payload bytes", ("event",))
+        self._m_received = m.summary("pydevts_message_bytes_received", "Data messages received, and their payload bytes", ("event",))
+        self._m_peer_sent = m.summary("pydevts_peer_message_bytes_sent", "Data messages sent to each peer, and their payload bytes", ("peer",))
+        self._m_peer_received = m.summary("pydevts_peer_message_bytes_received", "Data messages received from each peer, and their payload bytes", ("peer",))
+
+        # All frames on the wire, including control traffic
+        self._m_frames_sent = m.counter("pydevts_frames_sent_total", "Frames sent to peers")
+        self._m_frame_bytes_sent = m.counter("pydevts_frame_bytes_sent_total", "Frame bytes sent to peers")
+        self._m_frames_received = m.counter("pydevts_frames_received_total", "Frames received from peers")
+        self._m_frame_bytes_received = m.counter("pydevts_frame_bytes_received_total", "Frame bytes received from peers")
+
+        # Membership
+        self._m_joins = m.counter("pydevts_joins_total", "Nodes that joined the cluster through us")
+        self._m_join_announcements = m.counter("pydevts_join_announcements_total", "Frames announcing nodes that joined through us")
+        self._m_warm_up = m.counter("pydevts_warm_up_connections_total", "Peers connected to while warming up, by outcome", ("outcome",))
+        self._m_emit_failures = m.counter("pydevts_emit_failures_total", "Peers an emit could not deliver to", ("reason",))
+        self._m_emit_skipped = m.counter("pydevts_emit_peers_skipped_total", "Peers an emit was not sent to because they do not handle the event")
+        m.gauge("pydevts_peers", "Known peers").set_function(lambda: len(self.peers))
+        self._m_syncs = m.counter("pydevts_membership_syncs_total", "Membership digests received, by whether they matched ours", ("outcome",))
+        self._m_sync_records = m.counter("pydevts_membership_records_sent_total", "Membership records sent to peers whose digests differed")
+
+        # Requests we sent
+        self._m_requests = m.counter("pydevts_requests_total", "Requests sent, by outcome", ("outcome",))
+        self._m_request_seconds = m.histogram("pydevts_request_seconds", "Time from sending a request to its response", ("event",))
+        m.gauge("pydevts_requests_pending", "Requests waiting for a response").set_function(lambda: len(self._requests))
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Runs the router's background tasks
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        # Connections dialed before now have not introduced us yet
+        dialed = self.connections.dialed() if self.node_id is not None else []
+
+        async with create_task_group() as tg:
+            self._tg = tg
+
+            # Start the per-peer writers
+            await tg.start(self.connections.run)
+
+            # Introduce ourselves over them, so peers can send back over them
+            for handle, connection in dialed:
+                try:
+                    await self.connections.send(handle, self._hello())
+                except OSError:
+                    continue
+
+                tg.start_soon(self._read, connection)
+
+            # Start probing peers
+            if self.failure_detector is not None:
+                await tg.start(self.failure_detector.run)
+
+            # Fetch the membership from the node we joined through, then keep it in sync
+            if self._packer is not None:
+                await tg.start(self.membership.run, self.entry_id)
+
+            # Tell peers about events registered since we joined
+            if self._record_unannounced and self._packer is not None:
+                tg.start_soon(self._announce_events)
+
+            task_status.started()
+
+    async def warm_up(self):
+        """Connects to peers ahead of sending to them, once we are running
+
+        Waits for the membership from the node we joined through, then
+        connects to the configured number of peers concurrently, so the
+        first messages to them do not wait on connecting.
+        """
+
+        if self.warm_up_peers == 0:
+            return
+
+        # Wait for the rest of the membership, if we joined a cluster
+        with move_on_after(self.peer_timeout):
+            await self.membership.synced.wait()
+
+        peers = list(self.peers.items())
+        if self.warm_up_peers is not None and self.warm_up_peers < len(peers):
+            peers = random.sample(peers, self.warm_up_peers)
+
+        started = time.perf_counter()
+        limit = CapacityLimiter(self.warm_up_concurrency)
+
+        async def _connect(peer: str, addr: tuple[str, int]):
+            async with limit:
+                with move_on_after(self.peer_timeout) as scope:
+                    try:
+                        await self.connections.connect(addr[0], addr[1])
+                    except OSError as e:
+                        logger.debug(f"Unable to connect to {peer} while warming up: {e!r}")
+                        self._m_warm_up.labels("failed").inc()
+                        return
+
+            self._m_warm_up.labels("slow" if scope.cancel_called else "connected").inc()
+
+        async with create_task_group() as tg:
+            for peer, addr in peers:
+                tg.start_soon(_connect, peer, addr)
+
+        logger.info(f"Warmed up connections to {len(peers)} peers in {time.perf_counter() - started:.3f}s")
 
     async def enter(self, entry_addr: tuple[str, int], host_addr: tuple[str, int]):
         """Enters a cluster
@@ -76,15 +419,18 @@ class PeerRouter(_Router):
             await self.connections.send(
                 self.entry,
                 MsgNum.dumps(0, msgpack.packb(
-                    (host_addr,)
+                    (host_addr, self.compression.codecs, self.event_ids, self.catch_all, self.patterns.patterns, self.version)
                 ))
             )
 
-            # Await out connection info
-            conn_info = await self.connections.recv(self.entry)
+            # Await our ID, which may span several reads
+            reader = MsgNumReader(self.max_frame_size)
+            frames = []
+            while not frames:
+                frames = reader.feed(await self.connections.recv(self.entry))
             
             # Unpack connection info
-            data_type, data = MsgNum.loads(conn_info)
+            data_type, data = frames[0]
 
             # Verify that we have joined successfully
             if data_type != 1:
@@ -93,118 +439,908 @@ class PeerRouter(_Router):
             # Unpack data
             data = msgpack.unpackb(data)
 
-            # Save peer list
-            self.peers = data[0]
-
             # Save our ID
-            self.node_id = str(data[1])
+            self.node_id = str(data[0])
+            self.membership.set_version(self.node_id, self.version)
+
+            # Add the entry node, at the address we reached it on. The rest
+            # of the membership is fetched from it once we are running
+            record = list(data[1])
+            record[2] = self.entry_addr
+            self.entry_id = record[0]
+            await self._merge(record)
 
-            # Save the entry node ID in peers
-            self.peers[data[2]] = self.entry_addr
+            # Everything registered so far went out with the join
+            self._record_unannounced = False
 
             # Log that we have joined
-            logger.info(f"Joined cluster via entry node {data[2]}@{self.entry_addr[0]}:{self.entry_addr[1]}")
+            logger.info(f"Joined cluster via entry node {self.entry_id}@{self.entry_addr[0]}:{self.entry_addr[1]}")
 
 
         except (OSError, EndOfStream) as e:
             logger.warning(f"Unable to connect to cluster at {self.entry_addr[0]}:{self.entry_addr[1]}. Starting new cluster")
             self.node_id = str(uuid.uuid4())
+            self.membership.set_version(self.node_id, self.version)
+
+        # Data we send carries our ID
+        self._packer = EnvelopePacker(self.node_id)
 
         
     
-    async def send_to(self, node_id: str, data: bytes):
+    async def send_to(self, node_id: str, data: bytes, name: str = ""):
         """Sends data to a node
 
         Args:
             node_id (str): The ID of the node to send to
             data (bytes): The data to send
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
         """
         
         # If this is ourself, just handle it
         if node_id == self.node_id:
-            await self._on_data(MsgNum.dumps(3, msgpack.packb((self.node_id, bytes(data)))), self.host_addr)
+            await self.data_handler(self.node_id, name, data)
 
             # Return so we do not keep executing code
             return
 
+        await self._send_message(node_id, name, data)
+
+    async def request(self, node_id: str, data: bytes, name: str = "", timeout: float = 30.0) -> bytes:
+        """Sends a request to a node, and waits for its response
+
+        Requests share the connection to the node with everything else we
+        send it, and are matched to their responses by ID, so any number
+        may be in flight at once.
+
+        Args:
+            node_id (str): The ID of the node to send to
+            data (bytes): The data to send
+            name (str, optional): The name of the event the request is for. Defaults to "".
+            timeout (float, optional): Seconds to wait for the response, or None to wait forever. Defaults to 30.0.
+
+        Raises:
+            TimeoutError: If the response did not arrive in time
+            RemoteError: If the node failed to handle the request
+            NodeNotFound: If the node is not a peer, or left before responding
+
+        Returns:
+            bytes: The response
+        """
+
+        request_id = next(self._request_ids)
+        pending = _PendingRequest(node_id)
+        self._requests[request_id] = pending
+
+        started = time.perf_counter()
+
+        try:
+            with fail_after(timeout):
+                # If this is ourself, just handle it
+                if node_id == self.node_id:
+                    await self.request_handler(self.node_id, name, request_id, data)
+                else:
+                    await self._send_message(node_id, name, data, REQUEST, request_id)
+
+                await pending.done.wait()
+        except TimeoutError:
+            self._m_requests.labels("timeout").inc()
+            raise
+        finally:
+            del self._requests[request_id]
+            self._m_request_seconds.labels(self._event_label(name, node_id)).observe(time.perf_counter() - started)
+
+        if pending.kind is None:
+            self._m_requests.labels("peer_down").inc()
+            raise NodeNotFound(f"Node {node_id} left before responding to {name}")
+
+        if pending.kind == ERROR:
+            self._m_requests.labels("error").inc()
+            raise RemoteError(f"Node {node_id} failed to handle {name}: {str(pending.data, 'utf-8', 'replace')}")
+
+        self._m_requests.labels("ok").inc()
+        return pending.data
+
+    async def respond(self, node_id: str, request_id: int, data: bytes, error: bool = False):
+        """Sends the response to a request
+
+        Args:
+            node_id (str): The ID of the node that sent the request
+            request_id (int): The ID of the request
+            data (bytes): The response, or a description of the error
+            error (bool, optional): Whether the request failed. Defaults to False.
+        """
+
+        kind = ERROR if error else RESPONSE
+
+        # If this is ourself, just resolve it
+        if node_id == self.node_id:
+            self._resolve(node_id, request_id, kind, data)
+            return
+
+        await self._send_message(node_id, "", data, kind, request_id)
+
+    def _resolve(self, sender: str, request_id: int, kind: int, data: bytes):
+        """Hands a response to the request waiting for it
+
+        Args:
+            sender (str): The node that sent the response
+            request_id (int): The ID of the request
+            kind (int): RESPONSE or ERROR
+            data (bytes): The response
+        """
+
+        pending = self._requests.get(request_id)
+
+        # Drop responses to requests that timed out, and ones from the wrong node
+        if pending is None or pending.node_id != sender:
+            return
+
+        # The waiting task runs after the receive buffer may be reused
+        pending.kind = kind
+        pending.data = own(data)
+        pending.done.set()
+
+    async def _send_message(self, node_id: str, name: str, data: bytes, kind: int = EVENT, request_id: int = 0):
+        """Sends an enveloped message to a peer
+
+        Args:
+            node_id (str): The ID of the peer to send to
+            name (str): The name of the event the data belongs to
+            data (bytes): The data to send
+            kind (int, optional): The kind of message. Defaults to EVENT.
+            request_id (int, optional): The request the message belongs to. Defaults to 0.
+        """
+
         # Check if the node is in our peers
         if node_id not in self.peers.keys():
             # If not, raise error
             raise NodeNotFound(f"Unable to find node with id {node_id}")
 
-        # Serialize the message
-        data = MsgNum.dumps(3, msgpack.packb((self.node_id, bytes(data),)))
+        # Serialize the message, naming the event by the peer's ID for it if we know it
+        event_id = self.peer_event_ids.get(node_id, {}).get(name)
+        if event_id is not None:
+            packed = self._packer.pack_id(event_id, data, kind, request_id)
+        else:
+            packed = self._packer.pack(name, data, kind, request_id)
+        frame = self.compression.compress(
+            packed,
+            self.compression.choose(self.peer_codecs.get(node_id))
+        )
         
-        # Connect to the node
-        handle = await self.connections.connect(self.peers[node_id][0], self.peers[node_id][1])
-
         # Send
-        await self.connections.send(handle, data)
+        await self._send_frame(self.peers[node_id], frame)
 
-        # Cleanup
-        self.connections.clean()
+        self._count_sent(name, len(packed[1]), [node_id])
     
-    async def emit(self, data: bytes):
+    async def emit(self, data: bytes, name: str = "") -> EmitResult:
         """Emits data to all connected nodes
         
         Args:
             data (bytes): The data to emit
+            name (str, optional): The name of the event the data belongs to. Defaults to "".
+
+        Returns:
+            EmitResult: Which peers the data was queued for, and which are still being sent to in the background
         """
         
-        
         # Serialize message
-        data = MsgNum.dumps(3, msgpack.packb((self.node_id, bytes(data))))
-        
+        frame = self._packer.pack(name, data)
+
+        # Only send to peers that handle the event
+        peers = [peer for peer in self.peers.keys() if self.handles(peer, name)]
+        if len(peers) < len(self.peers):
+            self._m_emit_skipped.inc(len(self.peers) - len(peers))
+
+        # Frames too small to compress are cheap to address to each peer by event ID
+        by_id = None
+        if len(frame[1]) < self.compression.threshold:
+            by_id = dict()
+            for peer in peers:
+                event_id = self.peer_event_ids.get(peer, {}).get(name)
+                if event_id is not None:
+                    by_id[peer] = self._packer.pack_id(event_id, frame[1])
 
-        # Emit the message
-        await self._emit(data)
+        # Send to all peers
+        result = await self._send_to_peers(peers, frame, by_id,
+            on_delivered=partial(self._count_sent, name, len(frame[1])))
 
+        # Handle it ourselves, if we would have been sent it
+        if self._handles_locally(name):
+            await self.data_handler(self.node_id, name, data)
 
+        return result
 
-    async def _emit(self, data: bytes) -> None:
-        """Internal function to emit data to all connected nodes
+    def _handles_locally(self, name: str) -> bool:
+        """Checks whether this node handles an event
 
         Args:
-            data (bytes): The data to emit
+            name (str): The name of the event
+
+        Returns:
+            bool: Whether the event has a handler here
         """
 
-        # List of peers to remove
-        remove = []
+        return self.catch_all or name in self.event_ids or len(self.patterns.match(name)) > 0
 
-        # Send to all peers
-        for peer in self.peers.copy().keys():
+    def handles(self, node_id: str, name: str) -> bool:
+        """Checks whether a peer handles an event, from what it has told us
+
+        Args:
+            node_id (str): The ID of the peer
+            name (str): The name of the event
+
+        Returns:
+            bool: Whether the peer handles the event
+        """
+
+        if node_id in self.peers_catch_all or name in self.peer_event_ids.get(node_id, ()):
+            return True
+
+        patterns = self.peer_patterns.get(node_id)
+        return patterns is not None and len(patterns.match(name)) > 0
+
+    def _add_peer_patterns(self, node_id: str, patterns: list[str]):
+        """Records patterns of events a peer handles
+
+        Args:
+            node_id (str): The ID of the peer
+            patterns (list[str]): The patterns
+        """
+
+        if not patterns:
+            return
+
+        index = self.peer_patterns.get(node_id)
+        if index is None:
+            index = self.peer_patterns[node_id] = PatternIndex()
+
+        for pattern in patterns:
             try:
-                # Connect
-                handle = await self.connections.connect(self.peers[peer][0], self.peers[peer][1])
-
-                # Send
-                await self.connections.send(handle, bytes(data))
-                
-                # Clean up connections
-                self.connections.clean()
-            except OSError:
-                # Remove peer
-                remove.append(peer)
-        
-        # Remove dead peers
-        for peer in remove:
-            del self.peers[peer]
-        
-        # Handle it ourselves
-        await self._on_data(data, self.host_addr)
+                index.add(pattern)
+            except ValueError as e:
+                logger.warning(f"Ignoring pattern {pattern} from {node_id}: {e}")
+
+    def _record(self, node_id: str) -> tuple:
+        """Builds the membership record of a node we know
+
+        Args:
+            node_id (str): The ID of the node, which may be ours
+
+        Returns:
+            tuple: Its ID, version, address, codecs, event IDs, whether it handles every event, and patterns
+        """
+
+        if node_id == self.node_id:
+            return (self.node_id, self.version, self.host_addr, self.compression.codecs,
+                self.event_ids, self.catch_all, self.patterns.patterns)
+
+        patterns = self.peer_patterns.get(node_id)
+
+        return (node_id, self.membership.versions[node_id], self.peers[node_id], self.peer_codecs.get(node_id),
+            self.peer_event_ids.get(node_id, {}), node_id in self.peers_catch_all,
+            patterns.patterns if patterns is not None else [])
+
+    async def _merge(self, record: list):
+        """Takes a node's membership record, if it is newer than the one we have
+
+        Args:
+            record (list): The record, as built by _record
+        """
+
+        node_id, version, addr, codecs, event_ids, catch_all, patterns = record
+
+        if node_id == self.node_id or self.membership.is_stale(node_id, version):
+            return
+
+        # Replace what we knew of what it handles
+        self.peer_event_ids[node_id] = event_ids
+        if catch_all:
+            self.peers_catch_all.add(node_id)
+        else:
+            self.peers_catch_all.discard(node_id)
+        self.peer_patterns.pop(node_id, None)
+        self._add_peer_patterns(node_id, patterns)
+
+        self.membership.set_version(node_id, version)
+
+        # Add it if it is new to us, keeping the address we know it by otherwise
+        if node_id not in self.peers:
+            logger.info(f"New peer {node_id}@{addr[0]}:{addr[1]} has joined the cluster")
+            await self._add_peer(node_id, tuple(addr), codecs)
+        elif codecs:
+            self.peer_codecs[node_id] = codecs
+
+    def _count_sent(self, name: str, size: int, peers: list[str]):
+        """Records a data message in the metrics
+
+        Args:
+            name (str): The name of the event
+            size (int): The size of the payload in bytes
+            peers (list[str]): The peers the message was delivered to
+        """
+
+        if not peers:
+            return
+
+        # Every peer sent to handles the event, so any of them can name it
+        self._m_sent.labels(self._event_label(name, peers[0])).observe(size, len(peers))
+
+        for peer in peers:
+            self._m_peer_sent.labels(peer).observe(size)
+
+    def _event_label(self, name: str, peer: str = None) -> str:
+        """Finds the label to report an event under in the metrics
+
+        Only names we or the peer registered are reported as they are, and
+        names matching a registered pattern are reported by the pattern, so
+        names chosen by remote peers can not grow the label sets without
+        bound. The rest are reported as "other".
+
+        Args:
+            name (str): The name of the event
+            peer (str, optional): The peer sending or receiving it, whose registrations count too. Defaults to None.
+
+        Returns:
+            str: The label
+        """
+
+        if name in self.event_ids or (peer is not None and name in self.peer_event_ids.get(peer, ())):
+            return name
+
+        patterns = self.patterns.match(name)
+        if not patterns and peer is not None and peer in self.peer_patterns:
+            patterns = self.peer_patterns[peer].match(name)
+
+        return patterns[0] if patterns else "other"
+
+    async def _queue_join(self, record: tuple):
+        """Queues announcing a node that joined through us
+
+        Nodes often join in bursts, so their records are held for a short
+        while and announced to every peer in one frame.
+
+        Args:
+            record (tuple): The record of the node
+        """
+
+        self._joined.append(record)
+
+        # Announce straight away if we are not running, otherwise start the window
+        if self._tg is None:
+            await self._announce_joins()
+        elif len(self._joined) == 1:
+            self._tg.start_soon(self._announce_joins, self.announce_delay)
+
+    async def _announce_joins(self, delay: float = 0):
+        """Tells every peer about the nodes that joined through us
+
+        Args:
+            delay (float, optional): Seconds to wait for more nodes to join first. Defaults to 0.
+        """
+
+        if delay:
+            await sleep(delay)
+
+        records = self._joined
+        self._joined = []
+
+        if not records:
+            return
+
+        self._m_join_announcements.inc()
+
+        await self._send_to_peers(list(self.peers.keys()), MsgNum.dumps(2, msgpack.packb(records)))
+
+    async def _send_to_peers(self, peers: list[str], data: bytes, overrides: dict[str, list[bytes]] = None,
+        on_delivered: Callable[[list[str]], None] = None) -> EmitResult:
+        """Sends a frame to several peers at once, without waiting on any of them
+
+        The frame is queued straight away for peers we have a connection
+        to with room in its send buffer. The rest are connected to, or
+        waited on, in the background, and if they can not be sent to the
+        emit_failed system event is reported for each. Only so many sends
+        to a peer are left to the background at once, after which we wait
+        for one to finish, or drop the frame for that peer, following the
+        send buffer policy.
+
+        Args:
+            peers (list[str]): The IDs of the peers to send to
+            data (bytes): The frame to send, or a list of its buffers
+            overrides (dict[str, list[bytes]], optional): Uncompressed frames to send to particular peers instead. Defaults to None.
+            on_delivered (Callable[[list[str]], None], optional): Called with the peers the frame was queued for, including those queued in the background. Defaults to None.
+
+        Returns:
+            EmitResult: Which peers the data was queued for, and which are still pending
+        """
+
+        result = EmitResult()
+        waiting = []
+
+        # Compress the frame once for each codec in use
+        frames = {None: data}
+
+        for peer in peers:
+            addr = self.peers.get(peer)
+            if addr is None:
+                continue
+
+            if overrides and peer in overrides:
+                frame = overrides[peer]
+            else:
+                codec = self.compression.choose(self.peer_codecs.get(peer))
+                if codec not in frames:
+                    frames[codec] = self.compression.compress(data, codec)
+                frame = frames[codec]
+
+            # Queue it now if that will not wait. A broken connection has
+            # been dropped by then, so the peer is redialed with the rest
+            try:
+                if await self._send_frame_nowait(addr, frame):
+                    result.delivered.append(peer)
+                    continue
+            except OSError as e:
+                logger.debug(f"Connection to {peer} failed, redialing: {e!r}")
+
+            waiting.append((peer, addr, frame))
+
+        if on_delivered is not None and result.delivered:
+            on_delivered(result.delivered)
+
+        # Leave the rest to the background if we are running
+        if waiting and self._tg is not None:
+            admitted = []
+            held = []
+            for peer, addr, frame in waiting:
+                backlog = await self._enter_backlog(peer, result)
+                if backlog is not None:
+                    admitted.append((peer, addr, frame))
+                    held.append(backlog)
+
+            if result.dropped:
+                self._m_emit_failures.labels("dropped").inc(len(result.dropped))
+            await self._report_undelivered([], result.slow)
+
+            if admitted:
+                result.pending.extend(peer for peer, _, _ in admitted)
+                self._tg.start_soon(self._send_backlogged, admitted, held, on_delivered)
+        elif waiting:
+            waited = await self._send_waiting(waiting, on_delivered)
+            result.delivered.extend(waited.delivered)
+            result.failed.extend(waited.failed)
+            result.slow.extend(waited.slow)
+
+        return result
+
+    async def _enter_backlog(self, peer: str, result: EmitResult) -> Semaphore:
+        """Takes a place among the sends to a peer left to the background
+
+        Args:
+            peer (str): The ID of the peer
+            result (EmitResult): The result to record the peer in if it has no room
+
+        Returns:
+            Semaphore: The peer's backlog, to release once the send is done, or None if the frame is not to be sent
+        """
+
+        backlog = self._backlog.get(peer)
+        if backlog is None:
+            backlog = self._backlog[peer] = Semaphore(self.max_background_sends)
+
+        try:
+            backlog.acquire_nowait()
+            return backlog
+        except WouldBlock:
+            pass
+
+        # The peer is not keeping up, so apply its send buffer policy
+        if self.send_buffer_policy != BLOCK:
+            result.dropped.append(peer)
+            return None
 
+        with move_on_after(self.peer_timeout):
+            await backlog.acquire()
+            return backlog
 
+        result.slow.append(peer)
+        return None
 
+    async def _send_backlogged(self, waiting: list[tuple[str, tuple[str, int], bytes]], held: list[Semaphore],
+        on_delivered: Callable[[list[str]], None] = None):
+        """Sends a frame to peers in the background, then gives up their places in the backlog
 
-    async def register_data_handler(self, data_handler: Callable[[str, bytes],None]):
+        Args:
+            waiting (list[tuple[str, tuple[str, int], bytes]]): The ID, address and frame of each peer
+            held (list[Semaphore]): The backlogs of the peers
+            on_delivered (Callable[[list[str]], None], optional): Called with the peers the frame was queued for. Defaults to None.
+        """
+
+        try:
+            await self._send_waiting(waiting, on_delivered)
+        finally:
+            for backlog in held:
+                backlog.release()
+
+    async def _send_waiting(self, waiting: list[tuple[str, tuple[str, int], bytes]],
+        on_delivered: Callable[[list[str]], None] = None) -> EmitResult:
+        """Sends a frame to peers that must be connected to or waited on first
+
+        Args:
+            waiting (list[tuple[str, tuple[str, int], bytes]]): The ID, address and frame of each peer
+            on_delivered (Callable[[list[str]], None], optional): Called with the peers the frame was queued for. Defaults to None.
+
+        Returns:
+            EmitResult: Which peers the data was queued for
+        """
+
+        result = EmitResult()
+
+        async with create_task_group() as tg:
+            for peer, addr, frame in waiting:
+                tg.start_soon(self._emit_to, peer, addr, frame, result)
+
+        if on_delivered is not None and result.delivered:
+            on_delivered(result.delivered)
+
+        await self._report_undelivered(result.failed, result.slow)
+
+        # Tell whoever emitted, who has already moved on
+        if self._tg is not None:
+            for peer in result.failed:
+                await self._notify("emit_failed", peer, "failed")
+            for peer in result.slow:
+                await self._notify("emit_failed", peer, "slow")
+
+        return result
+
+    async def _report_undelivered(self, failed: list[str], slow: list[str]):
+        """Records peers an emit could not be sent to
+
+        Args:
+            failed (list[str]): Peers that could not be reached
+            slow (list[str]): Peers that did not accept the data in time
+        """
+
+        # Suspect unreachable peers, or remove them if we are not probing
+        for peer in failed:
+            if self.failure_detector is not None:
+                await self.failure_detector.suspect(peer)
+            else:
+                await self._remove_peer(peer)
+
+        if failed:
+            self._m_emit_failures.labels("failed").inc(len(failed))
+
+        # Report peers that could not keep up
+        if slow:
+            self._m_emit_failures.labels("slow").inc(len(slow))
+            logger.warning(f"Timed out emitting to {len(slow)} peers: {', '.join(slow)}")
+
+    async def _emit_to(self, peer: str, addr: tuple[str, int], data: bytes, result: EmitResult):
+        """Sends an emitted frame to one peer
+
+        Args:
+            peer (str): The ID of the peer
+            addr (tuple[str, int]): The address of the peer
+            data (bytes): The frame to send, or a list of its buffers
+            result (EmitResult): The result to record the outcome in
+        """
+
+        # Waiting for a turn counts against the peer's deadline too
+        with move_on_after(self.peer_timeout) as scope:
+            async with self._fanout:
+                try:
+                    await self._send_frame(addr, data)
+                except OSError:
+                    result.failed.append(peer)
+                    return
+
+        if scope.cancel_called:
+            result.slow.append(peer)
+        else:
+            result.delivered.append(peer)
+
+    async def _send_frame_nowait(self, addr: tuple[str, int], data: bytes) -> bool:
+        """Queues a frame for an address, if that can be done without waiting
+
+        Args:
+            addr (tuple[str, int]): The address to send to
+            data (bytes): The frame to send, or a list of its buffers
+
+        Returns:
+            bool: Whether the frame was queued
+        """
+
+        if not await self.connections.send_nowait(addr[0], addr[1], data):
+            return False
+
+        self._m_frames_sent.inc()
+        self._m_frame_bytes_sent.inc(frame_length(data) if isinstance(data, list) else len(data))
+
+        return True
+
+    async def _send_frame(self, addr: tuple[str, int], data: bytes):
+        """Sends a frame to an address
+
+        Args:
+            addr (tuple[str, int]): The address to send to
+            data (bytes): The frame to send, or a list of its buffers
+        """
+
+        # Connect
+        handle = await self.connections.connect(addr[0], addr[1])
+
+        # Queue the frame on the peer's writer
+        if isinstance(data, list):
+            await self.connections.send_many(handle, data)
+            size = frame_length(data)
+        else:
+            await self.connections.send(handle, data)
+            size = len(data)
+
+        self._m_frames_sent.inc()
+        self._m_frame_bytes_sent.inc(size)
+
+    def _hello(self) -> bytes:
+        """Builds the frame introducing us over a connection we dialed
+
+        Returns:
+            bytes: The frame
+        """
+
+        return MsgNum.dumps(9, msgpack.packb((self.node_id, self.host_addr[1])))
+
+    async def _on_dial(self, connection: _Client):
+        """Introduces us over a new outbound connection, and reads from it
+
+        Args:
+            connection (_Client): The connection, before anything else is sent over it
+        """
+
+        # Connections dialed before we run are introduced once we do
+        if self._tg is None or self.node_id is None:
+            return
+
+        await connection.send(self._hello())
+        self._tg.start_soon(self._read, connection)
+
+    async def _read(self, connection: _Client):
+        """Handles frames a peer sends back over a connection we dialed
+
+        Args:
+            connection (_Client): The connection
+        """
+
+        try:
+            await self.on_connection(connection)
+        except (EndOfStream, OSError, ClosedResourceError, BrokenResourceError):
+            pass
+
+    async def _on_hello(self, data: list, addr: tuple[str, int], conn: _Conn):
+        """Sends to a peer over the connection it dialed us on
+
+        When both of us dial, both keep the connection dialed by the lower
+        node ID. The other is retired by both of us, and closed by whoever
+        dialed it once neither has anything more to send over it.
+
+        Args:
+            data (list): The peer's ID and the port it listens on
+            addr (tuple[str, int]): The address of the sender
+            conn (_Conn): The connection the peer dialed
+        """
+
+        peer_id, port = data
+
+        if peer_id == self.node_id:
+            return
+
+        # Key the connection as we would dial the peer
+        peer_addr = self.peers.get(peer_id) or (addr[0], port)
+
+        await self.connections.adopt(peer_addr[0], peer_addr[1], conn,
+            keep_dialed=self.node_id < peer_id)
+
+    async def _add_peer(self, node_id: str, addr: tuple[str, int], codecs: list[str] = None):
+        """Adds a peer and reports that it has joined
+
+        Args:
+            node_id (str): The ID of the peer
+            addr (tuple[str, int]): The address of the peer
+            codecs (list[str], optional): The compression codecs the peer accepts. Defaults to None.
+        """
+
+        self.peers[node_id] = addr
+        self.membership.readd(node_id)
+
+        if codecs:
+            self.peer_codecs[node_id] = codecs
+
+        await self._notify("peer_up", node_id)
+
+    async def _remove_peer(self, node_id: str):
+        """Removes a peer and reports that it has gone
+
+        Args:
+            node_id (str): The ID of the peer
+        """
+
+        # Ignore peers that are already gone
+        if self.peers.pop(node_id, None) is None:
+            return
+
+        self.peer_codecs.pop(node_id, None)
+        self.peer_event_ids.pop(node_id, None)
+        self.peers_catch_all.discard(node_id)
+        self.peer_patterns.pop(node_id, None)
+        self._backlog.pop(node_id, None)
+        self.membership.remove(node_id)
+
+        if self.failure_detector is not None:
+            self.failure_detector.forget(node_id)
+
+        # Stop reporting the peer
+        self._m_peer_sent.remove(node_id)
+        self._m_peer_received.remove(node_id)
+
+        # No response will come to requests still waiting on the peer
+        for pending in self._requests.values():
+            if pending.node_id == node_id and not pending.done.is_set():
+                pending.done.set()
+
+        logger.info(f"Peer {node_id} has left the cluster")
+        await self._notify("peer_down", node_id)
+
+    async def _on_high_water(self, host: str, port: int, pending: int):
+        """Reports a peer whose send buffer went over its high-water mark
+
+        Args:
+            host (str): The host of the peer
+            port (int): The port of the peer
+            pending (int): The bytes queued for the peer
+        """
+
+        node_id = next((peer for peer, addr in self.peers.items() if addr == (host, port)), None)
+
+        await self._notify("send_buffer_high", node_id, pending)
+
+    async def _notify(self, name: str, *args):
+        """Reports a system event without blocking the caller
+
+        Args:
+            name (str): The name of the system event
+            *args: Arguments passed to the event's handlers
+        """
+
+        if self.sys_handler is None:
+            return
+
+        if self._tg is not None:
+            self._tg.start_soon(self._run_sys_handler, name, *args)
+        else:
+            await self._run_sys_handler(name, *args)
+
+    async def _run_sys_handler(self, name: str, *args):
+        """Runs the system event handler, logging its errors
+
+        Args:
+            name (str): The name of the system event
+            *args: Arguments passed to the event's handlers
+        """
+
+        try:
+            await self.sys_handler(name, *args)
+        except Exception as e:
+            logger.exception(f"Error handling system event {name}: {e!r}")
+
+    async def register_sys_handler(self, sys_handler: Callable[..., None]):
+        """Registers the system event handler
+        
+        Args:
+            sys_handler (Callable[..., None]): The handler which is called with the name and arguments of system events.
+        """
+
+        # Register the system event handler
+        self.sys_handler = sys_handler
+
+    async def register_data_handler(self, data_handler: Callable[[str, str, bytes],None]):
         """Registers the data handler
         
         Args:
-            data_handler (Callable[[bytes],None]): The handler which is called when data is received.
+            data_handler (Callable[[str, str, bytes],None]): The handler which is called with the sender, event name and data received. Events registered with register_event may be named by their ID instead.
         """
 
         # Register the data handler
         self.data_handler = data_handler
+
+    async def register_request_handler(self, request_handler: Callable[[str, str, int, bytes],None]):
+        """Registers the request handler
+
+        Args:
+            request_handler (Callable[[str, str, int, bytes],None]): The handler which is called with the sender, event name, request ID and data of requests received. It must eventually answer each request with respond.
+        """
+
+        self.request_handler = request_handler
+
+    def register_event(self, name: str) -> int:
+        """Gives an event we handle a numeric ID, and tells peers about it
+
+        Args:
+            name (str): The name of the event
+
+        Returns:
+            int: The ID, which indexes a flat table of the events we handle
+        """
+
+        if name in self.event_ids:
+            return self.event_ids[name]
+
+        event_id = len(self._event_names)
+        if event_id > 0xFFFF:
+            raise ValueError("Too many events registered")
+
+        self.event_ids[name] = event_id
+        self._event_names.append(name)
+
+        self._changed()
+
+        return event_id
+
+    def register_pattern(self, pattern: str):
+        """Records a pattern of event names we handle, and tells peers about it
+
+        Args:
+            pattern (str): The pattern
+        """
+
+        if pattern in self.patterns.patterns:
+            return
+
+        self.patterns.add(pattern)
+
+        self._changed()
+
+    def set_catch_all(self, catch_all: bool):
+        """Sets whether we handle events we registered no ID for, and tells peers
+
+        Args:
+            catch_all (bool): Whether peers should send us every event
+        """
+
+        if catch_all == self.catch_all:
+            return
+
+        self.catch_all = catch_all
+
+        self._changed()
+
+    def _changed(self):
+        """Bumps the version of our record after what we handle changed
+        """
+
+        self.version += 1
+        if self.node_id is not None:
+            self.membership.set_version(self.node_id, self.version)
+
+        # Announce it now if we can, otherwise once we have joined and are running
+        self._record_unannounced = True
+        if self._tg is not None and self._packer is not None:
+            self._tg.start_soon(self._announce_events)
+
+    async def _announce_events(self):
+        """Tells every peer our record, if it changed since we last told them
+
+        Peers that miss it catch up through anti-entropy, since the whole
+        record is sent rather than what changed.
+        """
+
+        if not self._record_unannounced:
+            return
+
+        self._record_unannounced = False
+
+        await self._send_to_peers(list(self.peers.keys()), MsgNum.dumps(
+            8,
+            msgpack.packb(self._record(self.node_id))
+        ))
     
 
 
@@ -219,6 +1355,60 @@ class PeerRouter(_Router):
         
         # Unpack type
         data_type, data = MsgNum.loads(data)
+
+        # Handle the frame
+        await self._on_frame(data_type, data, addr, conn)
+
+    async def _on_frame(self, data_type: int, data: bytes, addr: tuple[str, int], conn: _Conn = None):
+        """Handles a single decoded frame
+
+        Args:
+            data_type (int): The message type of the frame
+            data (bytes): The payload of the frame
+            addr (tuple[str, int]): The address of the sender
+            conn (Optional[_Conn]): The connection to use to send data
+        """
+
+        # A malformed frame is dropped, rather than ending the connection
+        # and every frame after it
+        try:
+            # Decompress the payload
+            data_type, data = self.compression.loads(data_type, data)
+
+            # Handle the message
+            await self._on_message(data_type, data, addr, conn)
+        except MALFORMED_FRAME_ERRORS as e:
+            logger.warning(f"Dropping malformed frame of type {data_type} from {addr[0]}:{addr[1]}: {e!r}")
+
+    async def _on_message(self, data_type: int, data: bytes, addr: tuple[str, int], conn: _Conn = None):
+        """Handles the decompressed payload of a frame
+
+        Args:
+            data_type (int): The message type of the frame
+            data (bytes): The payload of the frame
+            addr (tuple[str, int]): The address of the sender
+            conn (Optional[_Conn]): The connection to use to send data
+        """
+
+        # Data is enveloped rather than msgpacked
+        if data_type == 3:
+            kind, sender, name, request_id, payload = self._unpacker.unpack(data)
+
+            if name.__class__ is int:
+                label = self._event_names[name] if name < len(self._event_names) else "other"
+            else:
+                label = self._event_label(name)
+            self._m_received.labels(label).observe(len(payload))
+            self._m_peer_received.labels(sender).observe(len(payload))
+
+            # Call the data handler
+            if kind == EVENT:
+                await self.data_handler(sender, name, payload)
+            elif kind == REQUEST:
+                await self.request_handler(sender, name, request_id, payload)
+            else:
+                self._resolve(sender, request_id, kind, payload)
+            return
         
         # Un Msgpack data
         data = msgpack.unpackb(data)
@@ -232,49 +1422,44 @@ class PeerRouter(_Router):
 
             # Generate ID for new peer
             peer_id = str(uuid.uuid4())
+
+            self._m_joins.inc()
             
-            # Tell the peer our peers, its ID, and our ID
+            # Add the peer, and queue telling all peers that it has joined
+            record = (peer_id, data[5], (addr[0], data[0][1]), data[1], data[2], data[3], data[4])
+            await self._merge(record)
+            await self._queue_join(record)
+
+            # Tell the peer its ID and our record. It fetches the rest of
+            # the membership from us afterwards, so this stays small
             await conn.send(
                 MsgNum.dumps(
                     1,
-                    msgpack.packb(
-                        (
-                            self.peers,
-                            peer_id,
-                            self.node_id
-                        )
-                    )
+                    msgpack.packb((peer_id, self._record(self.node_id)))
                 )
             )
+        elif data_type == 2: # The records of new nodes
 
-            # Tell all peers that a new peer has joined
-            await self._emit(MsgNum.dumps(
-                2,
-                msgpack.packb((peer_id, addr, data[0]))
-            ))
-        elif data_type == 2: # New node
+            for record in data:
+                await self._merge(record)
+        elif data_type == 8: # A changed record
 
-            # If the peer is already in the cluster
-            if data[0] in self.peers.keys():
-                # Ignore
-                return
-            
-            # Extract the host and port
-            host = data[1][0]
-            port = data[2][1]
+            await self._merge(data)
+        elif data_type == 9: # A peer introducing itself over a connection it dialed
 
-            # And the ID
-            peer_id = data[0]
+            if conn is not None:
+                await self._on_hello(data, addr, conn)
+        elif data_type == 12: # A peer that will send nothing more over this connection
 
-            # Add the peer
-            self.peers[peer_id] = (host, port)
+            if conn is not None:
+                await self.connections.retired(conn)
+        elif data_type in (5, 6, 7): # Failure detection
 
-            # Log that a new peer is joining
-            logger.info(f"New peer {data[0]}@{data[1][0]}:{data[2][1]} has joined the cluster")
-        elif data_type == 3: # Data
-            
-            # Call the data handler
-            await self.data_handler(data[0], data[1])
+            if self.failure_detector is not None:
+                await self.failure_detector.on_frame(data_type, data)
+        elif data_type in (SYNC, DELTA): # Anti-entropy
+
+            await self.membership.on_frame(data_type, data)
 
 
     async def on_connection(self, connection: _Conn):
@@ -284,11 +1469,26 @@ class PeerRouter(_Router):
             connection (_Conn): The connection to handle
         """
 
-        while True:
-            # Receive data
-            data = await connection.recv()
+        # Frames may be split across or merged within reads
+        reader = MsgNumReader(self.max_frame_size)
 
-            # Handle data
-            await self._on_data(data, connection.addr, connection)
+        try:
+            while True:
+                # Receive data
+                data = await connection.recv()
+                self._m_frame_bytes_received.inc(len(data))
+
+                # Handle every frame completed by this read
+                frames = reader.feed(data)
+                self._m_frames_received.inc(len(frames))
+
+                for data_type, payload in frames:
+                    await self._on_frame(data_type, payload, connection.addr, connection)
+        except FrameTooLarge as e:
+            # Nothing after it can be read, so give up on the connection
+            logger.warning(f"Closing connection from {connection.addr[0]}:{connection.addr[1]}: {e}")
+        finally:
+            # Stop sending over the connection once it is gone
+            await self.connections.forget(connection)
 
             
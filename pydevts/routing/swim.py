@@ -0,0 +1,400 @@
+"""
+    SWIM-style failure detection and membership dissemination
+"""
+
+# Logging
+from ..logger import logger
+
+# Anyio
+from anyio import create_task_group, current_time, move_on_after, sleep, Event, TASK_STATUS_IGNORED
+from anyio.abc import TaskGroup, TaskStatus
+
+# Serialization
+from ..msg import MsgNum
+import msgpack
+
+# Standard Library Imports
+import math
+import random
+
+
+# Member states
+ALIVE = 0
+SUSPECT = 1
+DEAD = 2
+
+
+class SwimDetector:
+    """Detects failed peers by probing them, and spreads membership changes
+
+    Every probe interval one peer is pinged. If it does not acknowledge in
+    time, several other peers are asked to ping it on our behalf. A peer
+    that answers neither is suspected, and declared dead if it does not
+    refute the suspicion in time. Membership changes are piggybacked on
+    the probe traffic. Dead peers are remembered for a while, so updates
+    still being spread about them do not bring them back.
+    """
+
+    router: "PeerRouter"
+    incarnation: int
+    members: dict[str, list[int, int, float]] # status, incarnation, suspicion deadline or when to forget the dead
+    probe_interval: float
+    probe_timeout: float
+    indirect_probes: int
+    suspect_timeout: float
+    dead_timeout: float
+    retransmit: int
+    _updates: dict[str, list[tuple, int]] # update, transmissions left
+    _acks: dict[int, Event]
+    _seq: int
+    _targets: list[str]
+    _tg: TaskGroup
+
+    def __init__(self, router: "PeerRouter",
+        probe_interval: float = 1.0,
+        probe_timeout: float = 0.5,
+        indirect_probes: int = 3,
+        suspect_timeout: float = 5.0,
+        dead_timeout: float = 60.0,
+        retransmit: int = 3):
+        """Initialize the detector
+
+        Args:
+            router (PeerRouter): The router whose peers are probed.
+            probe_interval (float, optional): Seconds between probes. Defaults to 1.0.
+            probe_timeout (float, optional): Seconds to wait for a direct acknowledgement. Defaults to 0.5.
+            indirect_probes (int, optional): The number of peers asked to probe an unresponsive peer. Defaults to 3.
+            suspect_timeout (float, optional): Seconds a suspected peer has to refute before it is declared dead. Defaults to 5.0.
+            dead_timeout (float, optional): Seconds a dead peer is remembered for. Defaults to 60.0.
+            retransmit (int, optional): Multiplier for how many times each update is piggybacked. Defaults to 3.
+        """
+
+        # Save the router
+        self.router = router
+
+        # Save the parameters
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.indirect_probes = indirect_probes
+        self.suspect_timeout = suspect_timeout
+        self.dead_timeout = dead_timeout
+        self.retransmit = retransmit
+
+        # Set default values
+        self.incarnation = 0
+        self.members = dict()
+        self._updates = dict()
+        self._acks = dict()
+        self._seq = 0
+        self._targets = []
+        self._tg = None
+
+    async def run(self, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Runs the probe loop
+
+        Args:
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        async with create_task_group() as tg:
+            self._tg = tg
+
+            task_status.started()
+
+            while True:
+                started = current_time()
+
+                # Probe the next peer
+                target = self._next_target()
+                if target is not None:
+                    await self._probe(target)
+
+                # Declare peers dead whose suspicion has timed out, and forget long dead ones
+                await self._expire()
+
+                # Wait out the rest of the interval
+                await sleep(max(started + self.probe_interval - current_time(), 0))
+
+    def _next_target(self) -> str:
+        """Picks the next peer to probe, visiting peers in a random order
+
+        Returns:
+            str: The ID of the peer, or None if there are no peers
+        """
+
+        # Skip peers that have gone since the order was chosen
+        while self._targets and self._targets[-1] not in self.router.peers:
+            self._targets.pop()
+
+        # Start a new round
+        if not self._targets:
+            self._targets = list(self.router.peers.keys())
+            random.shuffle(self._targets)
+
+        if not self._targets:
+            return None
+
+        return self._targets.pop()
+
+    async def _probe(self, target: str):
+        """Probes a peer, suspecting it if it does not respond
+
+        Args:
+            target (str): The ID of the peer to probe
+        """
+
+        seq, acked = self._expect_ack()
+
+        try:
+            # Ping the peer directly
+            await self._send(target, MsgNum.dumps(5, msgpack.packb(
+                (seq, self.router.node_id, self.router.host_addr, self._piggyback())
+            )))
+
+            with move_on_after(self.probe_timeout):
+                await acked.wait()
+
+            if acked.is_set():
+                return
+
+            # Ask other peers to ping it for us
+            helpers = [peer for peer in self.router.peers.keys() if peer != target]
+            for helper in random.sample(helpers, min(self.indirect_probes, len(helpers))):
+                await self._send(helper, MsgNum.dumps(7, msgpack.packb(
+                    (seq, self.router.node_id, self.router.host_addr, target, self._piggyback())
+                )))
+
+            with move_on_after(max(self.probe_interval - self.probe_timeout, self.probe_timeout)):
+                await acked.wait()
+
+            if not acked.is_set():
+                await self.suspect(target)
+        finally:
+            self._acks.pop(seq, None)
+
+    async def _relay(self, seq: int, requester: str, requester_addr: tuple[str, int], target: str):
+        """Pings a peer on behalf of another, forwarding the acknowledgement
+
+        Args:
+            seq (int): The sequence number of the requester's probe
+            requester (str): The ID of the requesting peer
+            requester_addr (tuple[str, int]): The address of the requesting peer
+            target (str): The ID of the peer to ping
+        """
+
+        own_seq, acked = self._expect_ack()
+
+        try:
+            await self._send(target, MsgNum.dumps(5, msgpack.packb(
+                (own_seq, self.router.node_id, self.router.host_addr, self._piggyback())
+            )))
+
+            with move_on_after(self.probe_timeout):
+                await acked.wait()
+
+            # Tell the requester the target is alive
+            if acked.is_set():
+                await self._send(requester, MsgNum.dumps(6, msgpack.packb(
+                    (seq, target, self._piggyback())
+                )), requester_addr)
+        finally:
+            self._acks.pop(own_seq, None)
+
+    def _expect_ack(self) -> tuple[int, Event]:
+        """Allocates a sequence number for a probe
+
+        Returns:
+            tuple[int, Event]: The sequence number, and the event set when it is acknowledged
+        """
+
+        self._seq += 1
+        self._acks[self._seq] = Event()
+
+        return self._seq, self._acks[self._seq]
+
+    async def _send(self, node_id: str, frame: bytes, addr: tuple[str, int] = None):
+        """Sends a probe frame, ignoring unreachable peers
+
+        Args:
+            node_id (str): The ID of the peer
+            frame (bytes): The frame to send
+            addr (tuple[str, int], optional): The address to use if the peer is not known. Defaults to None.
+        """
+
+        addr = self.router.peers.get(node_id, addr)
+        if addr is None:
+            return
+
+        # An unreachable peer simply does not acknowledge
+        with move_on_after(self.probe_timeout):
+            try:
+                await self.router._send_frame(addr, frame)
+            except OSError:
+                pass
+
+    async def on_frame(self, data_type: int, data: list):
+        """Handles a probe frame
+
+        Args:
+            data_type (int): The message type of the frame
+            data (list): The unpacked payload of the frame
+        """
+
+        if data_type == 5: # Ping
+            seq, sender, sender_addr, updates = data
+            await self._apply(updates)
+
+            # Acknowledge
+            await self._send(sender, MsgNum.dumps(6, msgpack.packb(
+                (seq, self.router.node_id, self._piggyback())
+            )), sender_addr)
+
+        elif data_type == 6: # Ack
+            seq, _, updates = data
+            await self._apply(updates)
+
+            if seq in self._acks:
+                self._acks[seq].set()
+
+        elif data_type == 7: # Ping request
+            seq, sender, sender_addr, target, updates = data
+            await self._apply(updates)
+
+            # Probe the target without holding up the connection
+            if self._tg is not None:
+                self._tg.start_soon(self._relay, seq, sender, sender_addr, target)
+
+    def _piggyback(self, limit: int = 8) -> list[tuple]:
+        """Takes the updates to attach to an outgoing probe
+
+        Args:
+            limit (int, optional): The maximum number of updates to attach. Defaults to 8.
+
+        Returns:
+            list[tuple]: The updates
+        """
+
+        # Prefer the updates that have been sent the fewest times
+        chosen = sorted(self._updates.items(), key=lambda item: -item[1][1])[:limit]
+
+        updates = []
+        for node_id, entry in chosen:
+            updates.append(entry[0])
+
+            # Forget updates that have been sent enough
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._updates[node_id]
+
+        return updates
+
+    def _disseminate(self, node_id: str, status: int, incarnation: int, addr: tuple[str, int]):
+        """Queues a membership update to be piggybacked
+
+        Args:
+            node_id (str): The ID of the member
+            status (int): The state of the member
+            incarnation (int): The member's incarnation number
+            addr (tuple[str, int]): The address of the member
+        """
+
+        count = self.retransmit * max(1, math.ceil(math.log2(len(self.router.peers) + 2)))
+        self._updates[node_id] = [(node_id, status, incarnation, addr), count]
+
+    async def _apply(self, updates: list[tuple]):
+        """Applies membership updates received from a peer
+
+        Args:
+            updates (list[tuple]): The updates
+        """
+
+        for node_id, status, incarnation, addr in updates:
+
+            # Refute suspicion of ourselves
+            if node_id == self.router.node_id:
+                if status != ALIVE and incarnation >= self.incarnation:
+                    self.incarnation = incarnation + 1
+                    self._disseminate(node_id, ALIVE, self.incarnation, self.router.host_addr)
+                continue
+
+            known = self.members.get(node_id, [ALIVE, 0, 0])
+
+            if status == ALIVE:
+                # New peers, or peers that have refuted suspicion
+                if node_id not in self.router.peers:
+                    if known[0] == DEAD and incarnation <= known[1]:
+                        continue
+
+                    self.members[node_id] = [ALIVE, incarnation, 0]
+                    self._disseminate(node_id, ALIVE, incarnation, addr)
+                    await self.router._add_peer(node_id, tuple(addr))
+
+                elif incarnation > known[1]:
+                    self.members[node_id] = [ALIVE, incarnation, 0]
+                    self._disseminate(node_id, ALIVE, incarnation, addr)
+
+            elif status == SUSPECT:
+                if node_id in self.router.peers and (incarnation > known[1] or (incarnation == known[1] and known[0] == ALIVE)):
+                    await self.suspect(node_id, incarnation)
+
+            elif status == DEAD:
+                if node_id in self.router.peers and incarnation >= known[1]:
+                    await self._declare_dead(node_id, incarnation)
+
+    async def suspect(self, node_id: str, incarnation: int = None):
+        """Marks a peer as suspected of failure
+
+        Args:
+            node_id (str): The ID of the peer
+            incarnation (int, optional): The incarnation being suspected. Defaults to the latest known.
+        """
+
+        known = self.members.get(node_id, [ALIVE, 0, 0])
+        if incarnation is None:
+            incarnation = known[1]
+
+        # Already suspected
+        if known[0] == SUSPECT and known[1] == incarnation:
+            return
+
+        self.members[node_id] = [SUSPECT, incarnation, current_time() + self.suspect_timeout]
+        self._disseminate(node_id, SUSPECT, incarnation, self.router.peers.get(node_id))
+
+        logger.info(f"Peer {node_id} is suspected of failure")
+        await self.router._notify("peer_suspect", node_id)
+
+    async def _expire(self):
+        """Declares peers dead whose suspicion has timed out, and forgets peers dead for dead_timeout
+        """
+
+        now = current_time()
+
+        for node_id, (status, incarnation, deadline) in list(self.members.items()):
+            if status == SUSPECT and deadline <= now:
+                await self._declare_dead(node_id, incarnation)
+            elif status == DEAD and deadline <= now:
+                del self.members[node_id]
+
+    async def _declare_dead(self, node_id: str, incarnation: int):
+        """Removes a failed peer
+
+        Args:
+            node_id (str): The ID of the peer
+            incarnation (int): The incarnation that failed
+        """
+
+        self.members[node_id] = [DEAD, incarnation, current_time() + self.dead_timeout]
+        self._disseminate(node_id, DEAD, incarnation, self.router.peers.get(node_id))
+
+        await self.router._remove_peer(node_id)
+
+    def forget(self, node_id: str):
+        """Stops tracking a peer removed by the router
+
+        Args:
+            node_id (str): The ID of the peer
+        """
+
+        if node_id in self.members and self.members[node_id][0] != DEAD:
+            self.members[node_id] = [DEAD, self.members[node_id][1], current_time() + self.dead_timeout]
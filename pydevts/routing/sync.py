@@ -0,0 +1,428 @@
+"""
+    Versioned membership with digest-based anti-entropy
+"""
+
+# Logging
+from ..logger import logger
+
+# Anyio
+from anyio import sleep, Event, TASK_STATUS_IGNORED
+from anyio.abc import TaskStatus
+
+# Serialization
+from ..msg import MsgNum
+import msgpack
+
+# Standard Library Imports
+import hashlib
+import random
+import time
+import zlib
+
+
+# Message types
+SYNC = 10 # A digest of the sender's membership
+DELTA = 11 # Membership records in buckets whose digests differ
+
+# Members are spread over this many buckets, each summarized by one hash
+BUCKETS = 256
+
+
+def bucket_of(node_id: str) -> int:
+    """Finds the bucket a member is summarized in
+
+    Args:
+        node_id (str): The ID of the member
+
+    Returns:
+        int: The bucket
+    """
+
+    return zlib.crc32(node_id.encode()) % BUCKETS
+
+def record_hash(node_id: str, version: int, departed: bool = False) -> int:
+    """Hashes a version of a member's record, the same in every process
+
+    Args:
+        node_id (str): The ID of the member
+        version (int): The version of its record
+        departed (bool, optional): Whether to hash the member's departure at that version instead. Defaults to False.
+
+    Returns:
+        int: The hash
+    """
+
+    key = f"{node_id}:{version}:departed" if departed else f"{node_id}:{version}"
+
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class MembershipSync:
+    """Keeps every node's view of the membership converging
+
+    Each member owns a record of how to reach it and what it handles, and
+    bumps the record's version whenever it changes. Members are hashed by
+    ID into buckets, and each bucket is summarized by the XOR of the hashes
+    of its members' IDs and versions. Peers exchange these digests now and
+    then, and then only the records in buckets that differ, so a joining
+    or reconnecting node fetches what changed rather than everything.
+
+    Removed members leave a tombstone at their last version, which is
+    summarized and exchanged along with the records. Nodes that still
+    have the member remove it, and nodes that never had it will not take
+    it from a peer that has not heard yet. Tombstones are forgotten after
+    departed_timeout, by when every node should have heard.
+    """
+
+    router: "PeerRouter"
+    interval: float
+    departed_timeout: float
+    versions: dict[str, int]
+    synced: Event # Set once a peer has answered our first digest
+    _departed: dict[str, tuple[int, float]] # The last version of each removed member, and when to forget it
+    _digest: dict[int, int]
+    _members: dict[int, set[str]] # By bucket
+
+    def __init__(self, router: "PeerRouter", interval: float = 10.0, departed_timeout: float = 60.0):
+        """Initialize the synchronizer
+
+        Args:
+            router (PeerRouter): The router whose membership is kept in sync.
+            interval (float, optional): Seconds between exchanges with a random peer, or None to only sync once we have joined. Defaults to 10.0.
+            departed_timeout (float, optional): Seconds removed members are remembered for. Defaults to 60.0.
+        """
+
+        # Save the router
+        self.router = router
+
+        # Save the parameters
+        self.interval = interval
+        self.departed_timeout = departed_timeout
+
+        # Set default values
+        self.versions = dict()
+        self._departed = dict()
+        self._digest = dict()
+        self._members = dict()
+        self.synced = Event()
+
+    async def run(self, first: str = None, task_status: TaskStatus = TASK_STATUS_IGNORED):
+        """Runs the anti-entropy loop
+
+        Args:
+            first (str, optional): The peer to sync with straight away, such as the node we joined through. Defaults to None.
+
+            ONLY PASSED BY ANYIO:
+            task_status (TaskStatus, optional, anyio): The task status. Defaults to TASK_STATUS_IGNORED.
+        """
+
+        task_status.started()
+
+        # There is nothing to fetch if we started the cluster
+        if first is None:
+            self.synced.set()
+
+        peer = first
+        while True:
+            if peer is not None:
+                await self.sync(peer)
+
+            if self.interval is None:
+                return
+
+            # Spread exchanges out, so peers do not all sync at once
+            await sleep(self.interval * random.uniform(0.5, 1.5))
+
+            peers = list(self.router.peers.keys())
+            peer = random.choice(peers) if peers else None
+
+    def set_version(self, node_id: str, version: int):
+        """Records the version of a member's record, updating the digest
+
+        Args:
+            node_id (str): The ID of the member
+            version (int): The version, or None if the member has gone
+        """
+
+        bucket = bucket_of(node_id)
+        known = self.versions.get(node_id)
+
+        # Take the old version out of the bucket's hash, and put the new one in
+        if known is not None:
+            self._toggle(bucket, record_hash(node_id, known))
+            self._members[bucket].discard(node_id)
+
+        if version is not None:
+            self.versions[node_id] = version
+            self._toggle(bucket, record_hash(node_id, version))
+            self._members.setdefault(bucket, set()).add(node_id)
+        else:
+            self.versions.pop(node_id, None)
+
+        if not self._members.get(bucket):
+            self._members.pop(bucket, None)
+
+    def _set_departed(self, node_id: str, version: int):
+        """Records the tombstone of a removed member, updating the digest
+
+        Args:
+            node_id (str): The ID of the member
+            version (int): The last version of its record, or None to forget the tombstone
+        """
+
+        bucket = bucket_of(node_id)
+        known = self._departed.pop(node_id, None)
+
+        if known is not None:
+            self._toggle(bucket, record_hash(node_id, known[0], True))
+
+        if version is not None:
+            self._departed[node_id] = (version, time.monotonic() + self.departed_timeout)
+            self._toggle(bucket, record_hash(node_id, version, True))
+
+    def _toggle(self, bucket: int, value: int):
+        """Adds a hash to a bucket's digest, or takes it out again
+
+        Args:
+            bucket (int): The bucket
+            value (int): The hash
+        """
+
+        digest = self._digest.get(bucket, 0) ^ value
+        if digest:
+            self._digest[bucket] = digest
+        else:
+            self._digest.pop(bucket, None)
+
+    def remove(self, node_id: str):
+        """Forgets a member, remembering its version so stale records do not bring it back
+
+        Args:
+            node_id (str): The ID of the member
+        """
+
+        version = self.versions.get(node_id)
+        if version is not None:
+            self._set_departed(node_id, max(version, self._departed.get(node_id, (version,))[0]))
+
+        self.set_version(node_id, None)
+
+    def readd(self, node_id: str):
+        """Allows a member back that was removed
+
+        Args:
+            node_id (str): The ID of the member
+        """
+
+        if node_id in self._departed:
+            self._set_departed(node_id, None)
+
+    def expire(self):
+        """Forgets tombstones that have been kept for departed_timeout
+        """
+
+        now = time.monotonic()
+
+        for node_id, (_, forget_at) in list(self._departed.items()):
+            if forget_at <= now:
+                self._set_departed(node_id, None)
+
+    async def depart(self, node_id: str, version: int):
+        """Applies a tombstone from a peer, removing the member if we have no newer record of it
+
+        Args:
+            node_id (str): The ID of the member
+            version (int): The last version of its record
+        """
+
+        if node_id == self.router.node_id:
+            return
+
+        known = self.versions.get(node_id)
+        if known is not None and known > version:
+            return
+
+        if version <= self._departed.get(node_id, (-1,))[0]:
+            return
+
+        self._set_departed(node_id, version)
+
+        if node_id in self.router.peers:
+            await self.router._remove_peer(node_id)
+
+    def is_stale(self, node_id: str, version: int) -> bool:
+        """Checks whether a version of a member's record is no newer than one we have
+
+        Args:
+            node_id (str): The ID of the member
+            version (int): The version
+
+        Returns:
+            bool: Whether the record should be ignored
+        """
+
+        if node_id in self.router.peers:
+            known = self.versions.get(node_id)
+            return known is not None and version <= known
+
+        return version <= self._departed.get(node_id, (-1,))[0]
+
+    def _tombstones(self, buckets: list[int]) -> list[tuple[str, int]]:
+        """Collects the tombstones of removed members in some buckets
+
+        Args:
+            buckets (list[int]): The buckets
+
+        Returns:
+            list[tuple[str, int]]: The ID and last version of each member
+        """
+
+        buckets = set(buckets)
+
+        return [
+            (node_id, version)
+            for node_id, (version, _) in self._departed.items()
+            if bucket_of(node_id) in buckets
+        ]
+
+    def _records(self, buckets: list[int]) -> list[tuple]:
+        """Collects the records of every member in some buckets
+
+        Args:
+            buckets (list[int]): The buckets
+
+        Returns:
+            list[tuple]: The records
+        """
+
+        return [
+            self.router._record(node_id)
+            for bucket in buckets
+            for node_id in self._members.get(bucket, ())
+        ]
+
+    async def sync(self, peer: str):
+        """Sends a peer our digest, so it can send back what differs
+
+        Args:
+            peer (str): The ID of the peer
+        """
+
+        addr = self.router.peers.get(peer)
+        if addr is None:
+            return
+
+        self.expire()
+
+        try:
+            await self.router._send_frame(addr, MsgNum.dumps(
+                SYNC,
+                msgpack.packb((self.router.node_id, list(self._digest.items())))
+            ))
+        except OSError as e:
+            logger.debug(f"Unable to sync membership with {peer}: {e!r}")
+
+    async def on_frame(self, data_type: int, data: list):
+        """Handles an anti-entropy frame
+
+        Args:
+            data_type (int): SYNC or DELTA
+            data (list): The unpacked frame
+        """
+
+        if data_type == SYNC:
+            await self._on_sync(*data)
+        elif data_type == DELTA:
+            await self._on_delta(*data)
+
+    async def _on_sync(self, sender: str, digest: list[list[int]]):
+        """Answers a digest with our records in the buckets that differ
+
+        Args:
+            sender (str): The ID of the peer that sent it
+            digest (list[list[int]]): The hash of each of the peer's buckets
+        """
+
+        self.expire()
+
+        theirs = dict(digest)
+
+        differ = [
+            bucket for bucket in set(theirs) | set(self._digest)
+            if theirs.get(bucket) != self._digest.get(bucket)
+        ]
+
+        # Answer anyway, so the peer knows it is up to date
+        if not differ:
+            self.router._m_syncs.labels("in_sync").inc()
+            await self._send_delta(sender, [], [], False)
+            return
+
+        self.router._m_syncs.labels("differed").inc()
+
+        # Send ours, and ask for any of theirs we lack
+        await self._send_delta(sender, differ, self._records(differ), True, self._tombstones(differ))
+
+    async def _on_delta(self, sender: str, buckets: list[int], records: list[list], reply: bool, departed: list[list] = ()):
+        """Merges records a peer sent, and sends back any of ours it lacks
+
+        Args:
+            sender (str): The ID of the peer that sent them
+            buckets (list[int]): The buckets the records are from
+            records (list[list]): The peer's records in those buckets
+            reply (bool): Whether the peer wants the records it lacks
+            departed (list[list], optional): The peer's tombstones in those buckets. Defaults to ().
+        """
+
+        for record in records:
+            await self.router._merge(record)
+
+        for node_id, version in departed:
+            await self.depart(node_id, version)
+
+        self.synced.set()
+
+        if not reply:
+            return
+
+        # Send back what the peer did not have, or had an older version of.
+        # A tombstone outranks a record of the same version
+        theirs = {record[0]: record[1] for record in records}
+        gone = dict(departed)
+        newer = [
+            record for record in self._records(buckets)
+            if record[1] > max(theirs.get(record[0], -1), gone.get(record[0], -1))
+        ]
+        tombstones = [
+            (node_id, version) for node_id, version in self._tombstones(buckets)
+            if version >= theirs.get(node_id, -1) and version > gone.get(node_id, -1)
+        ]
+
+        if newer or tombstones:
+            await self._send_delta(sender, buckets, newer, False, tombstones)
+
+    async def _send_delta(self, peer: str, buckets: list[int], records: list[tuple], reply: bool, departed: list[tuple] = ()):
+        """Sends a peer records
+
+        Args:
+            peer (str): The ID of the peer
+            buckets (list[int]): The buckets the records are from
+            records (list[tuple]): The records
+            reply (bool): Whether the peer should send back records we lack
+            departed (list[tuple], optional): Tombstones of removed members in those buckets. Defaults to ().
+        """
+
+        addr = self.router.peers.get(peer)
+        if addr is None:
+            return
+
+        try:
+            await self.router._send_frame(addr, MsgNum.dumps(
+                DELTA,
+                msgpack.packb((self.router.node_id, buckets, records, reply, list(departed)))
+            ))
+        except OSError as e:
+            logger.debug(f"Unable to send membership to {peer}: {e!r}")
+            return
+
+        self.router._m_sync_records.inc(len(records))
@@ -0,0 +1,11 @@
+"""
+    Shared test configuration.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    # The library targets asyncio
+    return "asyncio"
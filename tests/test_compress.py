@@ -0,0 +1,88 @@
+"""
+    Tests for frame compression.
+"""
+
+import functools
+import os
+
+import anyio
+import pytest
+
+from pydevts.msg import Compressor, MsgNum
+from pydevts.msg.compress import COMPRESSED
+from pydevts.pub import Node
+from pydevts.routing import GossipRouter
+
+
+pytestmark = pytest.mark.anyio
+
+
+def test_compress_buffers_without_joining():
+    compressor = Compressor(("zlib",), threshold=16)
+    payload = [b"a" * 4096, b"b" * 4096]
+    frame = [MsgNum.header(3, 8192), *payload]
+
+    compressed = compressor.compress(frame, "zlib")
+
+    # The header leads its own buffer, followed by the compressed payload
+    assert isinstance(compressed, list) and len(compressed) > 1
+    message_type, body = MsgNum.loads(b"".join(compressed))
+    assert message_type == 3 | COMPRESSED
+    assert len(body) == sum(map(len, compressed)) - MsgNum._size
+
+    assert compressor.loads(message_type, body) == (3, b"".join(payload))
+    assert compressor.stats.compressed == 1
+
+
+def test_compress_leaves_small_and_incompressible_frames():
+    compressor = Compressor(("zlib",), threshold=1024)
+
+    small = MsgNum.dumps(3, b"a" * 100)
+    assert compressor.compress(small, "zlib") is small
+
+    noise = MsgNum.dumps(3, os.urandom(4096))
+    assert compressor.compress(noise, "zlib") is noise
+
+    # Nor compresses for peers that accept no codec
+    large = MsgNum.dumps(3, b"a" * 4096)
+    assert compressor.compress(large, None) is large
+    assert compressor.stats.compressed == 0
+
+
+def test_compression_is_off_by_default():
+    assert Compressor().codecs == []
+
+
+async def test_compressed_gossip_is_delivered():
+    router = functools.partial(GossipRouter, compression=("zlib",), min_gossip_nodes=0)
+    nodes = [Node(host="127.0.0.1", router=router) for _ in range(3)]
+    got = []
+    data = b"gossip" * 2048
+
+    for node in nodes:
+        @node.on("ev")
+        async def handler(sender, received, node=node):
+            got.append((node, bytes(received)))
+
+    async with anyio.create_task_group() as tg:
+        port = 1
+        for node in nodes:
+            await node.connect("127.0.0.1", port)
+            await tg.start(node.run)
+            port = nodes[0].addr[1]
+
+        with anyio.fail_after(5):
+            while any(len(node.router.peers) < 2 for node in nodes):
+                await anyio.sleep(0.01)
+
+        await nodes[0].emit("ev", data)
+
+        with anyio.fail_after(5):
+            while len(got) < 3:
+                await anyio.sleep(0.01)
+
+        tg.cancel_scope.cancel()
+
+    assert sorted(id(node) for node, _ in got) == sorted(id(node) for node in nodes)
+    assert all(received == data for _, received in got)
+    assert sum(node.router.compression.stats.decompressed for node in nodes) >= 2
@@ -0,0 +1,126 @@
+"""
+    Tests for emitting to many peers through PeerRouter.
+"""
+
+import anyio
+import pytest
+
+from pydevts.routing import PeerRouter
+from pydevts.proto import TCPProto
+from pydevts.msg import EnvelopePacker
+
+
+pytestmark = pytest.mark.anyio
+
+
+def _router(**kwargs) -> PeerRouter:
+    """Builds a router that has joined, with nothing on the network
+    """
+
+    router = PeerRouter(TCPProto, probe_interval=None, **kwargs)
+    router.node_id = "self"
+    router.host_addr = ("127.0.0.1", 0)
+    router._packer = EnvelopePacker(router.node_id)
+    router.set_catch_all(False)
+
+    return router
+
+
+async def test_emit_returns_before_slow_peers():
+    router = _router(peer_timeout=0.2, max_fanout=1)
+    events = []
+
+    async def sys_handler(name, *args):
+        events.append((name, *args))
+
+    async def data_handler(sender, name, data):
+        pass
+
+    await router.register_sys_handler(sys_handler)
+    await router.register_data_handler(data_handler)
+
+    # Connecting to either peer never finishes
+    async def connect(host, port):
+        await anyio.sleep_forever()
+
+    router.connections.connect = connect
+
+    for peer in ("b", "c"):
+        router.peers[peer] = ("127.0.0.1", 1)
+        router.peers_catch_all.add(peer)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(router.run)
+
+        with anyio.fail_after(0.1):
+            result = await router.emit(b"data", "event")
+
+        assert result.delivered == []
+        assert sorted(result.pending) == ["b", "c"]
+
+        # Both time out, including the one that waited for a fan-out slot
+        await anyio.sleep(0.5)
+        tg.cancel_scope.cancel()
+
+    # Our record, announced on start, times out the same way
+    assert set(events) == {("emit_failed", "b", "slow"), ("emit_failed", "c", "slow")}
+
+
+async def stalled_router(**kwargs) -> PeerRouter:
+    """A router with one peer that can never be connected to
+    """
+
+    router = _router(**kwargs)
+
+    async def handler(*args):
+        pass
+
+    await router.register_sys_handler(handler)
+    await router.register_data_handler(handler)
+
+    async def connect(host, port):
+        await anyio.sleep_forever()
+
+    router.connections.connect = connect
+    router.peers["b"] = ("127.0.0.1", 1)
+    router.peers_catch_all.add("b")
+
+    return router
+
+
+async def test_background_sends_to_a_peer_are_bounded_when_dropping():
+    router = await stalled_router(max_background_sends=4, send_buffer_policy="drop_newest")
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(router.run)
+
+        with anyio.fail_after(1):
+            results = [await router.emit(b"data", "event") for _ in range(100)]
+
+        # Only a few are left to the background, the rest are dropped for the peer
+        pending = sum(result.pending == ["b"] for result in results)
+        dropped = sum(result.dropped == ["b"] for result in results)
+        assert 0 < pending <= 4
+        assert pending + dropped == 100
+
+        tg.cancel_scope.cancel()
+
+
+async def test_background_sends_to_a_peer_block_when_full():
+    router = await stalled_router(max_background_sends=4, peer_timeout=0.5)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(router.run)
+
+        # Emitting waits once the peer's backlog is full
+        with anyio.move_on_after(0.2) as scope:
+            for _ in range(100):
+                await router.emit(b"data", "event")
+        assert scope.cancel_called
+
+        # Until the stalled sends time out and make room
+        with anyio.fail_after(2):
+            result = await router.emit(b"data", "event")
+        assert result.pending == ["b"]
+
+        tg.cancel_scope.cancel()
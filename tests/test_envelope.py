@@ -0,0 +1,90 @@
+"""
+    Tests for enveloped data frames.
+"""
+
+import pytest
+
+from pydevts.msg import EnvelopePacker, EnvelopeUnpacker, MsgNum, MsgNumReader
+from pydevts.err import FrameTooLarge
+from pydevts.msg.envelope import EVENT, REQUEST, RESPONSE, ERROR, frame_length
+
+
+def unpack(frame: list[bytes]) -> tuple:
+    """Reads a packed frame back the way a receiver does
+    """
+
+    frames = MsgNumReader().feed(b"".join(frame))
+    assert len(frames) == 1
+
+    frame_type, data = frames[0]
+    assert frame_type == 3
+
+    kind, sender, name, request_id, payload = EnvelopeUnpacker().unpack(data)
+    return kind, sender, name, request_id, bytes(payload)
+
+
+def test_event_round_trip():
+    frame = EnvelopePacker("node").pack("room.joined", b"payload")
+
+    assert unpack(frame) == (EVENT, "node", "room.joined", 0, b"payload")
+
+
+@pytest.mark.parametrize("kind", [REQUEST, RESPONSE, ERROR])
+def test_request_kinds_carry_request_id(kind):
+    frame = EnvelopePacker("node").pack("rpc", b"data", kind, 2 ** 40)
+
+    assert unpack(frame) == (kind, "node", "rpc", 2 ** 40, b"data")
+
+
+def test_event_by_id():
+    frame = EnvelopePacker("node").pack_id(7, b"data", REQUEST, 5)
+
+    assert unpack(frame) == (REQUEST, "node", 7, 5, b"data")
+
+
+def test_payload_is_not_copied():
+    payload = bytearray(b"x" * 1024)
+    frame = EnvelopePacker("node").pack("ev", payload)
+
+    # The payload is sent as its own buffer, viewing the caller's data
+    assert len(frame) == 2
+    assert frame[1].obj is payload
+    assert frame_length(frame) == len(frame[0]) + 1024
+
+
+def test_unicode_and_empty_fields():
+    frame = EnvelopePacker("nœud").pack("", b"")
+
+    assert unpack(frame) == (EVENT, "nœud", "", 0, b"")
+
+
+def test_frames_split_across_reads():
+    packer = EnvelopePacker("node")
+    stream = b"".join(b"".join(packer.pack("ev", bytes([i]) * i)) for i in range(1, 50))
+
+    reader = MsgNumReader()
+    unpacker = EnvelopeUnpacker()
+    received = []
+    for start in range(0, len(stream), 7):
+        for frame_type, data in reader.feed(stream[start:start + 7]):
+            received.append(bytes(unpacker.unpack(data)[4]))
+
+    assert received == [bytes([i]) * i for i in range(1, 50)]
+    assert reader.pending == 0
+
+
+def test_frames_over_the_size_limit_are_refused():
+    reader = MsgNumReader(max_frame_size=16)
+
+    assert reader.feed(MsgNum.dumps(2, b"x" * 16)) == [(2, b"x" * 16)]
+
+    # A header claiming a huge payload fails before anything is allocated,
+    # whether it arrives whole or in pieces
+    header = MsgNum.header(2, 1 << 62)
+    with pytest.raises(FrameTooLarge):
+        reader.feed(header)
+
+    reader = MsgNumReader(max_frame_size=16)
+    reader.feed(header[:3])
+    with pytest.raises(FrameTooLarge):
+        reader.feed(header[3:])
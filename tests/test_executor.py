@@ -0,0 +1,47 @@
+"""
+    Tests for running handlers in threads and processes.
+"""
+
+import pytest
+
+from pydevts.executor import HandlerExecutor
+
+
+pytestmark = pytest.mark.anyio
+
+
+# A view a handler keeps of its payload
+KEPT = None
+
+
+def keep_view(sender: str, data: memoryview) -> tuple[str, bytes, int]:
+    global KEPT
+    KEPT = data[:10]
+    return sender, bytes(KEPT), len(data)
+
+
+def summarize(sender: str, data: bytes) -> tuple[str, str, int]:
+    return sender, type(data).__name__, len(data)
+
+
+@pytest.fixture
+def executor():
+    executor = HandlerExecutor(max_processes=1, shm_threshold=1024)
+    yield executor
+    executor.shutdown()
+
+
+async def test_process_payloads_by_size(executor):
+    # Small payloads are pickled, large ones handed over in shared memory
+    assert await executor.run_process(summarize, "a", b"x" * 100) == ("a", "bytes", 100)
+    assert await executor.run_process(summarize, "a", b"x" * 4096) == ("a", "memoryview", 4096)
+
+
+async def test_shared_memory_view_kept_by_handler(executor, capfd):
+    data = bytes(range(256)) * 64
+
+    assert await executor.run_process(keep_view, "a", data) == ("a", data[:10], len(data))
+
+    # The worker is still usable, and did not complain about the kept view
+    assert await executor.run_process(keep_view, "b", data) == ("b", data[:10], len(data))
+    assert "Exception ignored" not in capfd.readouterr().err
@@ -0,0 +1,121 @@
+"""
+    Tests for the gossip router.
+"""
+
+import functools
+
+import anyio
+import pytest
+
+from pydevts.pub import Node
+from pydevts.routing import GossipRouter, EmitResult
+from pydevts.proto import TCPProto
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def run_cluster(count: int, emits: int, **kwargs) -> tuple[list[Node], dict]:
+    """Starts a cluster of gossiping nodes, has the first emit, and counts deliveries
+    """
+
+    nodes = [Node(host="127.0.0.1", router=functools.partial(GossipRouter, **kwargs)) for _ in range(count)]
+    got = {id(node): 0 for node in nodes}
+
+    for node in nodes:
+        @node.on("ev")
+        async def handler(sender, data, node=node):
+            got[id(node)] += 1
+
+    async with anyio.create_task_group() as tg:
+        port = 1
+        for node in nodes:
+            await node.connect("127.0.0.1", port)
+            await tg.start(node.run)
+            port = nodes[0].addr[1]
+
+        with anyio.fail_after(5):
+            while any(len(node.router.peers) < count - 1 for node in nodes):
+                await anyio.sleep(0.01)
+
+        for _ in range(emits):
+            await nodes[0].emit("ev", b"x")
+
+        with anyio.fail_after(5):
+            while sum(got.values()) < count * emits:
+                await anyio.sleep(0.01)
+
+        # Give duplicates time to arrive
+        await anyio.sleep(0.1)
+        tg.cancel_scope.cancel()
+
+    return nodes, got
+
+
+async def test_small_clusters_emit_directly():
+    nodes, got = await run_cluster(3, 5)
+
+    assert set(got.values()) == {5}
+    assert all(not node.router._seen for node in nodes[1:])
+
+
+async def test_gossip_reaches_every_node_once():
+    nodes, got = await run_cluster(5, 5, min_gossip_nodes=0)
+
+    assert set(got.values()) == {5}
+    assert all(len(node.router._seen) == 5 for node in nodes)
+
+
+async def test_fanout_leaves_out_the_sender():
+    router = GossipRouter(TCPProto, fanout=10)
+    router.node_id = "self"
+    router.peers = {peer: ("127.0.0.1", 1) for peer in "abc"}
+    router.peers_catch_all = set(router.peers)
+    chosen = []
+
+    async def send_to_peers(peers, data, overrides=None, on_delivered=None):
+        chosen.append(set(peers))
+        return EmitResult()
+
+    router._send_to_peers = send_to_peers
+
+    await router._gossip(b"1" * 16, 3, [b""], "ev")
+    await router._gossip(b"2" * 16, 3, [b""], "ev", have_it=("a",))
+
+    assert chosen == [{"a", "b", "c"}, {"b", "c"}]
+
+
+async def test_gossip_skips_nodes_without_handlers():
+    nodes = [Node(host="127.0.0.1", router=functools.partial(GossipRouter, min_gossip_nodes=0)) for _ in range(5)]
+    got = []
+
+    # Only the last two nodes handle the event
+    for node in nodes[3:]:
+        @node.on("ev")
+        async def handler(sender, data, node=node):
+            got.append(node)
+
+    async with anyio.create_task_group() as tg:
+        port = 1
+        for node in nodes:
+            await node.connect("127.0.0.1", port)
+            await tg.start(node.run)
+            port = nodes[0].addr[1]
+
+        with anyio.fail_after(5):
+            while any(len(node.router.peers) < 4 for node in nodes) or \
+                    not all(node.router.handles(peer.router.node_id, "ev") for node in nodes[:3] for peer in nodes[3:]):
+                await anyio.sleep(0.01)
+
+        await nodes[0].emit("ev", b"x")
+
+        with anyio.fail_after(5):
+            while len(got) < 2:
+                await anyio.sleep(0.01)
+
+        await anyio.sleep(0.1)
+        tg.cancel_scope.cancel()
+
+    # The emitter does not deliver to itself, and the broadcast never passes through nodes without handlers
+    assert sorted(map(id, got)) == sorted(map(id, nodes[3:]))
+    assert all(not node.router._seen for node in nodes[1:3])
@@ -0,0 +1,76 @@
+"""
+    Tests for the metrics nodes report.
+"""
+
+import re
+
+import anyio
+import pytest
+
+from pydevts.pub import Node
+from pydevts.proto import TCPProto
+from pydevts.routing import PeerRouter
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_event_labels_are_bounded():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+    handled = []
+
+    @a.on("known")
+    async def known(sender, data):
+        handled.append("known")
+
+    @a.on("room.*")
+    async def room(sender, data):
+        handled.append("room")
+
+    @a.on_default()
+    async def default(sender, name, data):
+        handled.append("default")
+
+    names = ["known", "room.1", "room.2", *(f"random.{i}" for i in range(20))]
+
+    async with anyio.create_task_group() as tg:
+        await a.connect("127.0.0.1", 1)
+        await tg.start(a.run)
+        await b.connect("127.0.0.1", a.addr[1])
+        await tg.start(b.run)
+
+        for name in names:
+            await b.send(a.router.node_id, name, b"x")
+
+        with anyio.fail_after(5):
+            while len(handled) < len(names):
+                await anyio.sleep(0.01)
+
+        tg.cancel_scope.cancel()
+
+    for node in (a, b):
+        labels = set(re.findall(r'event="([^"]*)"', node.metrics.export()))
+        assert labels <= {"known", "room.*", "other"}, labels
+
+    assert 'pydevts_handler_seconds_count{event="other"} 20' in a.metrics.export()
+
+
+async def test_messages_sent_are_counted_by_event_and_by_peer():
+    router = PeerRouter(TCPProto, probe_interval=None)
+    router.node_id = "a"
+    router.event_ids["known"] = 0
+
+    router._count_sent("known", 10, ["b", "c"])
+    router._count_sent("known", 5, ["b"])
+
+    # One series per event and one per peer, never one per pair
+    assert router._m_sent.samples() == {("known",): {"sum": 25, "count": 3}}
+    assert router._m_peer_sent.samples() == {
+        ("b",): {"sum": 15, "count": 2},
+        ("c",): {"sum": 10, "count": 1},
+    }
+
+    # A peer's series go when it does
+    router.peers["b"] = ("127.0.0.1", 1)
+    await router._remove_peer("b")
+    assert list(router._m_peer_sent.samples()) == [("c",)]
@@ -0,0 +1,253 @@
+"""
+    Tests for the connection cache.
+"""
+
+import anyio
+import pytest
+
+from pydevts.conn.multi import MultiClientCache
+from pydevts.pub import Node
+from pydevts.proto import TCPProto
+from pydevts.proto.tcp import TCPClient
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClient:
+    """
+        A client that counts its dials, and can be made to fail or take its time
+    """
+
+    dials = 0
+    fail = False
+    delay = 0.0
+
+    def __init__(self, addr: tuple[str, int]):
+        self.addr = addr
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "FakeClient":
+        cls.dials += 1
+        await anyio.sleep(cls.delay)
+        if cls.fail:
+            raise ConnectionRefusedError(f"Nothing listening on {host}:{port}")
+        return cls((host, port))
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client():
+    FakeClient.dials, FakeClient.fail, FakeClient.delay = 0, False, 0.0
+    return FakeClient
+
+
+async def test_concurrent_connects_share_one_dial(client):
+    client.delay = 0.05
+    cache = MultiClientCache(proto=(client, None, None))
+    handles = []
+
+    async def connect():
+        handles.append(await cache.connect("127.0.0.1", 1))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(10):
+            tg.start_soon(connect)
+
+    assert client.dials == 1
+    assert len(set(handles)) == 1
+    assert 'pydevts_connection_dials_total{outcome="coalesced"} 9' in cache.metrics.export()
+
+    # Later connects reuse the cached connection
+    assert await cache.connect("127.0.0.1", 1) == handles[0]
+    assert client.dials == 1
+
+
+async def test_waiters_share_a_failed_dial(client):
+    client.delay, client.fail = 0.05, True
+    cache = MultiClientCache(proto=(client, None, None))
+    errors = []
+
+    async def connect():
+        try:
+            await cache.connect("127.0.0.1", 1)
+        except ConnectionError as e:
+            errors.append(e)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(connect)
+
+    assert client.dials == 1
+    assert len(errors) == 5
+
+
+async def test_failed_addresses_back_off(client):
+    client.fail = True
+    cache = MultiClientCache(proto=(client, None, None), dial_backoff=0.05, max_dial_backoff=0.1)
+
+    with pytest.raises(ConnectionError):
+        await cache.connect("127.0.0.1", 1)
+
+    # Not redialed until the backoff has passed
+    with pytest.raises(ConnectionError, match="retrying"):
+        await cache.connect("127.0.0.1", 1)
+    assert client.dials == 1
+
+    await anyio.sleep(0.06)
+    with pytest.raises(ConnectionError):
+        await cache.connect("127.0.0.1", 1)
+    assert client.dials == 2
+
+    # The backoff doubled, up to the maximum
+    await anyio.sleep(0.06)
+    with pytest.raises(ConnectionError, match="retrying"):
+        await cache.connect("127.0.0.1", 1)
+
+    await anyio.sleep(0.05)
+    client.fail = False
+    await cache.connect("127.0.0.1", 1)
+    assert client.dials == 3
+
+    # Succeeding resets the backoff, and other addresses were never affected
+    assert not cache._failures
+    await cache.connect("127.0.0.1", 2)
+    assert client.dials == 4
+
+
+async def test_least_recently_used_is_evicted_at_capacity(client):
+    cache = MultiClientCache(proto=(client, None, None), max_size=2)
+
+    first = await cache.connect("127.0.0.1", 1)
+    second = await cache.connect("127.0.0.1", 2)
+    connections = {handle: cache._cache[handle][0] for handle in (first, second)}
+
+    # Using the first makes the second the least recently used
+    assert await cache.connect("127.0.0.1", 1) == first
+    third = await cache.connect("127.0.0.1", 3)
+
+    assert list(cache._cache) == [first, third]
+    assert connections[second].closed and not connections[first].closed
+    assert 'pydevts_connection_cache_evictions_total{reason="capacity"} 1' in cache.metrics.export()
+
+    # The evicted address is dialed again when next used
+    await cache.connect("127.0.0.1", 2)
+    assert client.dials == 4
+
+
+async def test_expired_connections_are_reaped(client):
+    cache = MultiClientCache(proto=(client, None, None), ttl=0.05)
+
+    handle = await cache.connect("127.0.0.1", 1)
+    connection = cache._cache[handle][0]
+
+    # Nothing has expired yet
+    await cache.clean()
+    assert handle in cache._cache
+
+    await anyio.sleep(0.06)
+    await cache.clean()
+
+    assert handle not in cache._cache
+    assert not cache._expiry
+    assert connection.closed
+    assert 'pydevts_connection_cache_evictions_total{reason="idle"} 1' in cache.metrics.export()
+
+
+async def test_used_connections_are_not_reaped_early(client):
+    cache = MultiClientCache(proto=(client, None, None), ttl=0.1)
+
+    handle = await cache.connect("127.0.0.1", 1)
+    await anyio.sleep(0.06)
+    assert await cache.connect("127.0.0.1", 1) == handle
+
+    # Its first expiry time has passed, but it was used since
+    await anyio.sleep(0.06)
+    await cache.clean()
+    assert handle in cache._cache
+    assert len(cache._expiry) == 1
+
+    # Left idle for the whole time to live, it goes
+    await anyio.sleep(0.06)
+    await cache.clean()
+    assert handle not in cache._cache
+
+
+# Ports that SlowClient takes its time dialing
+SLOW_TO = set()
+
+
+class SlowClient(TCPClient):
+    """Dials slowly, both before and after introducing itself
+    """
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "SlowClient":
+        client = await super().connect(host, port)
+        client.slow = port in SLOW_TO
+        if client.slow:
+            await anyio.sleep(0.05)
+        return client
+
+    async def send(self, data: bytes):
+        await super().send(data)
+        if self.slow:
+            self.slow = False
+            await anyio.sleep(0.05)
+
+
+async def test_simultaneous_dial_loses_nothing():
+    a, b = (Node(host="127.0.0.1", protocol=(SlowClient, *TCPProto[1:])) for _ in range(2))
+    got = {a: 0, b: 0}
+
+    for node in (a, b):
+        @node.on("ev")
+        async def handler(sender, data, node=node):
+            got[node] += 1
+
+    async with anyio.create_task_group() as tg:
+        await a.connect("127.0.0.1", 1)
+        await tg.start(a.run)
+        await b.connect("127.0.0.1", a.addr[1])
+        await tg.start(b.run)
+
+        # The lower ID dials slowly, so the higher ID's connection is
+        # adopted and sent over until the higher ID replaces it
+        low, high = sorted((a, b), key=lambda node: node.router.node_id)
+        SLOW_TO.add(high.addr[1])
+
+        for node in (a, b):
+            for handle, _ in node.router.connections.dialed():
+                await node.router.connections.disconnect(handle)
+        await anyio.sleep(0.05)
+
+        sent = {low: 0, high: 0}
+
+        async def send(node, peer):
+            await node.send(peer.router.node_id, "ev", b"x" * 4096)
+            sent[peer] += 1
+
+        async with anyio.create_task_group() as sends:
+            sends.start_soon(send, low, high)
+            await anyio.sleep(0.01)
+            sends.start_soon(send, high, low)
+
+            for _ in range(100):
+                await anyio.sleep(0.002)
+                sends.start_soon(send, low, high)
+
+        with anyio.move_on_after(2):
+            while got != sent:
+                await anyio.sleep(0.01)
+
+        # Both ends settle on one connection between them
+        assert len(a.router.connections.dialed()) + len(b.router.connections.dialed()) == 1
+
+        tg.cancel_scope.cancel()
+
+    SLOW_TO.clear()
+
+    assert got == sent
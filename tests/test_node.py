@@ -0,0 +1,249 @@
+"""
+    Tests for dispatching received events to Node handlers.
+"""
+
+from contextlib import asynccontextmanager
+
+import anyio
+import pytest
+
+from pydevts.err import NodeNotFound, RemoteError
+from pydevts.msg import MsgNum
+from pydevts.pub import Node
+
+
+pytestmark = pytest.mark.anyio
+
+
+@asynccontextmanager
+async def cluster(*nodes: Node):
+    """Runs nodes joined into one cluster, stopping them afterwards
+    """
+
+    async with anyio.create_task_group() as tg:
+        port = 1
+        for node in nodes:
+            await node.connect("127.0.0.1", port)
+            await tg.start(node.run)
+            port = nodes[0].addr[1]
+
+        with anyio.fail_after(5):
+            while any(len(node.router.peers) < len(nodes) - 1 for node in nodes):
+                await anyio.sleep(0.01)
+
+        yield
+
+        tg.cancel_scope.cancel()
+
+
+async def test_failing_handler_does_not_stop_the_others():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+    ran = []
+
+    @a.on("ev")
+    async def first(sender, data):
+        ran.append("first")
+        raise RuntimeError("boom")
+
+    @a.on("ev")
+    async def second(sender, data):
+        ran.append("second")
+
+    async with cluster(a, b):
+        await b.send(a.router.node_id, "ev", b"")
+
+        with anyio.fail_after(5):
+            while len(ran) < 2:
+                await anyio.sleep(0.01)
+
+    assert ran == ["first", "second"]
+    assert 'pydevts_handler_errors_total{event="ev"} 1' in a.metrics.export()
+
+
+async def test_ordered_events_stay_in_order():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+    seen = {}
+
+    @a.on("ev", key=lambda sender, data: bytes(data[:1]))
+    async def handler(sender, data):
+        # Later events of the fast key overtake those of the slow one
+        await anyio.sleep(0.01 if data[:1] == b"s" else 0)
+        seen.setdefault(bytes(data[:1]), []).append(int(bytes(data[1:])))
+
+    async with cluster(a, b):
+        for i in range(10):
+            await b.send(a.router.node_id, "ev", b"s%d" % i)
+            await b.send(a.router.node_id, "ev", b"f%d" % i)
+
+        with anyio.fail_after(5):
+            while sum(map(len, seen.values())) < 20:
+                await anyio.sleep(0.01)
+
+    assert seen == {b"s": list(range(10)), b"f": list(range(10))}
+
+
+async def test_handlers_waiting_on_requests_do_not_deadlock():
+    # Every slot is held by a handler waiting on a response, which arrives
+    # over the same connection as the events still waiting for a slot
+    a, b = Node(host="127.0.0.1", max_concurrency=1), Node(host="127.0.0.1")
+    answers = []
+
+    @a.on("work")
+    async def work(sender, data):
+        answers.append(bytes(await a.request(sender, "echo", data, timeout=5)))
+
+    @b.on("echo")
+    async def echo(sender, data):
+        return bytes(data)
+
+    async with cluster(a, b):
+        for i in range(3):
+            await b.send(a.router.node_id, "work", b"%d" % i)
+
+        with anyio.fail_after(5):
+            while len(answers) < 3:
+                await anyio.sleep(0.01)
+
+    assert answers == [b"0", b"1", b"2"]
+
+
+async def test_reading_waits_while_too_many_events_are_pending():
+    a, b = Node(host="127.0.0.1", max_concurrency=1, max_pending=2), Node(host="127.0.0.1")
+    release = anyio.Event()
+    handled = []
+
+    @a.on("work")
+    async def work(sender, data):
+        await release.wait()
+        handled.append(bytes(data))
+
+    async with cluster(a, b):
+        for i in range(10):
+            await b.send(a.router.node_id, "work", b"%d" % i)
+
+        # One is being handled and one waits for a slot, the rest are left unread
+        await anyio.sleep(0.2)
+        assert 'pydevts_handlers_pending 2' in a.metrics.export()
+        assert handled == []
+
+        release.set()
+        with anyio.fail_after(5):
+            while len(handled) < 10:
+                await anyio.sleep(0.01)
+
+    assert handled == [b"%d" % i for i in range(10)]
+    assert 'pydevts_handlers_pending 0' in a.metrics.export()
+
+
+async def test_unknown_event_ids_and_malformed_frames_are_dropped():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+    handled = []
+
+    @a.on("ev")
+    async def handler(sender, data):
+        handled.append(bytes(data))
+
+    async with cluster(a, b):
+        addr = b.router.peers[a.router.node_id]
+
+        # An event ID a never gave out, a frame compressed with an unknown
+        # codec, and a record that is not msgpack
+        await b.router._send_frame(addr, b.router._packer.pack_id(999, b"lost"))
+        await b.router._send_frame(addr, MsgNum.dumps(3 | 0x80, b"\xffjunk"))
+        await b.router._send_frame(addr, MsgNum.dumps(8, b"\xc1"))
+
+        # The connection, and the node, keep going
+        await b.send(a.router.node_id, "ev", b"after")
+
+        with anyio.fail_after(5):
+            while not handled:
+                await anyio.sleep(0.01)
+
+    assert handled == [b"after"]
+
+
+async def test_request_times_out():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+
+    @b.on("slow")
+    async def slow(sender, data):
+        await anyio.sleep(0.5)
+        return b"late"
+
+    @b.on("echo")
+    async def echo(sender, data):
+        return bytes(data)
+
+    async with cluster(a, b):
+        with pytest.raises(TimeoutError):
+            await a.request(b.router.node_id, "slow", b"", timeout=0.05)
+
+        # The late response is dropped, and later requests still get theirs
+        await anyio.sleep(0.5)
+        assert await a.request(b.router.node_id, "echo", b"x", timeout=5) == b"x"
+
+    export = a.metrics.export()
+    assert 'pydevts_requests_total{outcome="timeout"} 1' in export
+    assert 'pydevts_requests_total{outcome="ok"} 1' in export
+
+
+async def test_requests_fail_when_the_peer_leaves():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+
+    @b.on("stuck")
+    async def stuck(sender, data):
+        await anyio.sleep_forever()
+
+    async with cluster(a, b):
+        async def leave():
+            await anyio.sleep(0.1)
+            await a.router._remove_peer(b.router.node_id)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(leave)
+
+            with anyio.fail_after(5), pytest.raises(NodeNotFound):
+                await a.request(b.router.node_id, "stuck", b"", timeout=None)
+
+    assert 'pydevts_requests_total{outcome="peer_down"} 1' in a.metrics.export()
+
+
+async def test_request_to_failing_handler_raises_remote_error():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+
+    @b.on("fail")
+    async def fail(sender, data):
+        raise RuntimeError("boom")
+
+    async with cluster(a, b):
+        with pytest.raises(RemoteError, match="boom"):
+            await a.request(b.router.node_id, "fail", b"", timeout=5)
+
+    assert 'pydevts_requests_total{outcome="error"} 1' in a.metrics.export()
+
+
+async def test_request_for_unknown_event_raises_remote_error():
+    a, b = Node(host="127.0.0.1"), Node(host="127.0.0.1")
+
+    async with cluster(a, b):
+        with pytest.raises(RemoteError, match="EventNotFound"):
+            await a.request(b.router.node_id, "missing", b"", timeout=5)
+
+
+@pytest.mark.parametrize("views, kind", [(False, bytes), (True, memoryview)])
+async def test_handlers_get_bytes_unless_views_are_asked_for(views, kind):
+    a, b = Node(host="127.0.0.1", views=views), Node(host="127.0.0.1")
+    got = []
+
+    @a.on("ev")
+    async def handler(sender, data):
+        got.append((type(data), bytes(data)))
+
+    async with cluster(a, b):
+        await b.send(a.router.node_id, "ev", b"x" * 100)
+
+        with anyio.fail_after(5):
+            while not got:
+                await anyio.sleep(0.01)
+
+    assert got == [(kind, b"x" * 100)]
@@ -0,0 +1,63 @@
+"""
+    Tests for matching event names against wildcard patterns.
+"""
+
+import pytest
+
+from pydevts.patterns import PatternIndex, is_pattern
+
+
+def index(*patterns: str) -> PatternIndex:
+    built = PatternIndex()
+    for pattern in patterns:
+        built.add(pattern)
+    return built
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("orders.created", ("orders.*", "orders.**", "*.created")),
+    ("orders.eu.created", ("orders.**",)),
+    ("orders", ()),
+    ("users.created", ("*.created",)),
+    ("users.deleted", ()),
+])
+def test_match(name, expected):
+    assert index("orders.*", "orders.**", "*.created").match(name) == expected
+
+
+def test_matches_keep_registration_order():
+    assert index("**", "a.*", "*.b", "a.b").match("a.b") == ("**", "a.*", "*.b", "a.b")
+
+
+def test_values():
+    patterns = PatternIndex()
+    patterns.add("a.*", "first")
+    patterns.add("a.**", "second")
+
+    assert patterns.match("a.b") == ("first", "second")
+    assert patterns.match("a.b.c") == ("second",)
+
+
+def test_rest_only_at_the_end():
+    with pytest.raises(ValueError):
+        PatternIndex().add("a.**.b")
+
+
+def test_cache_is_bounded_and_updated():
+    patterns = PatternIndex(max_cache=2)
+    patterns.add("a.*")
+
+    for name in ("a.1", "a.2", "a.3"):
+        assert patterns.match(name) == ("a.*",)
+    assert len(patterns._cache) <= 2
+
+    # Adding a pattern changes what cached names match
+    patterns.add("*.3")
+    assert patterns.match("a.3") == ("a.*", "*.3")
+
+
+def test_is_pattern():
+    assert is_pattern("a.*")
+    assert is_pattern("**")
+    assert not is_pattern("a.b")
+    assert not is_pattern("a*.b")
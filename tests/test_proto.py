@@ -0,0 +1,204 @@
+"""
+    Tests for the local transports.
+"""
+
+from contextlib import asynccontextmanager
+import os
+import struct
+
+import anyio
+import pytest
+
+from pydevts.proto import shm, unix, AutoProto, ShmProto, UnixProto, TCPClient, UnixClient
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def socket_dir(tmp_path, monkeypatch):
+    """Keeps the sockets of each test to itself
+    """
+
+    path = tmp_path / "sockets"
+    monkeypatch.setattr(unix, "SOCKET_DIR", str(path))
+
+    return path
+
+
+@asynccontextmanager
+async def serving(server_cls, handler):
+    """Runs a server on a free port, stopping it afterwards
+    """
+
+    server = server_cls("127.0.0.1", 0, handler)
+
+    async with anyio.create_task_group() as tg:
+        yield await tg.start(server.run)
+
+        tg.cancel_scope.cancel()
+
+
+def echo_server() -> tuple:
+    """A handler echoing what it receives
+
+    Returns:
+        tuple: The handler, and a list with an entry for each connection that has ended
+    """
+
+    ended = []
+
+    async def echo(conn):
+        try:
+            while True:
+                data = await conn.recv()
+                await conn.send(bytes(data))
+        finally:
+            ended.append(conn)
+
+    return echo, ended
+
+
+async def wait_for(condition):
+    with anyio.fail_after(5):
+        while not condition():
+            await anyio.sleep(0.01)
+
+
+async def read(conn, size: int) -> bytes:
+    """Receives exactly size bytes
+    """
+
+    data = b""
+    with anyio.fail_after(5):
+        while len(data) < size:
+            data += bytes(await conn.recv())
+
+    return data
+
+
+async def test_socket_dir_must_be_private(socket_dir):
+    # Created for us, only we can use it
+    unix.check_socket_dir(create=True)
+    assert os.stat(socket_dir).st_mode & 0o777 == 0o700
+
+    # A directory others can write to could hold sockets impersonating nodes
+    os.chmod(socket_dir, 0o777)
+    with pytest.raises(PermissionError):
+        unix.check_socket_dir()
+
+    # As could a link to one
+    os.rmdir(socket_dir)
+    os.symlink(socket_dir.parent, socket_dir)
+    with pytest.raises(PermissionError):
+        unix.check_socket_dir()
+
+
+@pytest.mark.parametrize("proto", [UnixProto, AutoProto, ShmProto], ids=["unix", "auto", "shm"])
+async def test_round_trip(socket_dir, proto):
+    client_cls, _, server_cls = proto
+    echo, ended = echo_server()
+
+    async with serving(server_cls, echo) as port:
+        client = await client_cls.connect("127.0.0.1", port)
+
+        await client.send(b"hello")
+        await client.send_many([b" ", b"world"])
+        assert await read(client, 11) == b"hello world"
+
+        await client.close()
+        await wait_for(lambda: ended)
+
+
+@pytest.mark.parametrize("proto", [UnixProto, AutoProto, ShmProto], ids=["unix", "auto", "shm"])
+async def test_data_sent_before_closing_arrives(socket_dir, proto):
+    client_cls, _, server_cls = proto
+    received = []
+    ended = anyio.Event()
+
+    async def collect(conn):
+        try:
+            while True:
+                received.append(bytes(await conn.recv()))
+        finally:
+            ended.set()
+
+    async with serving(server_cls, collect) as port:
+        client = await client_cls.connect("127.0.0.1", port)
+        await client.send(b"x" * 1000)
+        await client.close()
+
+        # The server reads everything, then sees the connection end
+        with anyio.fail_after(5):
+            await ended.wait()
+
+    assert b"".join(received) == b"x" * 1000
+
+
+async def test_auto_client_uses_unix_sockets_only_in_a_private_dir(socket_dir):
+    client_cls, _, server_cls = AutoProto
+    echo, ended = echo_server()
+
+    async with serving(server_cls, echo) as port:
+        client = await client_cls.connect("127.0.0.1", port)
+        assert isinstance(client, UnixClient)
+        await client.close()
+
+        # Anyone could have put a socket there, so it is not trusted
+        os.chmod(socket_dir, 0o777)
+        client = await client_cls.connect("127.0.0.1", port)
+        assert isinstance(client, TCPClient)
+        await client.close()
+
+        await wait_for(lambda: len(ended) == 2)
+
+
+@pytest.mark.parametrize("ordered", [True, False], ids=["ordered", "unordered"])
+async def test_shm_wraps_around_a_small_ring(socket_dir, monkeypatch, ordered):
+    monkeypatch.setattr(shm, "RING_SIZE", 100)
+
+    # Where stores may be seen out of order, positions only come over the socket
+    monkeypatch.setattr(shm, "_ORDERED", ordered)
+    client_cls, _, server_cls = ShmProto
+    echo, ended = echo_server()
+
+    # Messages that do not divide the ring, and one that does not fit in it
+    messages = [bytes([i]) * 37 for i in range(10)] + [bytes(range(256)) * 4]
+    sent = b"".join(messages)
+
+    async with serving(server_cls, echo) as port:
+        client = await client_cls.connect("127.0.0.1", port)
+
+        async def send_all():
+            for message in messages:
+                await client.send(message)
+
+        # Echoing fills both rings, so send and receive at once
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(send_all)
+            assert await read(client, len(sent)) == sent
+
+        await client.close()
+        await wait_for(lambda: ended)
+
+
+async def test_shm_refuses_rings_smaller_than_claimed(socket_dir):
+    _, _, server_cls = ShmProto
+    echo, _ = echo_server()
+
+    async with serving(server_cls, echo) as port:
+        rings = [shm._Ring.create(4096), shm._Ring.create(4096)]
+        names = [ring.shm.name.encode() for ring in rings]
+
+        try:
+            sock = await anyio.connect_unix(unix.socket_path(port))
+            async with sock:
+                # Claiming more than was mapped would let the server write past it
+                await sock.send(struct.pack("!QHH", 1 << 20, *map(len, names)) + b"".join(names))
+
+                with anyio.fail_after(5):
+                    assert await sock.receive(1) == b"\0"
+        finally:
+            for ring in rings:
+                ring.unlink()
+                ring.close()
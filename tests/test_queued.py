@@ -0,0 +1,215 @@
+"""
+    Tests for the per-connection outbound queue.
+"""
+
+import anyio
+import pytest
+
+from pydevts.conn.queued import QueuedConn, BLOCK, DROP_NEWEST, DROP_OLDEST, DISCONNECT
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConn:
+    """
+        A connection that records writes, and can be made to fail or stall
+    """
+
+    addr = ("127.0.0.1", 0)
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.writes = []
+        self.release = anyio.Event()
+        self.stall = False
+        self.closed = False
+
+    async def send_many(self, buffers: list[bytes]):
+        if self.stall:
+            await self.release.wait()
+        if self.fail:
+            raise ConnectionResetError("peer went away")
+        self.writes.append(b"".join(buffers))
+
+    async def send(self, data: bytes):
+        await self.send_many([data])
+
+    async def close(self):
+        self.closed = True
+
+
+async def test_writer_failure_reports_queued_messages():
+    wraps = FakeConn()
+    wraps.stall = True
+    dropped = []
+    conn = QueuedConn(wraps, on_drop=dropped.append)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+
+        # One message is being written when the connection fails, two wait behind it
+        await conn.send(b"a")
+        await anyio.sleep(0)
+        await conn.send(b"b")
+        await conn.send(b"c")
+
+        wraps.fail = True
+        wraps.release.set()
+
+    assert dropped == [3]
+    assert conn.pending == 0
+
+    with pytest.raises(ConnectionError):
+        await conn.send(b"d")
+
+
+async def test_batches_queued_messages_into_one_write():
+    wraps = FakeConn()
+    wraps.stall = True
+    conn = QueuedConn(wraps)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+
+        # The first write stalls, and everything sent meanwhile is coalesced
+        await conn.send(b"a")
+        await anyio.sleep(0.01)
+        for data in (b"b", b"c", b"d"):
+            await conn.send(data)
+
+        wraps.stall = False
+        wraps.release.set()
+        await conn.close()
+
+    assert wraps.writes == [b"a", b"bcd"]
+    assert wraps.closed
+
+
+def full_conn(policy: str, dropped: list) -> tuple[FakeConn, QueuedConn]:
+    """A queue that holds two four-byte messages, behind a stalled write
+    """
+
+    wraps = FakeConn()
+    wraps.stall = True
+    return wraps, QueuedConn(wraps, max_pending=8, policy=policy, on_drop=dropped.append)
+
+
+async def fill(conn: QueuedConn):
+    await conn.send(b"0000")
+    await anyio.sleep(0.01)
+    await conn.send(b"1111")
+    await conn.send(b"2222")
+
+
+async def test_drop_newest_policy():
+    dropped = []
+    wraps, conn = full_conn(DROP_NEWEST, dropped)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+        await fill(conn)
+
+        await conn.send(b"3333")
+        assert dropped == [1]
+
+        wraps.stall = False
+        wraps.release.set()
+        await conn.close()
+
+    assert wraps.writes == [b"0000", b"11112222"]
+
+
+async def test_drop_oldest_policy():
+    dropped = []
+    wraps, conn = full_conn(DROP_OLDEST, dropped)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+        await fill(conn)
+
+        await conn.send(b"3333")
+        assert dropped == [1]
+
+        wraps.stall = False
+        wraps.release.set()
+        await conn.close()
+
+    assert wraps.writes == [b"0000", b"22223333"]
+
+
+async def test_disconnect_policy():
+    dropped = []
+    wraps, conn = full_conn(DISCONNECT, dropped)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+        await fill(conn)
+
+        with pytest.raises(ConnectionError):
+            await conn.send(b"3333")
+        assert dropped == [2]
+        assert conn.pending == 0
+
+        # The writer has nothing left to write
+        tg.cancel_scope.cancel()
+
+    with pytest.raises(ConnectionError):
+        await conn.send(b"4444")
+
+
+async def test_block_policy_waits_for_room():
+    dropped = []
+    wraps, conn = full_conn(BLOCK, dropped)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+        await fill(conn)
+
+        assert not conn.fits(4)
+        with anyio.move_on_after(0.05) as scope:
+            await conn.send(b"3333")
+        assert scope.cancel_called
+
+        # Once the stalled write finishes, the queue drains and there is room
+        wraps.stall = False
+        wraps.release.set()
+        with anyio.fail_after(1):
+            await conn.send(b"3333")
+        await conn.close()
+
+    assert dropped == []
+    assert b"".join(wraps.writes) == b"0000111122223333"
+
+
+async def test_high_water_is_reported_once_until_drained():
+    wraps = FakeConn()
+    wraps.stall = True
+    reports = []
+
+    async def on_high_water(conn):
+        reports.append(conn.pending)
+
+    conn = QueuedConn(wraps, high_water=6, on_high_water=on_high_water)
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(conn.run)
+        await fill(conn)
+        await conn.send(b"3333")
+        assert reports == [8]
+
+        wraps.stall = False
+        wraps.release.set()
+        await anyio.sleep(0.01)
+
+        # Drained below half of the mark, so going over again is reported
+        await fill(conn)
+        await conn.send(b"4444")
+        await conn.close()
+
+    assert len(reports) == 2
+
+
+async def test_unknown_policy():
+    with pytest.raises(ValueError):
+        QueuedConn(FakeConn(), policy="spill")
@@ -0,0 +1,130 @@
+"""
+    Tests for SWIM failure detection.
+"""
+
+import anyio
+import msgpack
+import pytest
+
+from pydevts.msg import MsgNum
+from pydevts.proto import TCPProto
+from pydevts.routing import PeerRouter
+from pydevts.routing.swim import ALIVE, SUSPECT, DEAD
+
+
+pytestmark = pytest.mark.anyio
+
+
+def router(node_id: str, port: int) -> PeerRouter:
+    """Builds a router that has joined, with nothing on the network
+    """
+
+    router = PeerRouter(TCPProto, probe_interval=0.2, probe_timeout=0.05, suspect_timeout=0.1, tombstone_timeout=0.1)
+    router.node_id = node_id
+    router.host_addr = ("127.0.0.1", port)
+
+    return router
+
+
+def connect(*routers: PeerRouter, cut: set = frozenset()) -> list:
+    """Makes the routers peers, delivering probes straight to the receiver
+
+    Args:
+        cut (set, optional): Pairs of ports that can not reach each other, in that direction. Defaults to none.
+
+    Returns:
+        list: The system events each router reports, as (node ID, event, *args)
+    """
+
+    by_port = {router.host_addr[1]: router for router in routers}
+    events = []
+
+    for router in routers:
+        for peer in routers:
+            if peer is not router:
+                router.peers[peer.node_id] = peer.host_addr
+
+        async def send_frame(addr, frame, router=router):
+            if (router.host_addr[1], addr[1]) in cut:
+                raise ConnectionRefusedError("Unreachable")
+
+            data_type, data = MsgNum.loads(frame)
+            await by_port[addr[1]].failure_detector.on_frame(data_type, msgpack.unpackb(data))
+
+        async def sys_handler(name, *args, router=router):
+            events.append((router.node_id, name, *args))
+
+        router._send_frame = send_frame
+        router.sys_handler = sys_handler
+
+    return events
+
+
+async def test_unresponsive_peers_are_suspected_then_removed():
+    a, b = router("a", 1), router("b", 2)
+    events = connect(a, b, cut={(1, 2)})
+    swim = a.failure_detector
+
+    await swim._probe("b")
+    assert swim.members["b"][0] == SUSPECT
+    assert ("a", "peer_suspect", "b") in events
+
+    # Not removed until the suspicion times out
+    await swim._expire()
+    assert "b" in a.peers
+
+    await anyio.sleep(0.11)
+    await swim._expire()
+    assert "b" not in a.peers
+    assert swim.members["b"][0] == DEAD
+    assert ("a", "peer_down", "b") in events
+
+    # Dead peers are forgotten in time
+    await anyio.sleep(0.11)
+    await swim._expire()
+    assert "b" not in swim.members
+
+
+async def test_suspected_peers_refute():
+    a, b = router("a", 1), router("b", 2)
+    connect(a, b)
+
+    await a.failure_detector.suspect("b")
+
+    # The suspicion reaches b with the next probe, and b answers with a newer incarnation
+    await a.failure_detector._probe("b")
+    assert b.failure_detector.incarnation == 1
+    assert a.failure_detector.members["b"][:2] == [ALIVE, 1]
+
+    await anyio.sleep(0.11)
+    await a.failure_detector._expire()
+    assert "b" in a.peers
+
+
+async def test_indirect_probes_reach_peers_we_can_not():
+    a, b, c = router("a", 1), router("b", 2), router("c", 3)
+    connect(a, b, c, cut={(1, 2)})
+
+    async with anyio.create_task_group() as tg:
+        c.failure_detector._tg = tg
+
+        # a can not reach b, but c pings it on a's behalf
+        await a.failure_detector._probe("b")
+
+    assert a.failure_detector.members.get("b", [ALIVE])[0] == ALIVE
+    assert "b" in a.peers
+
+
+async def test_dead_peers_are_not_brought_back_by_stale_updates():
+    a, b = router("a", 1), router("b", 2)
+    connect(a, b)
+
+    await a.failure_detector._declare_dead("b", 0)
+
+    # An update still being spread about the old incarnation changes nothing
+    await a.failure_detector._apply([("b", ALIVE, 0, ("127.0.0.1", 2))])
+    assert "b" not in a.peers
+
+    # A newer incarnation does
+    await a.failure_detector._apply([("b", ALIVE, 1, ("127.0.0.1", 2))])
+    assert "b" in a.peers
@@ -0,0 +1,155 @@
+"""
+    Tests for merging and syncing membership records.
+"""
+
+import anyio
+import msgpack
+import pytest
+
+from pydevts.msg import MsgNum
+from pydevts.proto import TCPProto
+from pydevts.routing import PeerRouter
+
+
+pytestmark = pytest.mark.anyio
+
+
+def router(node_id: str, port: int) -> PeerRouter:
+    """Builds a router that has joined, with nothing on the network
+    """
+
+    router = PeerRouter(TCPProto, probe_interval=None)
+    router.node_id = node_id
+    router.host_addr = ("127.0.0.1", port)
+    router.membership.set_version(node_id, router.version)
+
+    return router
+
+
+def record(node_id: str, version: int, event_ids: dict = None, catch_all: bool = False, patterns: list = ()) -> list:
+    return [node_id, version, ["127.0.0.1", 1000 + version], [], event_ids or {}, catch_all, list(patterns)]
+
+
+async def test_merge_keeps_the_newest_record():
+    a = router("a", 1)
+
+    await a._merge(record("b", 1, {"old": 0}))
+    assert a.peers["b"] == ("127.0.0.1", 1001)
+    assert a.handles("b", "old")
+
+    await a._merge(record("b", 3, {"new": 0}, patterns=["room.*"]))
+    assert a.handles("b", "new") and a.handles("b", "room.1")
+    assert not a.handles("b", "old")
+
+    # Older and repeated versions change nothing
+    await a._merge(record("b", 2, {"old": 0}, catch_all=True))
+    await a._merge(record("b", 3, {"old": 0}))
+    assert not a.handles("b", "old")
+    assert a.membership.versions["b"] == 3
+
+    # The address we know a peer by is kept
+    assert a.peers["b"] == ("127.0.0.1", 1001)
+
+    # Our own record is ours to change
+    await a._merge(record("a", 10))
+    assert "a" not in a.peers
+
+
+async def test_removed_members_need_a_newer_record():
+    a = router("a", 1)
+    await a._merge(record("b", 2))
+
+    await a._remove_peer("b")
+    assert "b" not in a.peers and "b" not in a.membership.versions
+
+    # A stale record, such as one still being gossiped, does not bring it back
+    await a._merge(record("b", 2))
+    assert "b" not in a.peers
+
+    await a._merge(record("b", 3))
+    assert "b" in a.peers
+
+
+def connect(*routers: PeerRouter):
+    """Delivers frames the routers send each other straight to the receiver
+    """
+
+    by_port = {router.host_addr[1]: router for router in routers}
+
+    for router in routers:
+        async def send_frame(addr, frame):
+            data_type, data = MsgNum.loads(frame)
+            await by_port[addr[1]].membership.on_frame(data_type, msgpack.unpackb(data))
+
+        router._send_frame = send_frame
+
+
+async def test_sync_exchanges_only_what_differs():
+    a, b = router("a", 1), router("b", 2)
+    await a._merge(b._record("b"))
+    await b._merge(a._record("a"))
+
+    # Each knows members the other does not, and one the other has an older record of
+    for node_id in ("c", "d"):
+        await a._merge(record(node_id, 1))
+    for node_id in ("e", "f"):
+        await b._merge(record(node_id, 1))
+    await a._merge(record("g", 1))
+    await b._merge(record("g", 4, {"ev": 0}))
+
+    connect(a, b)
+    await a.membership.sync("b")
+
+    assert a.membership.versions == b.membership.versions
+    assert a.membership._digest == b.membership._digest
+    assert set(a.peers) == {"b", "c", "d", "e", "f", "g"}
+    assert set(b.peers) == {"a", "c", "d", "e", "f", "g"}
+    assert a.handles("g", "ev")
+
+    # Once in sync, nothing but digests is exchanged
+    sent = a._m_sync_records.get() + b._m_sync_records.get()
+    await a.membership.sync("b")
+    assert a._m_sync_records.get() + b._m_sync_records.get() == sent
+    assert 'pydevts_membership_syncs_total{outcome="in_sync"} 1' in b.metrics.export()
+
+
+async def test_tombstones_spread_and_keep_removed_members_out():
+    a, stale, new = router("a", 1), router("s", 2), router("n", 3)
+    for x, y in ((a, stale), (a, new), (stale, new)):
+        await x._merge(y._record(y.node_id))
+        await y._merge(x._record(x.node_id))
+
+    await a._merge(record("c", 2))
+    await stale._merge(record("c", 2))
+
+    # Only a has heard that c is gone
+    await a._remove_peer("c")
+    connect(a, stale, new)
+
+    # The new node learns of it from a, so a stale record is refused
+    await new.membership.sync("a")
+    assert new.membership.is_stale("c", 2)
+    await new.membership.sync("s")
+    assert "c" not in new.peers
+
+    # And the stale node catches up, removing c
+    assert "c" not in stale.peers
+    assert stale.membership.is_stale("c", 2)
+    assert a.membership._digest == stale.membership._digest == new.membership._digest
+
+
+async def test_tombstones_are_forgotten():
+    a = router("a", 1)
+    a.membership.departed_timeout = 0.05
+    digest = dict(a.membership._digest)
+
+    await a._merge(record("c", 2))
+    await a._remove_peer("c")
+    assert a.membership.is_stale("c", 2)
+
+    await anyio.sleep(0.06)
+    a.membership.expire()
+
+    assert not a.membership._departed
+    assert a.membership._digest == digest
+    assert not a.membership.is_stale("c", 2)